@@ -0,0 +1,219 @@
+"""
+Compact per-user activity for streaks and the year heatmap.
+
+Each (user, year) pair is one `user_activity` row whose `days` column packs
+366 little-endian uint16 counters - one per day of the year - into 732 bytes.
+A day's counter is the number of tasks completed (by due date) plus work
+pomodoros finished that day. `toggle_task`, `update_task` and
+`create_pomodoro` adjust the counter incrementally in their own transaction.
+
+Streaks are computed bit-parallel: the counters become one big integer with a
+bit per active day, the current streak is the run of trailing ones and the
+longest streak is the number of `x &= x >> 1` steps until `x` is zero.
+
+Activity is a log of effort: deleting a task does not rewrite past days.
+`rebuild()` recomputes everything from the raw (hot and archived) tables.
+
+Usage:
+    python activity.py rebuild               # all users
+    python activity.py rebuild --user-id 42
+"""
+import argparse
+import logging
+from array import array
+from datetime import date, timedelta
+
+from sqlalchemy import MetaData, create_engine, func, inspect, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+import analytics
+import archive
+from db_url import database_url_from_env
+
+logger = logging.getLogger(__name__)
+
+DAYS_PER_ROW = 366
+
+
+def _counters(blob=None):
+    counters = array('H')
+    if blob:
+        counters.frombytes(blob)
+    if len(counters) < DAYS_PER_ROW:
+        counters.extend([0] * (DAYS_PER_ROW - len(counters)))
+    return counters
+
+
+def _day_index(day):
+    return day.timetuple().tm_yday - 1
+
+
+def _dialect(session):
+    # Accepts an ORM session or a plain Connection (as used by the CLI)
+    return session.dialect.name if hasattr(session, 'dialect') else session.get_bind().dialect.name
+
+
+def record(session, table, user_id, day, delta=1):
+    """Add `delta` to the user's counter for `day` inside the caller's transaction"""
+    key = {'user_id': user_id, 'year': day.year}
+    query = select(table.c.days).where(table.c.user_id == user_id, table.c.year == day.year)
+    dialect = _dialect(session)
+    if dialect == 'postgresql':
+        query = query.with_for_update()
+    blob = session.execute(query).scalar()
+    if blob is None:
+        # First activity of the year: create an empty row unless a concurrent request just
+        # did (it waits for that one to commit), then update it like any other
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        session.execute(insert(table).values(days=_counters().tobytes(), **key)
+                        .on_conflict_do_nothing(index_elements=['user_id', 'year']))
+        blob = session.execute(query).scalar()
+    counters = _counters(blob)
+    index = _day_index(day)
+    counters[index] = max(0, min(0xFFFF, counters[index] + delta))
+    session.execute(table.update().where(
+        table.c.user_id == user_id, table.c.year == day.year
+    ).values(days=counters.tobytes()))
+
+
+def move(session, table, user_id, before, after):
+    """A task's completion moved from day `before` to day `after` (None: not counted)"""
+    if before == after:
+        return
+    if before is not None:
+        record(session, table, user_id, before, -1)
+    if after is not None:
+        record(session, table, user_id, after)
+
+
+def load(session, table, user_id, pending=()):
+    """{year: counters} for every year the user has activity in, plus `pending` days not written yet"""
+    rows = session.execute(
+        select(table.c.year, table.c.days).where(table.c.user_id == user_id)
+    ).all()
+    years = {year: _counters(blob) for year, blob in rows}
+    for day in pending:
+        counters = years.setdefault(day.year, _counters())
+        counters[_day_index(day)] = min(0xFFFF, counters[_day_index(day)] + 1)
+    return years
+
+
+def daily_counts(years, start, end):
+    """Per-day counts for [start, end] out of the per-year counters"""
+    counts = []
+    for year in range(start.year, end.year + 1):
+        counters = years.get(year)
+        first = start if year == start.year else date(year, 1, 1)
+        last = end if year == end.year else date(year, 12, 31)
+        if counters is None:
+            counts.extend([0] * ((last - first).days + 1))
+        else:
+            counts.extend(counters[_day_index(first):_day_index(last) + 1])
+    return counts
+
+
+def activity_bits(counts):
+    """Big integer with bit i set when counts[i] > 0 (bit 0 is the first day)"""
+    return int(''.join('1' if count else '0' for count in reversed(counts)) or '0', 2)
+
+
+def longest_run(bits):
+    run = 0
+    while bits:
+        bits &= bits >> 1
+        run += 1
+    return run
+
+
+def trailing_run(bits):
+    """Length of the run of ones ending at the highest day, given bits reversed so it is bit 0"""
+    return (bits ^ (bits + 1)).bit_length() - 1
+
+
+def streaks(session, table, user_id, today=None, pending=()):
+    today = today or date.today()
+    years = load(session, table, user_id, pending)
+    if not years:
+        return {'current': 0, 'longest': 0, 'today_active': False}
+    # Activity can be recorded ahead (tasks completed early, by due date): count up to today
+    start = min(date(min(years), 1, 1), today)
+    counts = daily_counts(years, start, today)
+    bits = activity_bits(counts)
+    # Reverse the day order so today is bit 0 and the current run is the trailing ones
+    recent_first = activity_bits(counts[::-1])
+    today_active = bool(counts[-1])
+    # A streak is still alive if yesterday was active and today has nothing yet
+    current = trailing_run(recent_first if today_active else recent_first >> 1)
+    return {'current': current, 'longest': longest_run(bits), 'today_active': today_active}
+
+
+def heatmap(session, table, user_id, days=365, today=None, pending=()):
+    today = today or date.today()
+    start = today - timedelta(days=days - 1)
+    counts = daily_counts(load(session, table, user_id, pending), start, today)
+    return {'start': start.isoformat(), 'end': today.isoformat(), 'counts': counts}
+
+
+def rebuild(session, activity_table, tables, user_id=None):
+    """Recompute activity rows from tasks and pomodoro sessions (hot and archived)"""
+    task, pomodoro_session, task_archive, session_archive = tables
+    dialect = _dialect(session)
+    tasks = archive.tiered(task, task_archive, True)
+    sessions = archive.tiered(pomodoro_session, session_archive, True)
+
+    task_day = analytics.bucket_expression(dialect, tasks.c.due_date, 'day').label('day')
+    task_query = select(tasks.c.user_id, task_day, func.count()).where(
+        tasks.c.completed == True,  # noqa: E712
+        or_(tasks.c.is_recurring == False, tasks.c.is_recurring.is_(None))  # noqa: E712
+    ).group_by(tasks.c.user_id, task_day)
+    session_day = analytics.bucket_expression(dialect, sessions.c.completed_at, 'day').label('day')
+    session_query = select(sessions.c.user_id, session_day, func.count()).where(
+        sessions.c.type == 'work'
+    ).group_by(sessions.c.user_id, session_day)
+    if user_id is not None:
+        task_query = task_query.where(tasks.c.user_id == user_id)
+        session_query = session_query.where(sessions.c.user_id == user_id)
+
+    rows = {}
+    for query in (task_query, session_query):
+        for uid, day, count in session.execute(query):
+            day = analytics.as_date(day)
+            counters = rows.setdefault((uid, day.year), _counters())
+            index = _day_index(day)
+            counters[index] = min(0xFFFF, counters[index] + count)
+
+    delete = activity_table.delete()
+    if user_id is not None:
+        delete = delete.where(activity_table.c.user_id == user_id)
+    session.execute(delete)
+    if rows:
+        session.execute(activity_table.insert(), [
+            {'user_id': uid, 'year': year, 'days': counters.tobytes()}
+            for (uid, year), counters in rows.items()
+        ])
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild per-user activity counters from the raw tables')
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL or instance/tasks.db')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rebuild_cmd = sub.add_parser('rebuild')
+    rebuild_cmd.add_argument('--user-id', type=int)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(database_url_from_env(args.database_url))
+    if 'user_activity' not in inspect(engine).get_table_names():
+        print("❌ user_activity table not found - start the app once to create it")
+        return 1
+    tables = archive.reflect_tables(engine)
+    metadata = MetaData()
+    metadata.reflect(engine, only=['user_activity'])
+    with engine.begin() as conn:
+        count = rebuild(conn, metadata.tables['user_activity'], tables, args.user_id)
+    print(f"✅ Rebuilt {count} activity rows")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
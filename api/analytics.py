@@ -0,0 +1,190 @@
+"""
+Time-bucketed analytics over arbitrary date ranges.
+
+Buckets are computed in SQL with the dialect's date functions (`date_trunc`
+on PostgreSQL, `date`/`strftime` on SQLite), so a range costs one grouped
+query per metric family - tasks and pomodoro sessions - however many days it
+spans. Empty buckets are filled in Python afterwards.
+
+Ranges reaching archived history read across the hot and archive tables (see
+archive.py).
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Date, case, cast, func, or_, select
+
+import archive
+import soft_delete
+
+BUCKETS = ('day', 'week', 'month')
+MAX_BUCKETS = 1200
+
+
+def bucket_expression(dialect, column, bucket):
+    """SQL expression truncating a date/datetime column to the start of its bucket"""
+    if dialect == 'postgresql':
+        return cast(func.date_trunc(bucket, column), Date)
+    if bucket == 'day':
+        return func.date(column)
+    if bucket == 'week':
+        # Weeks start on Monday: jump to the next Sunday (or stay), then back six days
+        return func.date(column, 'weekday 0', '-6 days')
+    return func.strftime('%Y-%m-01', column)
+
+
+def bucket_start(day, bucket):
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_bucket(day, bucket):
+    if bucket == 'day':
+        return day + timedelta(days=1)
+    if bucket == 'week':
+        return day + timedelta(days=7)
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def bucket_count(start, end, bucket):
+    """How many buckets cover [start, end], without building them"""
+    first = bucket_start(start, bucket)
+    if bucket == 'month':
+        return (end.year - first.year) * 12 + end.month - first.month + 1
+    return (end - first).days // (7 if bucket == 'week' else 1) + 1
+
+
+def bucket_keys(start, end, bucket):
+    keys = []
+    current = bucket_start(start, bucket)
+    while current <= end:
+        keys.append(current)
+        current = next_bucket(current, bucket)
+    return keys
+
+
+def as_date(value):
+    """Bucket values come back as dates (PostgreSQL) or ISO strings (SQLite)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _rate(completed, total):
+    return round((completed / total * 100) if total > 0 else 0, 1)
+
+
+def range_analytics(session, tables, user_id, start, end, bucket):
+    """Completion counts, rates, priority breakdown and focus time per bucket in [start, end]"""
+    task, pomodoro_session, task_archive, session_archive = tables
+    dialect = session.get_bind().dialect.name
+    keys = bucket_keys(start, end, bucket)
+    buckets = {
+        key: {
+            'start': key.isoformat(),
+            'completed': 0,
+            'total': 0,
+            'priorities': {p: {'completed': 0, 'total': 0} for p in range(1, 6)},
+            'pomodoros': 0,
+            'focus_minutes': 0,
+        }
+        for key in keys
+    }
+
+    # Tasks: one grouped query for totals and the priority breakdown
+    tasks = archive.tiered(task, task_archive,
+                           archive.reaches_archive(session, task_archive, user_id, 'due_date', start))
+    task_bucket = bucket_expression(dialect, tasks.c.due_date, bucket).label('bucket')
+    task_rows = session.execute(
+        select(
+            task_bucket,
+            tasks.c.priority,
+            func.count(),
+            func.sum(case((tasks.c.completed == True, 1), else_=0))  # noqa: E712
+        ).where(
+            tasks.c.user_id == user_id,
+            tasks.c.due_date >= start,
+            tasks.c.due_date <= end,
+            tasks.c.deleted_at.is_(None),
+            or_(tasks.c.is_recurring == False, tasks.c.is_recurring.is_(None))  # noqa: E712
+        ).group_by(task_bucket, tasks.c.priority)
+    ).all()
+    for bucket_value, priority, total, completed in task_rows:
+        entry = buckets.get(as_date(bucket_value))
+        if entry is None:
+            continue
+        completed = completed or 0
+        entry['total'] += total
+        entry['completed'] += completed
+        if priority in entry['priorities']:
+            entry['priorities'][priority]['total'] += total
+            entry['priorities'][priority]['completed'] += completed
+
+    # Pomodoros: one grouped query for counts and focus minutes
+    range_start = datetime.combine(start, datetime.min.time())
+    range_end = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    sessions = archive.tiered(pomodoro_session, session_archive,
+                              archive.reaches_archive(session, session_archive, user_id, 'completed_at', range_start))
+    session_bucket = bucket_expression(dialect, sessions.c.completed_at, bucket).label('bucket')
+    session_rows = session.execute(
+        select(session_bucket, func.count(), func.sum(sessions.c.duration)).where(
+            sessions.c.user_id == user_id,
+            sessions.c.type == 'work',
+            sessions.c.completed_at >= range_start,
+            sessions.c.completed_at < range_end,
+            soft_delete.live_sessions(sessions, task, user_id)
+        ).group_by(session_bucket)
+    ).all()
+    for bucket_value, count, minutes in session_rows:
+        entry = buckets.get(as_date(bucket_value))
+        if entry is not None:
+            entry['pomodoros'] += count
+            entry['focus_minutes'] += minutes or 0
+
+    totals = {'completed': 0, 'total': 0, 'pomodoros': 0, 'focus_minutes': 0}
+    result = []
+    for key in keys:
+        entry = buckets[key]
+        entry['rate'] = _rate(entry['completed'], entry['total'])
+        entry['priorities'] = [
+            {'priority': p, 'completed': v['completed'], 'total': v['total'], 'rate': _rate(v['completed'], v['total'])}
+            for p, v in entry['priorities'].items()
+        ]
+        for field in totals:
+            totals[field] += entry[field]
+        result.append(entry)
+    totals['rate'] = _rate(totals['completed'], totals['total'])
+
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'bucket': bucket,
+        'buckets': result,
+        'totals': totals,
+    }
+
+
+def parse_range_args(args, today):
+    """Validate ?from=&to=&bucket= query arguments; raises ValueError with a user-facing message"""
+    try:
+        end = datetime.strptime(args['to'], '%Y-%m-%d').date() if args.get('to') else today
+        start = datetime.strptime(args['from'], '%Y-%m-%d').date() if args.get('from') else end - timedelta(days=6)
+    except ValueError:
+        raise ValueError('Dates must be formatted as YYYY-MM-DD')
+    bucket = args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise ValueError('bucket must be one of: ' + ', '.join(BUCKETS))
+    if start > end:
+        raise ValueError('from must be before to')
+    try:
+        if bucket_count(start, end, bucket) > MAX_BUCKETS:
+            raise ValueError(f'Range too long for {bucket} buckets (max {MAX_BUCKETS})')
+        # range_analytics() steps one bucket and one day past the range
+        next_bucket(bucket_start(end, bucket), bucket), end + timedelta(days=1)
+    except OverflowError:
+        raise ValueError('Dates out of range')
+    return start, end, bucket
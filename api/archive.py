@@ -0,0 +1,271 @@
+"""
+Hot/cold tiering for tasks and pomodoro sessions.
+
+Tasks whose due date is older than a configurable age move, together with
+their pomodoro sessions, from `task`/`pomodoro_session` into
+`task_archive`/`pomodoro_session_archive`. The hot tables (and their indexes)
+then only hold recent history and recurring templates.
+
+Archiving runs in small batches, each in its own transaction: a batch copies
+rows into the archive and deletes them from the hot table atomically, so an
+interrupted run can simply be started again and continues where it stopped.
+
+History reads go through `task_history()` / `session_history()`, which union
+the hot and archive tables when the requested range reaches archived data.
+
+Usage:
+    python archive.py --older-than-days 180 --batch-size 500 --sleep-ms 50
+    python archive.py --database-url postgresql://... --dry-run
+"""
+import argparse
+import logging
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import (Column, DateTime, Index, MetaData, Table, and_, create_engine,
+                        func, insert, literal, or_, select, union_all)
+
+from db_url import database_url_from_env
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+
+
+def define_archive_tables(metadata):
+    """Register the archive tables on `metadata`, mirroring the hot tables' columns.
+
+    Archive tables carry no foreign keys (their parents may live in either
+    tier) and get an extra `archived_at` timestamp.
+    """
+    tables = []
+    for name, index_columns in (('task', ('user_id', 'due_date')),
+                                ('pomodoro_session', ('user_id', 'completed_at'))):
+        archive_name = f'{name}_archive'
+        if archive_name in metadata.tables:
+            tables.append(metadata.tables[archive_name])
+            continue
+        hot = metadata.tables[name]
+        columns = [
+            Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable, autoincrement=False)
+            for c in hot.columns
+        ]
+        table = Table(archive_name, metadata, *columns, Column('archived_at', DateTime, default=datetime.utcnow))
+        Index(f'ix_{archive_name}_{"_".join(index_columns)}', *[table.c[c] for c in index_columns])
+        tables.append(table)
+    return tuple(tables)
+
+
+def _copy_columns(hot):
+    return [c.name for c in hot.columns]
+
+
+def archive_batch(conn, tables, cutoff, batch_size, after_id=0):
+    """Move one batch of old tasks (and their sessions) to the archive.
+
+    Returns the ids of the moved tasks; an empty list means nothing is left.
+    Must run inside a transaction so the copy and the delete commit together.
+    """
+    task, session, task_archive, session_archive = tables
+    ids = conn.execute(
+        select(task.c.id).where(
+            task.c.id > after_id,
+            task.c.due_date < cutoff,
+            # Deleted tasks wait for the purge
+            task.c.deleted_at.is_(None),
+            # Recurring templates stay hot; their instances are ordinary tasks
+            or_(task.c.is_recurring == False, task.c.is_recurring.is_(None))  # noqa: E712
+        ).order_by(task.c.id).limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return []
+
+    now = datetime.utcnow()
+    session_columns = _copy_columns(session)
+    conn.execute(insert(session_archive).from_select(
+        session_columns + ['archived_at'],
+        select(*[session.c[c] for c in session_columns], literal(now)).where(session.c.task_id.in_(ids))
+    ))
+    conn.execute(session.delete().where(session.c.task_id.in_(ids)))
+
+    task_columns = _copy_columns(task)
+    conn.execute(insert(task_archive).from_select(
+        task_columns + ['archived_at'],
+        select(*[task.c[c] for c in task_columns], literal(now)).where(task.c.id.in_(ids))
+    ))
+    conn.execute(task.delete().where(task.c.id.in_(ids)))
+    return ids
+
+
+def archive_orphan_sessions_batch(conn, tables, cutoff, batch_size):
+    """Move one batch of old sessions that are not attached to any task"""
+    _, session, _, session_archive = tables
+    ids = conn.execute(
+        select(session.c.id).where(
+            session.c.task_id.is_(None),
+            session.c.completed_at < datetime.combine(cutoff, datetime.min.time())
+        ).order_by(session.c.id).limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return []
+    session_columns = _copy_columns(session)
+    conn.execute(insert(session_archive).from_select(
+        session_columns + ['archived_at'],
+        select(*[session.c[c] for c in session_columns], literal(datetime.utcnow())).where(session.c.id.in_(ids))
+    ))
+    conn.execute(session.delete().where(session.c.id.in_(ids)))
+    return ids
+
+
+def archive_old_data(engine, tables, older_than_days=DEFAULT_ARCHIVE_AFTER_DAYS,
+                     batch_size=500, sleep_ms=0, max_batches=None):
+    """Archive everything older than `older_than_days`, one transaction per batch"""
+    cutoff = date.today() - timedelta(days=older_than_days)
+    moved_tasks = moved_orphans = batches = 0
+    last_id = 0
+
+    while max_batches is None or batches < max_batches:
+        with engine.begin() as conn:
+            ids = archive_batch(conn, tables, cutoff, batch_size, after_id=last_id)
+        if not ids:
+            break
+        last_id = ids[-1]
+        moved_tasks += len(ids)
+        batches += 1
+        logger.info('Archived %s tasks (up to id %s, %s total)', len(ids), last_id, moved_tasks)
+        if sleep_ms:
+            time.sleep(sleep_ms / 1000.0)
+
+    while max_batches is None or batches < max_batches:
+        with engine.begin() as conn:
+            ids = archive_orphan_sessions_batch(conn, tables, cutoff, batch_size)
+        if not ids:
+            break
+        moved_orphans += len(ids)
+        batches += 1
+        if sleep_ms:
+            time.sleep(sleep_ms / 1000.0)
+
+    return {'cutoff': cutoff.isoformat(), 'tasks': moved_tasks, 'orphan_sessions': moved_orphans, 'batches': batches}
+
+
+# History reads across both tiers
+
+def reaches_archive(conn, archive_table, user_id, column, start):
+    """True if the user has archived rows at or after `start` in `column`"""
+    newest = conn.execute(
+        select(func.max(archive_table.c[column])).where(archive_table.c.user_id == user_id)
+    ).scalar()
+    if newest is None:
+        return False
+    if isinstance(newest, datetime) and not isinstance(start, datetime):
+        start = datetime.combine(start, datetime.min.time())
+    return newest >= start
+
+
+def tiered(hot, archive_table, include_archive):
+    """A selectable with the hot table's columns, unioned with the archive when asked"""
+    if not include_archive:
+        return hot
+    columns = _copy_columns(hot)
+    return union_all(
+        select(*[hot.c[c] for c in columns]),
+        select(*[archive_table.c[c] for c in columns])
+    ).subquery(f'{hot.name}_all')
+
+
+def task_history(conn, tables, user_id, start, end, limit=200):
+    """Tasks due in [start, end] from both tiers, newest first, serialized like Task.to_dict"""
+    task, _, task_archive, _ = tables
+    include_archive = reaches_archive(conn, task_archive, user_id, 'due_date', start)
+    tasks = tiered(task, task_archive, include_archive)
+    rows = conn.execute(
+        select(tasks).where(
+            tasks.c.user_id == user_id,
+            tasks.c.due_date >= start,
+            tasks.c.due_date <= end,
+            tasks.c.deleted_at.is_(None),
+            or_(tasks.c.is_recurring == False, tasks.c.is_recurring.is_(None))  # noqa: E712
+        ).order_by(tasks.c.due_date.desc(), tasks.c.id.desc()).limit(limit)
+    ).mappings().all()
+    return [task_dict(row) for row in rows]
+
+
+def session_history(conn, tables, user_id, start, end):
+    """Pomodoro sessions completed in [start, end) from both tiers"""
+    _, session, _, session_archive = tables
+    include_archive = reaches_archive(conn, session_archive, user_id, 'completed_at', start)
+    sessions = tiered(session, session_archive, include_archive)
+    return select(sessions).where(
+        and_(sessions.c.user_id == user_id,
+             sessions.c.completed_at >= start,
+             sessions.c.completed_at < end)
+    )
+
+
+def task_dict(row):
+    result = {
+        'id': row['id'],
+        'title': row['title'],
+        'description': row['description'],
+        'priority': row['priority'],
+        'completed': row['completed'],
+        'due_date': row['due_date'].isoformat(),
+        'created_at': row['created_at'].isoformat(),
+        'pomodoro_count': row['work_pomodoro_count'] or 0,
+        'focus_minutes': row['focus_minutes'] or 0,
+        'is_recurring': row['is_recurring'],
+    }
+    if row['is_recurring']:
+        result['recurrence_type'] = row['recurrence_type']
+        result['recurrence_days'] = row['recurrence_days']
+    if row['recurring_parent_id']:
+        result['recurring_parent_id'] = row['recurring_parent_id']
+    return result
+
+
+def reflect_tables(engine):
+    """Load the hot tables from the database and make sure the archive tables exist"""
+    metadata = MetaData()
+    metadata.reflect(engine, only=['task', 'pomodoro_session'])
+    task_archive, session_archive = define_archive_tables(metadata)
+    metadata.create_all(engine, tables=[task_archive, session_archive])
+    return (metadata.tables['task'], metadata.tables['pomodoro_session'], task_archive, session_archive)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move old tasks and pomodoro sessions to the archive tables')
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL or instance/tasks.db')
+    parser.add_argument('--older-than-days', type=int, default=DEFAULT_ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--sleep-ms', type=int, default=50, help='Pause between batches to limit load')
+    parser.add_argument('--max-batches', type=int, help='Stop after this many batches (resume later)')
+    parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    engine = create_engine(database_url_from_env(args.database_url))
+    tables = reflect_tables(engine)
+    task = tables[0]
+    cutoff = date.today() - timedelta(days=args.older_than_days)
+
+    if args.dry_run:
+        with engine.connect() as conn:
+            count = conn.execute(select(func.count()).select_from(task).where(
+                task.c.due_date < cutoff,
+                task.c.deleted_at.is_(None),
+                or_(task.c.is_recurring == False, task.c.is_recurring.is_(None))  # noqa: E712
+            )).scalar()
+        print(f"📦 {count} tasks due before {cutoff.isoformat()} would be archived")
+        return 0
+
+    print(f"🔄 Archiving tasks due before {cutoff.isoformat()}...")
+    summary = archive_old_data(engine, tables, args.older_than_days, args.batch_size,
+                               args.sleep_ms, args.max_batches)
+    print(f"✅ Archived {summary['tasks']} tasks and {summary['orphan_sessions']} "
+          f"unattached sessions in {summary['batches']} batches")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
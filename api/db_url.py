@@ -0,0 +1,23 @@
+"""
+Database URL resolution shared by the command line tools.
+
+The apps configure their own engines; the CLIs (archiving, migrations, ops
+checks, workers) take `--database-url` and fall back to DATABASE_URL, then to
+the self-hosted SQLite file in `instance/tasks.db` next to this module.
+"""
+import os
+
+
+def normalize_database_url(url):
+    # Heroku/some providers use postgres:// but SQLAlchemy needs postgresql://
+    if url.startswith('postgres://'):
+        return url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+
+def database_url_from_env(url=None):
+    url = url or os.environ.get('DATABASE_URL')
+    if not url:
+        basedir = os.path.abspath(os.path.dirname(__file__))
+        url = 'sqlite:///' + os.path.join(basedir, 'instance', 'tasks.db')
+    return normalize_database_url(url)
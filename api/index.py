@@ -4,17 +4,39 @@ from flask_cors import CORS
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from datetime import datetime, date, timedelta
-from sqlalchemy import func
+from sqlalchemy import create_engine, event, select
+import hmac
+import secrets
 import os
 import logging
 import sys
 
-# Configure logging for Vercel
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[logging.StreamHandler(sys.stdout)]
-)
+# Make sibling modules importable however the runtime loads this file
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import activity
+import analytics
+import archive
+import dashboard
+import jobs
+import occurrences
+import partitioning
+import planner
+import rate_limit
+import read_replica
+import request_profiler
+import search
+import log_pipeline
+import slow_query_log
+import soft_delete
+import sync
+import task_counters
+import task_reads
+import task_writes
+
+# Configure logging for Vercel: JSON lines written to stdout from a background
+# thread, with per-route rate limiting of INFO records (see log_pipeline.py)
+log_pipeline.configure_logging(sys.stdout)
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
@@ -24,7 +46,7 @@ app = Flask(__name__)
 # Use PostgreSQL instead of SQLite
 # Handle DATABASE_URL from various providers (some use postgres://, SQLAlchemy needs postgresql://)
 database_url = os.environ.get('DATABASE_URL', 'postgresql://localhost/pomovity')
-logger.info(f"Initial DATABASE_URL scheme: {database_url.split('://')[0] if '://' in database_url else 'no-scheme'}")
+logger.info("Initial DATABASE_URL scheme: %s", database_url.split('://')[0] if '://' in database_url else 'no-scheme')
 
 # Fix for Heroku/some providers that use postgres:// instead of postgresql://
 if database_url.startswith('postgres://'):
@@ -34,7 +56,7 @@ elif database_url.startswith('https://'):
     logger.error("DATABASE_URL is an HTTPS URL - this is INVALID! Please use postgresql://")
     
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-logger.info(f"DATABASE_URL configured: {database_url.split('@')[0] if '@' in database_url else 'local'}...")
+logger.info("DATABASE_URL configured: %s...", database_url.split('@')[0] if '@' in database_url else 'local')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # Optimized for serverless: smaller pool size, faster connection handling
 # Only apply PostgreSQL-specific settings when using PostgreSQL
@@ -46,7 +68,7 @@ if database_url.startswith('postgresql://'):
         'pool_pre_ping': True,
         'connect_args': {
             'connect_timeout': 10,
-            'sslmode': 'require'
+            'sslmode': os.environ.get('DATABASE_SSLMODE', 'require')
         }
     }
     logger.info("Using PostgreSQL-specific connection pool settings")
@@ -62,10 +84,37 @@ app.config['JWT_TOKEN_LOCATION'] = ['headers']
 app.config['JWT_HEADER_NAME'] = 'Authorization'
 app.config['JWT_HEADER_TYPE'] = 'Bearer'
 
-db = SQLAlchemy(app)
+# Optional read replica: DATABASE_READ_URL sends the read-only endpoints to a second
+# database, with read-your-writes stickiness and fallback to the primary (see read_replica.py)
+read_database_url = os.environ.get('DATABASE_READ_URL')
+if read_database_url and read_database_url.startswith('postgres://'):
+    read_database_url = read_database_url.replace('postgres://', 'postgresql://', 1)
+
+db = SQLAlchemy(app, session_options={'class_': read_replica.RoutingSession})
+read_routing = read_replica.ReadRouter(
+    sticky_seconds=float(os.environ.get('DATABASE_READ_STICKY_SECONDS', 5)),
+    retry_seconds=float(os.environ.get('DATABASE_READ_RETRY_SECONDS', 30))
+)
+if read_database_url:
+    # A plain engine rather than a Flask-SQLAlchemy bind, which create_all() would run DDL on
+    read_routing.init_app(db, create_engine(read_database_url, **app.config['SQLALCHEMY_ENGINE_OPTIONS']))
+    logger.info("Routing read-only endpoints to DATABASE_READ_URL")
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
 
+# Optional slow query log: set SLOW_QUERY_MS to record statements slower than that
+# Summarize with: python api/slow_query_log.py /tmp/slow_queries.log
+slow_query_recorder = None
+if os.environ.get('SLOW_QUERY_MS'):
+    with app.app_context():
+        slow_query_recorder = slow_query_log.install(
+            db.engine,
+            threshold_ms=float(os.environ['SLOW_QUERY_MS']),
+            ring_size=int(os.environ.get('SLOW_QUERY_RING_SIZE', 500)),
+            # /tmp is the only writable location on Vercel
+            log_path=os.environ.get('SLOW_QUERY_LOG', '/tmp/slow_queries.log')
+        )
+
 # CORS configuration - allow frontend URL
 frontend_url = os.environ.get('FRONTEND_URL', '*')
 # Handle CORS properly for Vercel: if wildcard, use it directly; otherwise use list
@@ -74,6 +123,15 @@ if frontend_url == '*':
 else:
     CORS(app, origins=[frontend_url, 'http://localhost:3001'], supports_credentials=True)
 
+# Optional request profiler: PROFILER_ENABLED=1 plus X-Profile/X-Admin-Token headers,
+# or PROFILER_SAMPLE_RATE for continuous sampling. Registers nothing when disabled.
+request_profiler.init_app(app, default_dir='/tmp/profiles')
+
+# Optional rate limiting: RATE_LIMIT_ENABLED=1 turns on per-user/per-IP token buckets
+# (429) and a concurrency gate in front of the database pool (503). See rate_limit.py.
+with app.app_context():
+    rate_limiter = rate_limit.init_app(app, engine=db.engine)
+
 # JWT error handlers
 @jwt.invalid_token_loader
 def invalid_token_callback(error):
@@ -87,54 +145,51 @@ def unauthorized_callback(error):
 def expired_token_callback(jwt_header, jwt_data):
     return jsonify({'error': 'Token has expired'}), 401
 
+# Tokens of deleted accounts are refused; each process re-checks an account at most
+# once per ACCOUNT_STATUS_TTL_SECONDS (see soft_delete.py)
+account_status = soft_delete.AccountStatus(ttl=float(os.environ.get('ACCOUNT_STATUS_TTL_SECONDS', 60)))
+
+@jwt.token_in_blocklist_loader
+def deleted_account_check(jwt_header, jwt_data):
+    return account_status.is_deleted(db.session, User.__table__, int(jwt_data['sub']))
+
+@jwt.revoked_token_loader
+def revoked_token_callback(jwt_header, jwt_data):
+    return jsonify({'error': 'Account deleted'}), 401
+
 # Helper functions for recurring tasks
 def generate_recurring_tasks_for_user(user_id, target_date=None):
-    """Generate recurring task instances for a specific date if they don't exist"""
+    """Generate recurring task instances for a specific date if they don't exist.
+    Returns the user's recurring templates (rows, newest first)"""
     if target_date is None:
         target_date = date.today()
-    
+    tasks = Task.__table__
+
     # Get all recurring task templates for the user
-    recurring_templates = Task.query.filter_by(
-        user_id=user_id, 
-        is_recurring=True,
-        recurring_parent_id=None  # Only get templates, not instances
-    ).all()
-    
-    for template in recurring_templates:
-        # Check if task should be created for this date
-        should_create = False
-        
-        if template.recurrence_type == 'daily':
-            should_create = True
-        elif template.recurrence_type == 'weekly':
-            # Check if today's weekday matches any of the specified days
-            weekday = target_date.weekday()  # 0=Monday, 6=Sunday
-            if template.recurrence_days:
-                recurring_days = [int(d.strip()) for d in template.recurrence_days.split(',')]
-                should_create = weekday in recurring_days
-        
-        if should_create:
-            # Check if instance already exists for this date
-            existing = Task.query.filter_by(
-                user_id=user_id,
-                recurring_parent_id=template.id,
-                due_date=target_date
-            ).first()
-            
-            if not existing:
-                # Create new instance
-                new_instance = Task(
-                    title=template.title,
-                    description=template.description,
-                    priority=template.priority,
-                    due_date=target_date,
-                    user_id=user_id,
-                    is_recurring=False,
-                    recurring_parent_id=template.id
-                )
-                db.session.add(new_instance)
-    
-    db.session.commit()
+    recurring_templates = task_reads.recurring_templates(db.session, tasks, user_id)
+
+    # Templates that recur on this date
+    due = [template for template in recurring_templates if occurrences.occurs_on(template, target_date)]
+    if not due:
+        return recurring_templates
+
+    # Instances that already exist for this date, for all templates at once (a deleted one
+    # counts: the user removed it for this day; a moved one still stands for it)
+    existing = set(db.session.execute(
+        select(tasks.c.recurring_parent_id).where(
+            tasks.c.user_id == user_id,
+            tasks.c.recurring_parent_id.in_([template.id for template in due]),
+            tasks.c.occurrence_date == target_date
+        )
+    ).scalars())
+    due = [template for template in due if template.id not in existing]
+    if due:
+        change_seq = next_change_seq(user_id)
+        db.session.execute(tasks.insert(), [occurrences.instance_values(template, user_id, target_date, change_seq)
+                                            for template in due])
+        db.session.commit()
+        plan_cache.invalidate(user_id)
+    return recurring_templates
 
 # Models
 class User(db.Model):
@@ -142,8 +197,17 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
+    deleted_at = db.Column(db.DateTime)  # set by DELETE /api/profile until the purge (see soft_delete.py)
+    # Last change number handed out and highest one purged (see sync.py)
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    purged_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     tasks = db.relationship('Task', backref='owner', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_user_deleted_at', 'deleted_at', sqlite_where=db.text('deleted_at IS NOT NULL'),
+                 postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -164,8 +228,24 @@ class Task(db.Model):
     recurrence_type = db.Column(db.String(20))  # 'daily' or 'weekly'
     recurrence_days = db.Column(db.String(50))  # For weekly: comma-separated days (0-6, 0=Monday)
     recurring_parent_id = db.Column(db.Integer, db.ForeignKey('task.id'))  # Link to template task
+    occurrence_date = db.Column(db.Date)  # For instances: the day of the template they stand for
+    # Maintained alongside pomodoro sessions (see task_counters.py)
+    work_pomodoro_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    focus_minutes = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    deleted_at = db.Column(db.DateTime)  # soft delete: hidden from every read until the purge
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # see sync.py
     pomodoros = db.relationship('PomodoroSession', backref='task', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        # Partial indexes: reads only see live tasks, the purge only deleted ones
+        db.Index('ix_task_live_user_id_due_date', 'user_id', 'due_date',
+                 sqlite_where=db.text('deleted_at IS NULL'), postgresql_where=db.text('deleted_at IS NULL')),
+        db.Index('ix_task_deleted_user_id', 'user_id', sqlite_where=db.text('deleted_at IS NOT NULL'),
+                 postgresql_where=db.text('deleted_at IS NOT NULL')),
+        db.Index('ix_task_recurring_parent_id_occurrence_date', 'recurring_parent_id', 'occurrence_date'),
+        db.Index('ix_task_user_id_change_seq', 'user_id', 'change_seq'),
+    )
+
     def to_dict(self):
         result = {
             'id': self.id,
@@ -175,7 +255,8 @@ class Task(db.Model):
             'completed': self.completed,
             'due_date': self.due_date.isoformat(),
             'created_at': self.created_at.isoformat(),
-            'pomodoro_count': len([p for p in self.pomodoros if p.type == 'work']),
+            'pomodoro_count': self.work_pomodoro_count or 0,
+            'focus_minutes': self.focus_minutes or 0,
             'is_recurring': self.is_recurring,
         }
         if self.is_recurring:
@@ -192,6 +273,13 @@ class PomodoroSession(db.Model):
     duration = db.Column(db.Integer, nullable=False)  # in minutes
     type = db.Column(db.String(20), nullable=False)  # 'work' or 'break'
     completed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # see sync.py
+
+    __table_args__ = (
+        db.Index('ix_pomodoro_session_user_id_completed_at', 'user_id', 'completed_at'),
+        db.Index('ix_pomodoro_session_task_id', 'task_id'),
+        db.Index('ix_pomodoro_session_user_id_change_seq', 'user_id', 'change_seq'),
+    )
 
     def to_dict(self):
         return {
@@ -202,6 +290,109 @@ class PomodoroSession(db.Model):
             'completed_at': self.completed_at.isoformat()
         }
 
+@event.listens_for(PomodoroSession, 'after_delete')
+def _pomodoro_session_deleted(mapper, connection, target):
+    # Sessions deleted along with their task need no counter update
+    deleted_tasks = {obj.id for obj in db.session.deleted if isinstance(obj, Task)}
+    if target.task_id not in deleted_tasks:
+        task_counters.apply_session(connection, Task.__table__, target.user_id, target.task_id,
+                                    target.type, target.duration, sign=-1)
+
+class UserActivity(db.Model):
+    """Per-user, per-year activity counters packed as 366 uint16 values (see activity.py)"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    days = db.Column(db.LargeBinary, nullable=False)
+
+# Cold tier for old tasks and their sessions (see archive.py)
+task_archive, pomodoro_session_archive = archive.define_archive_tables(db.metadata)
+ARCHIVE_TABLES = (Task.__table__, PomodoroSession.__table__, task_archive, pomodoro_session_archive)
+
+# Full-text search index, created together with the task table (see search.py)
+search.attach(Task.__table__)
+
+# Day plans, kept current by the task routes below (see planner.py)
+plan_cache = planner.PlanCache()
+
+# Delta sync: every write stamps its rows with the user's next change number (see sync.py)
+SYNC_TABLES = (Task.__table__, PomodoroSession.__table__, User.__table__)
+
+
+def next_change_seq(user_id, *conditions):
+    return sync.next_seq(db.session, User.__table__, user_id, *conditions)
+
+
+def current_change_seq(user_id):
+    return sync.current_seq(db.session, User.__table__, user_id)
+
+# Deferred work: routes queue jobs in their own transaction (see jobs.py). Serverless
+# instances don't keep threads alive, so on Vercel a scheduler calls POST /api/admin/jobs/run;
+# JOB_WORKERS runs them on threads in long-lived deployments
+job_table = jobs.define_job_table(db.metadata)
+with app.app_context():
+    job_queue = jobs.JobQueue(
+        job_table, [db.engine],
+        lease_seconds=int(os.environ.get('JOB_LEASE_SECONDS', jobs.DEFAULT_LEASE_SECONDS)),
+        retry_base_seconds=float(os.environ.get('JOB_RETRY_BASE_SECONDS', 30))
+    )
+job_worker = None
+if int(os.environ.get('JOB_WORKERS', 0)) > 0:
+    job_worker = jobs.JobWorker(job_queue, threads=int(os.environ['JOB_WORKERS']),
+                                poll_seconds=float(os.environ.get('JOB_POLL_SECONDS', 1)))
+
+
+def start_jobs():
+    """Start the job threads (once), in the process serving requests"""
+    if job_worker is not None:
+        job_worker.ensure_started()
+
+
+@app.before_request
+def start_job_workers():
+    # Jobs queued before this process started (a restart, a recycled worker) run too,
+    # even if this process never queues one itself
+    start_jobs()
+
+# Purge of soft-deleted rows (see soft_delete.py): each delete queues a purge for when its
+# rows are old enough; while deleted rows remain, the purge queues itself again every
+# PURGE_INTERVAL_SECONDS. POST /api/admin/purge and soft_delete.py run it on demand.
+SOFT_DELETE_TABLES = ARCHIVE_TABLES + (User.__table__, UserActivity.__table__)
+purge_min_age_seconds = int(os.environ.get('PURGE_MIN_AGE_SECONDS', soft_delete.DEFAULT_MIN_AGE_SECONDS))
+purge_interval_seconds = float(os.environ.get('PURGE_INTERVAL_SECONDS', 60))
+
+
+def schedule_purge():
+    """Queue the purge in the current transaction (at most one waits at a time)"""
+    jobs.enqueue(db.session, job_table, 'purge', delay_seconds=purge_min_age_seconds, dedup_key='purge')
+    start_jobs()
+
+
+@job_queue.handler('purge')
+def purge_job(engine, payload):
+    # Well within the lease, so no second worker picks the job up meanwhile
+    summary = soft_delete.purge(engine, SOFT_DELETE_TABLES, purge_min_age_seconds,
+                                batch_size=int(os.environ.get('PURGE_BATCH_SIZE', 500)), sleep_ms=20,
+                                max_seconds=job_queue.lease_seconds / 5)
+    with engine.begin() as conn:
+        if not summary['complete']:
+            jobs.enqueue(conn, job_table, 'purge', dedup_key='purge')
+        elif any(soft_delete.pending(conn, SOFT_DELETE_TABLES).values()):
+            # Deleted too recently, or instances kept until their day is over
+            jobs.enqueue(conn, job_table, 'purge', delay_seconds=purge_interval_seconds, dedup_key='purge')
+
+
+@job_queue.handler('archive')
+def archive_job(engine, payload):
+    """Queued from a scheduler: POST /api/admin/jobs {"kind": "archive"}"""
+    older_than_days = int(payload.get('older_than_days', archive.DEFAULT_ARCHIVE_AFTER_DAYS))
+    max_batches = 200  # then the job queues its continuation, well within the lease
+    summary = archive.archive_old_data(engine, ARCHIVE_TABLES, older_than_days,
+                                       batch_size=int(os.environ.get('ARCHIVE_BATCH_SIZE', 500)), sleep_ms=20,
+                                       max_batches=max_batches)
+    if summary['batches'] >= max_batches:
+        with engine.begin() as conn:
+            jobs.enqueue(conn, job_table, 'archive', payload, dedup_key='archive')
+
 # Routes
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -225,6 +416,7 @@ def register():
         
         db.session.add(new_user)
         db.session.commit()
+        read_routing.wrote(new_user.id)
 
         return jsonify({'message': 'User registered successfully', 'user': new_user.to_dict()}), 201
     except Exception as e:
@@ -241,7 +433,7 @@ def login():
         if not username or not password:
             return jsonify({'error': 'Missing username or password'}), 400
 
-        user = User.query.filter_by(username=username).first()
+        user = User.query.filter_by(username=username, deleted_at=None).first()
 
         if not user or not bcrypt.check_password_hash(user.password, password):
             return jsonify({'error': 'Invalid credentials'}), 401
@@ -257,6 +449,7 @@ def login():
 
 @app.route('/api/profile', methods=['GET'])
 @jwt_required()
+@read_routing.reads
 def get_profile():
     try:
         current_user_id = int(get_jwt_identity())
@@ -342,24 +535,100 @@ def change_password():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/profile', methods=['DELETE'])
+@jwt_required()
+def delete_account():
+    """Close the account now (tokens refused, username and email released); its data is purged later"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        user = User.query.get(current_user_id)
+
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+
+        password = (request.get_json(silent=True) or {}).get('password')
+        if not password or not bcrypt.check_password_hash(user.password, password):
+            return jsonify({'error': 'Password is incorrect'}), 401
+
+        user.username = f'deleted-{user.id}-{secrets.token_hex(8)}'
+        user.email = f'{user.username}@deleted.invalid'
+        user.deleted_at = datetime.utcnow()
+        schedule_purge()
+        db.session.commit()
+        account_status.mark_deleted(current_user_id)
+        plan_cache.invalidate(current_user_id)
+
+        return jsonify({'message': 'Account deleted'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/tasks', methods=['GET'])
 @jwt_required()
+@read_routing.reads
 def get_tasks():
     try:
         current_user_id = int(get_jwt_identity())
         today = date.today()
         
-        # Generate recurring tasks for today if they don't exist
-        generate_recurring_tasks_for_user(current_user_id, today)
+        # Generate recurring tasks for today if they don't exist (on the primary:
+        # the existence checks must see the latest writes)
+        with read_routing.primary():
+            generate_recurring_tasks_for_user(current_user_id, today)
         
         # Get all tasks for today (excluding recurring templates)
-        tasks = Task.query.filter(
-            Task.user_id == current_user_id,
-            Task.due_date == today,
-            db.or_(Task.is_recurring == False, Task.is_recurring == None)
-        ).order_by(Task.priority.desc(), Task.created_at.asc()).all()
+        # Plain rows of the columns the response needs (see task_reads.py)
+        rows = task_reads.today_tasks(db.session, Task.__table__, current_user_id, today)
         
-        return jsonify({'tasks': [task.to_dict() for task in tasks]}), 200
+        return jsonify({'tasks': [task_reads.task_dict(row) for row in rows]}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/dashboard', methods=['GET'])
+@jwt_required()
+@read_routing.reads
+def get_dashboard():
+    """Today's tasks, analytics, pomodoro stats and recurring templates in one response,
+    with ETag revalidation (see dashboard.py)"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        today = date.today()
+
+        # Generation reads and writes on the primary, like GET /api/tasks
+        with read_routing.primary():
+            templates = generate_recurring_tasks_for_user(current_user_id, today)
+
+        tasks = dashboard.load_tasks(db.session, Task.__table__, current_user_id, today)
+        response = jsonify({
+            'tasks': dashboard.today_tasks(tasks, today),
+            'analytics': dashboard.task_analytics(tasks, today),
+            'pomodoro_stats': dashboard.pomodoro_stats(db.session, PomodoroSession.__table__, Task.__table__,
+                                                       current_user_id, today),
+            'recurring_tasks': [task_reads.task_dict(template) for template in templates],
+        })
+        return dashboard.conditional(response, request)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sync', methods=['GET'])
+@jwt_required()
+@read_routing.reads
+def sync_changes():
+    """Tasks, templates and pomodoro sessions changed since ?cursor=, with tombstones for
+    deletions; without a cursor, everything live (see sync.py)"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        try:
+            cursor = sync.parse_cursor(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'cursor must be a value returned by this endpoint'}), 400
+        limit = max(1, min(request.args.get('limit', sync.DEFAULT_LIMIT, type=int), 5000))
+
+        # Today's recurring instances are changes too (generated on the primary)
+        with read_routing.primary():
+            generate_recurring_tasks_for_user(current_user_id)
+
+        return jsonify(sync.changes(db.session, SYNC_TABLES, current_user_id, cursor, limit)), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -395,11 +664,13 @@ def create_task():
             user_id=current_user_id,
             is_recurring=is_recurring,
             recurrence_type=recurrence_type if is_recurring else None,
-            recurrence_days=recurrence_days if is_recurring else None
+            recurrence_days=recurrence_days if is_recurring else None,
+            change_seq=next_change_seq(current_user_id)
         )
 
         db.session.add(new_task)
         db.session.commit()
+        plan_cache.task_changed(current_user_id, planner.plan_task(new_task), new_task.change_seq)
 
         return jsonify({'message': 'Task created successfully', 'task': new_task.to_dict()}), 201
     except Exception as e:
@@ -411,27 +682,36 @@ def create_task():
 def update_task(task_id):
     try:
         current_user_id = int(get_jwt_identity())
-        task = Task.query.filter_by(id=task_id, user_id=current_user_id).first()
+        data = request.get_json()
 
-        if not task:
+        values = {field: data[field] for field in ('title', 'description', 'priority', 'completed') if field in data}
+        if 'due_date' in data:
+            values['due_date'] = datetime.strptime(data['due_date'], '%Y-%m-%d').date()
+
+        # Only taken if the user has the task (see task_writes.live)
+        change_seq = next_change_seq(current_user_id, task_writes.live(Task.__table__, task_id, current_user_id))
+        if change_seq is None:
             return jsonify({'error': 'Task not found'}), 404
+        if 'due_date' in values:
+            # A completed task counts on its due day, so the count moves with the date
+            previous_due_date = task_writes.due_date_for_update(db.session, Task.__table__, task_id, current_user_id)
 
-        data = request.get_json()
+        # One UPDATE ... RETURNING checks ownership, applies the change and returns the row
+        task, completion_changed = task_writes.update_fields(db.session, Task.__table__, task_id, current_user_id,
+                                                             values, change_seq)
 
-        if 'title' in data:
-            task.title = data['title']
-        if 'description' in data:
-            task.description = data['description']
-        if 'priority' in data:
-            task.priority = data['priority']
-        if 'completed' in data:
-            task.completed = data['completed']
-        if 'due_date' in data:
-            task.due_date = datetime.strptime(data['due_date'], '%Y-%m-%d').date()
+        if task is None:
+            db.session.rollback()
+            return jsonify({'error': 'Task not found'}), 404
 
+        was_completed = bool(task.completed) != completion_changed
+        previous_day = previous_due_date if 'due_date' in values else task.due_date
+        activity.move(db.session, UserActivity.__table__, current_user_id,
+                      previous_day if was_completed else None, task.due_date if task.completed else None)
         db.session.commit()
+        plan_cache.task_changed(current_user_id, planner.plan_task(task), task.change_seq)
 
-        return jsonify({'message': 'Task updated successfully', 'task': task.to_dict()}), 200
+        return jsonify({'message': 'Task updated successfully', 'task': task_writes.task_dict(task)}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -441,13 +721,20 @@ def update_task(task_id):
 def delete_task(task_id):
     try:
         current_user_id = int(get_jwt_identity())
-        task = Task.query.filter_by(id=task_id, user_id=current_user_id).first()
-
-        if not task:
+        # A soft delete: one UPDATE however many sessions the task has (see soft_delete.py)
+        change_seq = next_change_seq(current_user_id)
+        deleted = db.session.execute(
+            Task.__table__.update()
+            .where(Task.id == task_id, Task.user_id == current_user_id, Task.deleted_at.is_(None))
+            .values(deleted_at=datetime.utcnow(), change_seq=change_seq)
+        ).rowcount
+
+        if not deleted:
             return jsonify({'error': 'Task not found'}), 404
 
-        db.session.delete(task)
+        schedule_purge()
         db.session.commit()
+        plan_cache.task_removed(current_user_id, task_id, change_seq)
 
         return jsonify({'message': 'Task deleted successfully'}), 200
     except Exception as e:
@@ -459,183 +746,212 @@ def delete_task(task_id):
 def toggle_task(task_id):
     try:
         current_user_id = int(get_jwt_identity())
-        task = Task.query.filter_by(id=task_id, user_id=current_user_id).first()
+        change_seq = next_change_seq(current_user_id, task_writes.live(Task.__table__, task_id, current_user_id))
+        if change_seq is None:
+            return jsonify({'error': 'Task not found'}), 404
+        # UPDATE task SET completed = NOT completed ... RETURNING (see task_writes.py)
+        task = task_writes.toggle(db.session, Task.__table__, task_id, current_user_id, change_seq)
 
-        if not task:
+        if task is None:
+            db.session.rollback()
             return jsonify({'error': 'Task not found'}), 404
 
-        task.completed = not task.completed
+        activity.record(db.session, UserActivity.__table__, current_user_id, task.due_date, 1 if task.completed else -1)
         db.session.commit()
+        plan_cache.task_changed(current_user_id, planner.plan_task(task), task.change_seq)
 
-        return jsonify({'message': 'Task toggled successfully', 'task': task.to_dict()}), 200
+        return jsonify({'message': 'Task toggled successfully', 'task': task_writes.task_dict(task)}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/tasks/history', methods=['GET'])
+@jwt_required()
+def get_task_history():
+    """Tasks due in a date range, read across the live and archive tables"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        today = date.today()
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if 'to' in request.args else today
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if 'from' in request.args else end - timedelta(days=30)
+        limit = min(request.args.get('limit', 200, type=int), 1000)
+
+        if start > end:
+            return jsonify({'error': 'from must be before to'}), 400
+
+        tasks = archive.task_history(db.session, ARCHIVE_TABLES, current_user_id, start, end, limit)
+        return jsonify({'tasks': tasks}), 200
+    except ValueError:
+        return jsonify({'error': 'Dates must be formatted as YYYY-MM-DD'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/calendar', methods=['GET'])
+@jwt_required()
+@read_routing.reads
+def get_calendar():
+    """Tasks due from ?from= to ?to=, with the recurring occurrences that have no row yet
+    computed on the fly (see occurrences.py)"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        today = date.today()
+        try:
+            start, end = occurrences.parse_range_args(request.args, today)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(occurrences.calendar(db.session, ARCHIVE_TABLES, current_user_id, start, end, today)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/tasks/search', methods=['GET'])
+@jwt_required()
+def search_tasks():
+    """Full-text search over the user's tasks, ranked or by due date, with keyset pagination"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        params = search.parse_search_args(request.args)
+        return jsonify(search.search_tasks(db.session, Task.__table__, current_user_id, params)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/schedule/plan', methods=['POST'])
+@jwt_required()
+def plan_day():
+    """Slot-by-slot pomodoro plan of the user's open tasks (due that day or overdue)"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        day, windows, rules = planner.parse_plan_request(request.get_json(silent=True), date.today())
+        plan = plan_cache.get(current_user_id, current_change_seq(current_user_id), day, windows, rules)
+        if plan is None:
+            if day == date.today():
+                generate_recurring_tasks_for_user(current_user_id, day)
+            plan = plan_cache.build(db.session, Task.__table__, current_user_id, current_change_seq(current_user_id),
+                                    day, windows, rules)
+        return jsonify(plan), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/analytics', methods=['GET'])
 @jwt_required()
+@read_routing.reads
 def get_analytics():
     try:
         current_user_id = int(get_jwt_identity())
         today = date.today()
-        week_start = today - timedelta(days=today.weekday())
-        
-        # Today's stats
-        today_tasks = Task.query.filter_by(user_id=current_user_id, due_date=today).all()
-        today_completed = sum(1 for task in today_tasks if task.completed)
-        today_total = len(today_tasks)
-        
-        # This week's stats
-        week_tasks = Task.query.filter(
-            Task.user_id == current_user_id,
-            Task.due_date >= week_start,
-            Task.due_date <= today
-        ).all()
-        week_completed = sum(1 for task in week_tasks if task.completed)
-        week_total = len(week_tasks)
-        
-        # Last 7 days completion trend
-        daily_stats = []
-        for i in range(6, -1, -1):
-            day = today - timedelta(days=i)
-            day_tasks = Task.query.filter_by(user_id=current_user_id, due_date=day).all()
-            completed = sum(1 for task in day_tasks if task.completed)
-            total = len(day_tasks)
-            daily_stats.append({
-                'date': day.isoformat(),
-                'completed': completed,
-                'total': total,
-                'day': day.strftime('%a')
-            })
-        
-        # Completion by priority
-        priority_stats = []
-        for priority in range(1, 6):
-            priority_tasks = Task.query.filter(
-                Task.user_id == current_user_id,
-                Task.priority == priority,
-                Task.due_date >= week_start,
-                Task.due_date <= today
-            ).all()
-            completed = sum(1 for task in priority_tasks if task.completed)
-            total = len(priority_tasks)
-            priority_stats.append({
-                'priority': priority,
-                'completed': completed,
-                'total': total
-            })
-        
-        return jsonify({
-            'today': {
-                'completed': today_completed,
-                'total': today_total,
-                'rate': round((today_completed / today_total * 100) if today_total > 0 else 0, 1)
-            },
-            'week': {
-                'completed': week_completed,
-                'total': week_total,
-                'rate': round((week_completed / week_total * 100) if week_total > 0 else 0, 1)
-            },
-            'daily_trend': daily_stats,
-            'priority_stats': priority_stats
-        }), 200
+
+        # Long-range, bucketed analytics: /api/analytics?from=YYYY-MM-DD&to=YYYY-MM-DD&bucket=day|week|month
+        if any(arg in request.args for arg in ('from', 'to', 'bucket')):
+            try:
+                start, end, bucket = analytics.parse_range_args(request.args, today)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            result = analytics.range_analytics(db.session, ARCHIVE_TABLES, current_user_id, start, end, bucket)
+            return jsonify(result), 200
+
+        # Today, this week, the 7-day trend and priorities from one query (see dashboard.py)
+        rows = dashboard.load_tasks(db.session, Task.__table__, current_user_id, today)
+        return jsonify(dashboard.task_analytics(rows, today)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/activity/streaks', methods=['GET'])
+@jwt_required()
+def get_activity_streaks():
+    """Current and longest streak of days with a completed task or work pomodoro"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        return jsonify(activity.streaks(db.session, UserActivity.__table__, current_user_id)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/activity/heatmap', methods=['GET'])
+@jwt_required()
+def get_activity_heatmap():
+    """Per-day activity counts for the last `days` days (default 365)"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        days = min(max(request.args.get('days', 365, type=int), 1), 366 * 5)
+        return jsonify(activity.heatmap(db.session, UserActivity.__table__, current_user_id, days)), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/pomodoros', methods=['POST'])
 @jwt_required()
 def create_pomodoro():
-    logger.info("Pomodoro endpoint hit - POST /api/pomodoros")
     try:
         current_user_id = int(get_jwt_identity())
-        logger.info(f"Authenticated user ID: {current_user_id}")
         data = request.get_json()
-        logger.debug(f"Received pomodoro data: {data}")
+        logger.debug("Received pomodoro data: %s", data)
         
         task_id = data.get('task_id')
         duration = data.get('duration', 25)
         session_type = data.get('type', 'work')
         
-        logger.info(f"Creating pomodoro session - task_id: {task_id}, duration: {duration}, type: {session_type}")
-        
         new_pomodoro = PomodoroSession(
             user_id=current_user_id,
             task_id=task_id,
             duration=duration,
-            type=session_type
+            type=session_type,
+            change_seq=next_change_seq(current_user_id)
         )
         
         db.session.add(new_pomodoro)
+        db.session.flush()
+        task_counters.apply_session(db.session, Task.__table__, current_user_id, task_id, session_type, duration,
+                                    change_seq=new_pomodoro.change_seq)
+        if session_type == 'work':
+            activity.record(db.session, UserActivity.__table__, current_user_id, new_pomodoro.completed_at.date())
         db.session.commit()
-        logger.info(f"Successfully created pomodoro session ID: {new_pomodoro.id}")
+        logger.info("Created pomodoro session %s", new_pomodoro.id, extra={
+            'user_id': current_user_id,
+            'task_id': task_id,
+            'duration': duration,
+            'session_type': session_type
+        })
+        if task_id is not None and session_type == 'work':
+            task = db.session.get(Task, task_id)
+            if task is not None and task.user_id == current_user_id:
+                plan_cache.task_changed(current_user_id, planner.plan_task(task), new_pomodoro.change_seq)
         
         return jsonify({'message': 'Pomodoro recorded', 'pomodoro': new_pomodoro.to_dict()}), 201
     except Exception as e:
-        logger.error(f"Failed to create pomodoro: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
+        logger.error("Failed to create pomodoro: %s", e, extra={'error_type': type(e).__name__})
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/pomodoros/stats', methods=['GET'])
 @jwt_required()
+@read_routing.reads
 def get_pomodoro_stats():
-    logger.info("Pomodoro stats endpoint hit - GET /api/pomodoros/stats")
     try:
         current_user_id = int(get_jwt_identity())
-        logger.info(f"Fetching pomodoro stats for user ID: {current_user_id}")
-        today = date.today()
-        week_start = today - timedelta(days=today.weekday())
-        
-        # Today's pomodoros
-        today_pomodoros = PomodoroSession.query.filter(
-            PomodoroSession.user_id == current_user_id,
-            PomodoroSession.type == 'work',
-            func.date(PomodoroSession.completed_at) == today
-        ).all()
-        logger.debug(f"Found {len(today_pomodoros)} pomodoros for today")
-        
-        # This week's pomodoros
-        week_pomodoros = PomodoroSession.query.filter(
-            PomodoroSession.user_id == current_user_id,
-            PomodoroSession.type == 'work',
-            PomodoroSession.completed_at >= week_start
-        ).all()
-        logger.debug(f"Found {len(week_pomodoros)} pomodoros for this week")
-        
-        # Calculate focus time
-        today_focus_time = sum(p.duration for p in today_pomodoros)
-        week_focus_time = sum(p.duration for p in week_pomodoros)
-        
-        result = {
-            'today': {
-                'count': len(today_pomodoros),
-                'focus_time': today_focus_time
-            },
-            'week': {
-                'count': len(week_pomodoros),
-                'focus_time': week_focus_time
-            }
-        }
-        logger.info(f"Returning pomodoro stats: today={result['today']['count']}, week={result['week']['count']}")
+        result = dashboard.pomodoro_stats(db.session, PomodoroSession.__table__, Task.__table__,
+                                          current_user_id, date.today())
+        logger.info("Returning pomodoro stats", extra={
+            'user_id': current_user_id,
+            'today_count': result['today']['count'],
+            'week_count': result['week']['count']
+        })
         return jsonify(result), 200
     except Exception as e:
-        logger.error(f"Failed to get pomodoro stats: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
+        logger.error("Failed to get pomodoro stats: %s", e, extra={'error_type': type(e).__name__})
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/recurring-tasks', methods=['GET'])
 @jwt_required()
+@read_routing.reads
 def get_recurring_tasks():
     """Get all recurring task templates for the user"""
     try:
         current_user_id = int(get_jwt_identity())
         
-        recurring_tasks = Task.query.filter_by(
-            user_id=current_user_id,
-            is_recurring=True
-        ).filter(Task.recurring_parent_id.is_(None)).order_by(Task.created_at.desc()).all()
+        recurring_tasks = task_reads.recurring_templates(db.session, Task.__table__, current_user_id)
         
-        return jsonify({'recurring_tasks': [task.to_dict() for task in recurring_tasks]}), 200
+        return jsonify({'recurring_tasks': [task_reads.task_dict(row) for row in recurring_tasks]}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -648,7 +964,8 @@ def update_recurring_task(task_id):
         task = Task.query.filter_by(
             id=task_id, 
             user_id=current_user_id,
-            is_recurring=True
+            is_recurring=True,
+            deleted_at=None
         ).first()
 
         if not task:
@@ -666,10 +983,25 @@ def update_recurring_task(task_id):
             task.recurrence_type = data['recurrence_type']
         if 'recurrence_days' in data:
             task.recurrence_days = data['recurrence_days']
+        task.change_seq = next_change_seq(current_user_id)
+
+        # Open instances due today or later follow the template, in one statement however
+        # many instances it has; past and completed ones keep what they were created with
+        changes = {field: getattr(task, field) for field in ('title', 'description', 'priority') if field in data}
+        propagated = 0
+        if changes:
+            propagated = db.session.execute(
+                Task.__table__.update()
+                .where(Task.recurring_parent_id == task.id, Task.user_id == current_user_id,
+                       Task.due_date >= date.today(), Task.completed.isnot(True), Task.deleted_at.is_(None))
+                .values(**changes, change_seq=task.change_seq)
+            ).rowcount
 
         db.session.commit()
+        plan_cache.invalidate(current_user_id)
 
-        return jsonify({'message': 'Recurring task updated successfully', 'task': task.to_dict()}), 200
+        return jsonify({'message': 'Recurring task updated successfully', 'task': task.to_dict(),
+                        'instances_updated': propagated}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -677,26 +1009,180 @@ def update_recurring_task(task_id):
 @app.route('/api/recurring-tasks/<int:task_id>', methods=['DELETE'])
 @jwt_required()
 def delete_recurring_task(task_id):
-    """Delete a recurring task template (does not delete generated instances)"""
+    """Delete a recurring task template. Generated instances are kept (the purge detaches them
+    from it); with ?delete_future=true the open ones due today or later are deleted too"""
     try:
         current_user_id = int(get_jwt_identity())
-        task = Task.query.filter_by(
-            id=task_id, 
-            user_id=current_user_id,
-            is_recurring=True
-        ).first()
-
-        if not task:
+        tasks = Task.__table__
+        now = datetime.utcnow()
+        change_seq = next_change_seq(current_user_id)
+        # Soft deletes: one UPDATE each, however many instances and sessions the template has
+        found = db.session.execute(
+            tasks.update().where(tasks.c.id == task_id, tasks.c.user_id == current_user_id,
+                                 tasks.c.is_recurring.is_(True), tasks.c.deleted_at.is_(None))
+            .values(deleted_at=now, change_seq=change_seq)
+        ).rowcount
+
+        if not found:
             return jsonify({'error': 'Recurring task not found'}), 404
 
-        db.session.delete(task)
+        deleted = 0
+        if request.args.get('delete_future', '').lower() in ('1', 'true', 'yes'):
+            deleted = db.session.execute(
+                tasks.update().where(tasks.c.recurring_parent_id == task_id, tasks.c.user_id == current_user_id,
+                                     tasks.c.due_date >= date.today(), tasks.c.completed.isnot(True),
+                                     tasks.c.deleted_at.is_(None))
+                .values(deleted_at=now, change_seq=change_seq)
+            ).rowcount
+        schedule_purge()
         db.session.commit()
+        plan_cache.invalidate(current_user_id)
 
-        return jsonify({'message': 'Recurring task deleted successfully'}), 200
+        return jsonify({'message': 'Recurring task deleted successfully', 'instances_deleted': deleted}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/recurring-tasks/<int:task_id>/occurrences/<day>', methods=['PUT'])
+@jwt_required()
+def update_occurrence(task_id, day):
+    """Change one occurrence of a recurring task (completed, title, description, priority),
+    writing its row first if it has none yet (see occurrences.py)"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        try:
+            day = datetime.strptime(day, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'Dates must be formatted as YYYY-MM-DD'}), 400
+        data = request.get_json(silent=True) or {}
+        values = {field: data[field] for field in ('title', 'description', 'priority', 'completed') if field in data}
+        tasks = Task.__table__
+
+        # Taken first: it locks the user's row, so concurrent requests cannot both write the occurrence
+        change_seq = next_change_seq(current_user_id)
+        instance = occurrences.find_instance(db.session, tasks, current_user_id, task_id, day)
+        created = instance is None
+        if created:
+            template = occurrences.find_template(db.session, tasks, current_user_id, task_id)
+            if template is None or day < date.today() or not occurrences.occurs_on(template, day):
+                db.session.rollback()
+                return jsonify({'error': 'Occurrence not found'}), 404
+            instance_id = occurrences.materialize(db.session, tasks, current_user_id, template, day, change_seq)
+        elif instance.deleted_at is not None:
+            db.session.rollback()
+            return jsonify({'error': 'Occurrence was skipped'}), 404
+        else:
+            instance_id = instance.id
+
+        task, completion_changed = task_writes.update_fields(db.session, tasks, instance_id, current_user_id,
+                                                             values, change_seq)
+        if completion_changed:
+            activity.record(db.session, UserActivity.__table__, current_user_id, task.due_date,
+                            1 if task.completed else -1)
+        db.session.commit()
+        plan_cache.task_changed(current_user_id, planner.plan_task(task), task.change_seq)
+
+        return jsonify({'message': 'Occurrence updated successfully', 'task': task_writes.task_dict(task)}), \
+            201 if created else 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/recurring-tasks/<int:task_id>/occurrences/<day>', methods=['DELETE'])
+@jwt_required()
+def skip_occurrence(task_id, day):
+    """Skip one occurrence of a recurring task: its row is deleted, or written already deleted
+    if it has none yet, which keeps the day from being generated"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        try:
+            day = datetime.strptime(day, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'Dates must be formatted as YYYY-MM-DD'}), 400
+        tasks = Task.__table__
+        now = datetime.utcnow()
+
+        change_seq = next_change_seq(current_user_id)
+        instance = occurrences.find_instance(db.session, tasks, current_user_id, task_id, day)
+        if instance is None:
+            template = occurrences.find_template(db.session, tasks, current_user_id, task_id)
+            if template is None or day < date.today() or not occurrences.occurs_on(template, day):
+                db.session.rollback()
+                return jsonify({'error': 'Occurrence not found'}), 404
+            occurrences.materialize(db.session, tasks, current_user_id, template, day, change_seq, deleted_at=now)
+        elif instance.deleted_at is not None:
+            db.session.rollback()
+            return jsonify({'error': 'Occurrence was skipped'}), 404
+        else:
+            db.session.execute(tasks.update().where(tasks.c.id == instance.id)
+                               .values(deleted_at=now, change_seq=change_seq))
+        schedule_purge()
+        db.session.commit()
+        if instance is not None:
+            plan_cache.task_removed(current_user_id, instance.id, change_seq)
+
+        return jsonify({'message': 'Occurrence skipped'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+def admin_request():
+    """True if the request carries X-Admin-Token matching ADMIN_TOKEN"""
+    token = os.environ.get('ADMIN_TOKEN')
+    return bool(token) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    if not admin_request():
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({
+        'rate_limit': rate_limiter.metrics() if rate_limiter is not None else None,
+        'read_replica': read_routing.stats if read_routing.engine is not None else None,
+        'jobs': job_queue.metrics(),
+        'slow_queries': len(slow_query_recorder.ring) if slow_query_recorder is not None else None,
+    }), 200
+
+@app.route('/api/admin/purge', methods=['POST'])
+def purge_deleted():
+    """Hard-delete soft-deleted rows for up to ?max_seconds (default 5); call again while
+    `complete` is false"""
+    if not admin_request():
+        return jsonify({'error': 'Not found'}), 404
+    summary = soft_delete.purge(
+        db.engine, SOFT_DELETE_TABLES,
+        min_age_seconds=request.args.get('min_age_seconds', purge_min_age_seconds, type=int),
+        batch_size=int(os.environ.get('PURGE_BATCH_SIZE', 500)),
+        max_seconds=request.args.get('max_seconds', 5, type=float)
+    )
+    return jsonify(summary), 200
+
+@app.route('/api/admin/jobs', methods=['POST'])
+def enqueue_job():
+    """Queue a job (body: kind, payload, priority, delay_seconds, dedup_key) and return at once"""
+    if not admin_request():
+        return jsonify({'error': 'Not found'}), 404
+    data = request.get_json(silent=True) or {}
+    if data.get('kind') not in job_queue.handlers:
+        return jsonify({'error': f"kind must be one of: {', '.join(sorted(job_queue.handlers))}"}), 400
+    try:
+        options = {'priority': int(data.get('priority', 0)), 'delay_seconds': float(data.get('delay_seconds', 0))}
+    except (TypeError, ValueError):
+        return jsonify({'error': 'priority and delay_seconds must be numbers'}), 400
+    ids = []
+    for engine in job_queue.engines:
+        with engine.begin() as conn:
+            ids.append(jobs.enqueue(conn, job_table, data['kind'], data.get('payload'),
+                                    dedup_key=data.get('dedup_key'), **options))
+    start_jobs()
+    return jsonify({'jobs': ids}), 202
+
+@app.route('/api/admin/jobs/run', methods=['POST'])
+def run_jobs():
+    """Run due jobs for up to ?max_seconds (default 5); call again while `complete` is false"""
+    if not admin_request():
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(job_queue.run_for(request.args.get('max_seconds', 5, type=float))), 200
+
 @app.route('/api/health', methods=['GET'])
 def health():
     return jsonify({'status': 'healthy', 'database': 'postgresql'}), 200
@@ -709,10 +1195,11 @@ try:
     with app.app_context():
         db.create_all()
         logger.info("Database tables created/verified successfully")
+        # No-op on SQLite or when the tables are not partitioned (see partitioning.py)
+        partitioning.ensure_future_partitions(db.engine, int(os.environ.get('PARTITION_MONTHS_AHEAD', 3)))
 except Exception as e:
     # Log but don't fail - tables might already exist
-    logger.error(f"Database initialization failed: {str(e)}")
-    logger.error(f"Error type: {type(e).__name__}")
+    logger.error("Database initialization failed: %s", e, extra={'error_type': type(e).__name__})
 
 logger.info("Flask app initialized and ready for Vercel")
 
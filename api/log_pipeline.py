@@ -0,0 +1,156 @@
+"""
+Non-blocking logging pipeline.
+
+Request threads only put records on an in-memory queue; a background
+QueueListener thread formats them and writes to stdout. Records are emitted as
+one JSON object per line, and message formatting (`msg % args`) happens on the
+writer thread, so callers should log with `%s` placeholders instead of
+f-strings and pass structured fields through `extra`.
+
+INFO and DEBUG records are rate limited per route (Flask endpoint, or logger
+name outside a request) with a token bucket and can additionally be sampled.
+WARNING and above are never dropped.
+
+Environment:
+    LOG_LEVEL          root level (default INFO)
+    LOG_FORMAT         json (default) or text
+    LOG_ASYNC          1 (default) for the queue handler, 0 to write inline
+    LOG_INFO_RATE      INFO records per second per route (default 20, 0 = unlimited)
+    LOG_INFO_BURST     bucket size per route (default 50)
+    LOG_INFO_SAMPLE    fraction of INFO records kept after rate limiting (default 1.0)
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+_PRIMITIVES = (str, int, float, bool, type(None))
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; non-standard record attributes become fields"""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith('_'):
+                payload[key] = value if isinstance(value, _PRIMITIVES) else repr(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload)
+
+
+class LazyQueueHandler(QueueHandler):
+    """QueueHandler that defers message formatting to the listener thread.
+
+    The stock handler formats every record on the calling thread before
+    enqueueing it. Here only what cannot safely cross threads is resolved:
+    tracebacks are rendered and mutable arguments are snapshotted with repr.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.args:
+            args = record.args if isinstance(record.args, tuple) else (record.args,)
+            if not all(isinstance(arg, _PRIMITIVES) for arg in args):
+                record.msg = record.getMessage()
+                record.args = None
+        return record
+
+
+class RouteRateLimitFilter(logging.Filter):
+    """Token bucket per route for INFO/DEBUG records; warnings and errors always pass"""
+
+    def __init__(self, rate=20.0, burst=50, sample=1.0):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample = sample
+        self.dropped = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _route(record):
+        try:
+            from flask import has_request_context, request
+            if has_request_context():
+                return request.endpoint or request.path
+        except ImportError:
+            pass
+        return record.name
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.sample < 1.0 and random.random() >= self.sample:
+            self.dropped += 1
+            return False
+        if not self.rate:
+            return True
+        route = self._route(record)
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(route, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[route] = (tokens, now)
+                self.dropped += 1
+                return False
+            self._buckets[route] = (tokens - 1, now)
+        return True
+
+
+def configure_logging(stream=None):
+    """Install the pipeline on the root logger; returns the listener (or None when inline)"""
+    stream = stream or sys.stdout
+    level = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    if os.environ.get('LOG_FORMAT', 'json') == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+
+    writer = logging.StreamHandler(stream)
+    writer.setFormatter(formatter)
+
+    rate_filter = RouteRateLimitFilter(
+        rate=float(os.environ.get('LOG_INFO_RATE', 20)),
+        burst=int(os.environ.get('LOG_INFO_BURST', 50)),
+        sample=float(os.environ.get('LOG_INFO_SAMPLE', 1.0)),
+    )
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(level)
+
+    if os.environ.get('LOG_ASYNC', '1') == '0':
+        writer.addFilter(rate_filter)
+        root.addHandler(writer)
+        return None
+
+    log_queue = queue.SimpleQueue()
+    handler = LazyQueueHandler(log_queue)
+    handler.addFilter(rate_filter)
+    root.addHandler(handler)
+    listener = QueueListener(log_queue, writer, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
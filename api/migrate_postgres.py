@@ -1,45 +1,41 @@
 """
 Database migration script for PostgreSQL on Vercel
-Run this once to create all tables in your PostgreSQL database
+Run this to create all tables in your PostgreSQL database and apply pending
+schema migrations (see migrations.py)
 """
-import os
+import sys
+
+import migrations
 from index import app, db
 
-def init_database():
-    """Initialize database tables"""
+def init_database(argv=None):
+    """Initialize database tables, then bring existing ones up to date"""
     print("🔄 Starting database migration...")
     print(f"Database URL: {app.config['SQLALCHEMY_DATABASE_URI'][:30]}...")
-    
 
     with app.app_context():
         try:
-            # Create all tables
-            #changes
-
+            # Create missing tables (existing tables are left untouched)
             db.create_all()
             print("✅ Database tables created successfully!")
-            
+
             # List created tables
             from sqlalchemy import inspect
             inspector = inspect(db.engine)
             tables = inspector.get_table_names()
             print(f"\n📋 Created tables: {', '.join(tables)}")
-            
-            return True
+
+            # Columns and indexes added since the tables were first created
+            return migrations.main(argv or ['up'], engine=db.engine) == 0
         except Exception as e:
             print(f"❌ Error creating tables: {e}")
             return False
 
 if __name__ == '__main__':
-    success = init_database()
+    success = init_database(sys.argv[1:])
     if success:
         print("\n🎉 Database initialization complete!")
         print("Your Pomovity database is ready to use.")
     else:
         print("\n⚠️  Database initialization failed!")
         print("Please check your DATABASE_URL environment variable.")
-
-
-
-
-
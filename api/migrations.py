@@ -0,0 +1,461 @@
+"""
+Versioned, online schema migrations for SQLite and PostgreSQL.
+
+Applied versions are recorded in `schema_migrations`; running the tool again
+only applies what is missing. Every step is idempotent, so a migration that
+was interrupted half-way can simply be run again.
+
+Steps are written to keep tables available while they run:
+- Indexes are built with CREATE INDEX CONCURRENTLY on PostgreSQL (outside a
+  transaction). Partitioned tables do not support CONCURRENTLY, so the index is
+  created on the parent only and each partition's index is built concurrently
+  and attached. An invalid index left by an earlier failed build is dropped
+  and rebuilt. Indexes are dropped concurrently too. An index that a later
+  migration of the same run drops again (replaced by a better one) is not
+  built at all.
+- Column additions take a short `lock_timeout` on PostgreSQL and retry instead
+  of queueing behind long transactions (and blocking every query behind them).
+- Backfills update primary-key ranges in separate small transactions, sleep
+  between batches, report progress and store a checkpoint in
+  `schema_migration_progress` in the same transaction as each batch, so they
+  resume where they stopped.
+
+On SQLite there is no concurrent index build; statements are short and the
+database is a single file, so they are run as-is.
+
+Usage:
+    python migrations.py status
+    python migrations.py up --batch-size 1000 --sleep-ms 20
+    python migrations.py up --target 0002
+"""
+import argparse
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import (Column, DateTime, ForeignKey, Integer, LargeBinary, MetaData, String,
+                        Table, create_engine, inspect, text)
+from sqlalchemy.exc import OperationalError
+
+import activity
+import archive
+import jobs
+import search
+import task_counters
+from db_url import database_url_from_env
+
+logger = logging.getLogger(__name__)
+
+ADVISORY_LOCK_ID = 720_134  # serializes concurrent runners on PostgreSQL
+
+bookkeeping = MetaData()
+schema_migrations = Table(
+    'schema_migrations', bookkeeping,
+    Column('version', String(32), primary_key=True),
+    Column('description', String(200)),
+    Column('applied_at', DateTime, default=datetime.utcnow),
+)
+schema_migration_progress = Table(
+    'schema_migration_progress', bookkeeping,
+    Column('step', String(100), primary_key=True),
+    Column('last_id', Integer, nullable=False),
+    Column('updated_at', DateTime, default=datetime.utcnow, onupdate=datetime.utcnow),
+)
+
+
+def _quote(engine, name):
+    return engine.dialect.identifier_preparer.quote(name)
+
+
+def _is_postgres(engine):
+    return engine.dialect.name == 'postgresql'
+
+
+class Options:
+    def __init__(self, batch_size=1000, sleep_ms=0, lock_timeout_ms=5000, retries=5):
+        self.batch_size = batch_size
+        self.sleep_ms = sleep_ms
+        self.lock_timeout_ms = lock_timeout_ms
+        self.retries = retries
+
+
+# Steps
+
+class AddColumn:
+    def __init__(self, table, column, ddl):
+        self.table, self.column, self.ddl = table, column, ddl
+
+    def describe(self):
+        return f'add column {self.table}.{self.column}'
+
+    def apply(self, engine, key, options):
+        if self.column in {c['name'] for c in inspect(engine).get_columns(self.table)}:
+            return
+        statement = text(f'ALTER TABLE {_quote(engine, self.table)} ADD COLUMN {self.column} {self.ddl}')
+        if not _is_postgres(engine):
+            with engine.begin() as conn:
+                conn.execute(statement)
+            return
+        for attempt in range(1, options.retries + 1):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f"SET LOCAL lock_timeout = '{options.lock_timeout_ms}ms'"))
+                    conn.execute(statement)
+                return
+            except OperationalError as e:
+                if 'lock timeout' not in str(e) or attempt == options.retries:
+                    raise
+                logger.warning('Lock timeout adding %s.%s, retrying (%s/%s)',
+                               self.table, self.column, attempt, options.retries)
+                time.sleep(min(2 ** attempt, 30))
+
+
+def _index_state(conn, name):
+    """(indisvalid, relkind) of the index, or None if there is none"""
+    return conn.execute(text(
+        "SELECT i.indisvalid, c.relkind FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND c.relnamespace = 'public'::regnamespace"
+    ), {'name': name}).first()
+
+
+class CreateIndex:
+    def __init__(self, name, table, columns, using=None, where=None):
+        self.name, self.table, self.columns = name, table, columns
+        self.using = f' USING {using}' if using else ''
+        self.where = f' WHERE {where}' if where else ''
+
+    def describe(self):
+        return f'create index {self.name}'
+
+    def apply(self, engine, key, options):
+        columns = ', '.join(self.columns)
+        table = _quote(engine, self.table)
+        if not _is_postgres(engine):
+            with engine.begin() as conn:
+                conn.execute(text(f'CREATE INDEX IF NOT EXISTS {self.name} ON {table}{self.using} ({columns}){self.where}'))
+            return
+
+        with engine.connect() as conn:
+            conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+            state = _index_state(conn, self.name)
+            if state is not None and state.indisvalid:
+                return
+            # A partitioned table's index stays invalid until every partition's index is
+            # attached: the loop below finishes what an interrupted run left out
+            if state is not None and state.relkind != 'I':
+                # Left behind by an interrupted CONCURRENTLY build
+                logger.warning('Rebuilding invalid index %s', self.name)
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {self.name}'))
+
+            partitions = conn.execute(text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = CAST(:table AS regclass)"
+            ), {'table': table}).scalars().all()
+            if not partitions:
+                conn.execute(text(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {self.name} ON {table}{self.using} ({columns}){self.where}'
+                ))
+                return
+
+            # Partitioned parent: an invalid index on the parent alone, then one
+            # concurrent build per partition, attached as it completes
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS {self.name} ON ONLY {table}{self.using} ({columns}){self.where}'))
+            for partition in partitions:
+                child = f'{partition}_{self._suffix()}'
+                child_state = _index_state(conn, child)
+                if child_state is not None and not child_state.indisvalid:
+                    logger.warning('Rebuilding invalid index %s', child)
+                    conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{child}"'))
+                conn.execute(text(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{child}" ON "{partition}"{self.using} ({columns}){self.where}'
+                ))
+                attached = conn.execute(text(
+                    "SELECT 1 FROM pg_inherits WHERE inhrelid = CAST(:child AS regclass)"
+                ), {'child': f'"{child}"'}).first()
+                if not attached:
+                    conn.execute(text(f'ALTER INDEX {self.name} ATTACH PARTITION "{child}"'))
+
+
+    def _suffix(self):
+        # Same names PostgreSQL gives partition indexes of plain column indexes
+        if all(c.isidentifier() for c in self.columns) and not self.where:
+            return '_'.join(self.columns) + '_idx'
+        return self.name
+
+
+class DropIndex:
+    def __init__(self, name):
+        self.name = name
+
+    def describe(self):
+        return f'drop index {self.name}'
+
+    def apply(self, engine, key, options):
+        if not _is_postgres(engine):
+            with engine.begin() as conn:
+                conn.execute(text(f'DROP INDEX IF EXISTS {self.name}'))
+            return
+        with engine.connect() as conn:
+            conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+            kind = conn.execute(text(
+                "SELECT relkind FROM pg_class WHERE relname = :name AND relnamespace = 'public'::regnamespace"
+            ), {'name': self.name}).scalar()
+            if kind is None:
+                return
+            # An index on a partitioned table cannot be dropped concurrently; dropping
+            # the parent index drops the partitions' indexes with it
+            concurrently = '' if kind == 'I' else ' CONCURRENTLY'
+            conn.execute(text(f'DROP INDEX{concurrently} IF EXISTS {self.name}'))
+
+
+class Backfill:
+    """UPDATE <table> SET <assignments> WHERE <where>, in primary-key ranges"""
+
+    def __init__(self, table, assignments, where='TRUE', params=None):
+        self.table, self.assignments, self.where = table, assignments, where
+        self.params = params or {}
+
+    def describe(self):
+        return f'backfill {self.table}'
+
+    def apply(self, engine, key, options):
+        table = _quote(engine, self.table)
+        with engine.connect() as conn:
+            low, high = conn.execute(text(f'SELECT MIN(id), MAX(id) FROM {table}')).one()
+            checkpoint = conn.execute(
+                schema_migration_progress.select().where(schema_migration_progress.c.step == key)
+            ).first()
+        if low is None:
+            return
+        start = checkpoint.last_id + 1 if checkpoint else low
+        if checkpoint:
+            logger.info('Resuming %s after id %s', key, checkpoint.last_id)
+
+        statement = text(
+            f'UPDATE {table} SET {self.assignments} WHERE id BETWEEN :lo AND :hi AND ({self.where})'
+        )
+        updated = 0
+        started = time.monotonic()
+        while start <= high:
+            end = min(start + options.batch_size - 1, high)
+            with engine.begin() as conn:
+                if _is_postgres(engine):
+                    conn.execute(text(f"SET LOCAL lock_timeout = '{options.lock_timeout_ms}ms'"))
+                updated += conn.execute(statement, {'lo': start, 'hi': end, **self.params}).rowcount or 0
+                _save_checkpoint(conn, key, end)
+            done = (end - low + 1) / (high - low + 1) * 100
+            logger.info('%s: ids up to %s (%.1f%%), %s rows updated, %.1fs',
+                        key, end, done, updated, time.monotonic() - started)
+            start = end + 1
+            if options.sleep_ms and start <= high:
+                time.sleep(options.sleep_ms / 1000.0)
+
+
+class RunPython:
+    def __init__(self, description, fn):
+        self.description, self.fn = description, fn
+
+    def describe(self):
+        return self.description
+
+    def apply(self, engine, key, options):
+        self.fn(engine)
+
+
+def _save_checkpoint(conn, key, last_id):
+    updated = conn.execute(
+        schema_migration_progress.update().where(schema_migration_progress.c.step == key).values(last_id=last_id)
+    ).rowcount
+    if not updated:
+        conn.execute(schema_migration_progress.insert().values(step=key, last_id=last_id))
+
+
+def _create_user_activity(engine):
+    # Mirrors the UserActivity model (see activity.py)
+    metadata = MetaData()
+    metadata.reflect(engine, only=['user'])
+    table = Table(
+        'user_activity', metadata,
+        Column('user_id', Integer, ForeignKey('user.id'), primary_key=True),
+        Column('year', Integer, primary_key=True, autoincrement=False),
+        Column('days', LargeBinary, nullable=False),
+    )
+    table.create(engine, checkfirst=True)
+    # The apps only count what happens from now on: fill in the past from the raw tables
+    with engine.begin() as conn:
+        activity.rebuild(conn, table, archive.reflect_tables(engine))
+
+
+# Ordered list of (version, description, steps)
+MIGRATIONS = [
+    ('0001', 'Recurring task columns', [
+        AddColumn('task', 'is_recurring', 'BOOLEAN DEFAULT FALSE'),
+        AddColumn('task', 'recurrence_type', 'VARCHAR(20)'),
+        AddColumn('task', 'recurrence_days', 'VARCHAR(50)'),
+        AddColumn('task', 'recurring_parent_id', 'INTEGER REFERENCES task(id)'),
+        # Rows written before the column had a default read as NULL
+        Backfill('task', 'is_recurring = :false', 'is_recurring IS NULL', {'false': False}),
+    ]),
+    ('0002', 'Range indexes for analytics and stats', [
+        CreateIndex('ix_task_user_id_due_date', 'task', ('user_id', 'due_date')),
+        CreateIndex('ix_pomodoro_session_user_id_completed_at', 'pomodoro_session', ('user_id', 'completed_at')),
+    ]),
+    ('0003', 'Archive tables', [
+        RunPython('create task_archive and pomodoro_session_archive', archive.reflect_tables),
+    ]),
+    ('0004', 'Per-user activity counters', [
+        RunPython('create and fill user_activity', _create_user_activity),
+    ]),
+    ('0005', 'Per-task pomodoro counters', [
+        AddColumn('task', 'work_pomodoro_count', 'INTEGER NOT NULL DEFAULT 0'),
+        AddColumn('task', 'focus_minutes', 'INTEGER NOT NULL DEFAULT 0'),
+        AddColumn('task_archive', 'work_pomodoro_count', 'INTEGER NOT NULL DEFAULT 0'),
+        AddColumn('task_archive', 'focus_minutes', 'INTEGER NOT NULL DEFAULT 0'),
+        # Only tasks that have sessions need a write; the rest keep the default 0
+        Backfill('task', task_counters.recompute_sql('task', 'pomodoro_session'),
+                 'EXISTS (SELECT 1 FROM pomodoro_session s WHERE s.task_id = task.id)'),
+        Backfill('task_archive', task_counters.recompute_sql('task_archive', 'pomodoro_session_archive'),
+                 'EXISTS (SELECT 1 FROM pomodoro_session_archive s WHERE s.task_id = task_archive.id)'),
+    ]),
+    ('0006', 'Full-text task search', [
+        # PostgreSQL: GIN expression index, built concurrently; SQLite: FTS5 table and triggers
+        RunPython('create the full-text search index', search.ensure_index),
+    ]),
+    ('0007', 'Indexes for recurring templates and task deletes', [
+        # Template edits and deletes touch the instances with one statement each
+        CreateIndex('ix_task_recurring_parent_id_due_date', 'task', ('recurring_parent_id', 'due_date')),
+        # Sessions are deleted by task_id along with their task
+        CreateIndex('ix_pomodoro_session_task_id', 'pomodoro_session', ('task_id',)),
+    ]),
+    ('0008', 'Soft deletes', [
+        AddColumn('task', 'deleted_at', 'TIMESTAMP'),
+        AddColumn('task_archive', 'deleted_at', 'TIMESTAMP'),
+        AddColumn('user', 'deleted_at', 'TIMESTAMP'),
+        # Read paths only see live tasks, so their index leaves the deleted ones out...
+        CreateIndex('ix_task_live_user_id_due_date', 'task', ('user_id', 'due_date'), where='deleted_at IS NULL'),
+        DropIndex('ix_task_user_id_due_date'),
+        # ...and the purge finds those through an index holding nothing else
+        CreateIndex('ix_task_deleted_user_id', 'task', ('user_id',), where='deleted_at IS NOT NULL'),
+        CreateIndex('ix_user_deleted_at', 'user', ('deleted_at',), where='deleted_at IS NOT NULL'),
+    ]),
+    ('0009', 'Change numbers for delta sync', [
+        AddColumn('user', 'change_seq', 'INTEGER NOT NULL DEFAULT 0'),
+        AddColumn('user', 'purged_seq', 'INTEGER NOT NULL DEFAULT 0'),
+        AddColumn('task', 'change_seq', 'INTEGER NOT NULL DEFAULT 0'),
+        AddColumn('task_archive', 'change_seq', 'INTEGER NOT NULL DEFAULT 0'),
+        AddColumn('pomodoro_session', 'change_seq', 'INTEGER NOT NULL DEFAULT 0'),
+        AddColumn('pomodoro_session_archive', 'change_seq', 'INTEGER NOT NULL DEFAULT 0'),
+        # GET /api/sync scans each user's rows by change number; existing rows keep 0
+        CreateIndex('ix_task_user_id_change_seq', 'task', ('user_id', 'change_seq')),
+        CreateIndex('ix_pomodoro_session_user_id_change_seq', 'pomodoro_session', ('user_id', 'change_seq')),
+    ]),
+    ('0010', 'Occurrence dates of recurring instances', [
+        AddColumn('task', 'occurrence_date', 'DATE'),
+        AddColumn('task_archive', 'occurrence_date', 'DATE'),
+        # Instances were generated for the day they are due; moved ones cannot be told apart
+        Backfill('task', 'occurrence_date = due_date', 'recurring_parent_id IS NOT NULL'),
+        Backfill('task_archive', 'occurrence_date = due_date', 'recurring_parent_id IS NOT NULL'),
+        # Generation and the calendar look instances up by template and day
+        CreateIndex('ix_task_recurring_parent_id_occurrence_date', 'task', ('recurring_parent_id', 'occurrence_date')),
+        DropIndex('ix_task_recurring_parent_id_due_date'),
+    ]),
+    ('0011', 'Job queue', [
+        RunPython('create job', jobs.create_table),
+    ]),
+]
+
+
+def applied_versions(engine):
+    bookkeeping.create_all(engine)
+    with engine.connect() as conn:
+        return {row.version: row.applied_at for row in conn.execute(schema_migrations.select())}
+
+
+def pending(engine, target=None):
+    applied = applied_versions(engine)
+    return [m for m in MIGRATIONS if m[0] not in applied and (target is None or m[0] <= target)]
+
+
+def dropped_later(migrations):
+    """{version: names of the indexes that a later one of `migrations` drops}"""
+    later, result = set(), {}
+    for version, _, steps in reversed(migrations):
+        result[version] = set(later)
+        later |= {step.name for step in steps if isinstance(step, DropIndex)}
+    return result
+
+
+def apply_migration(engine, migration, options, skip_indexes=()):
+    version, description, steps = migration
+    logger.info('Applying %s: %s', version, description)
+    for index, step in enumerate(steps):
+        if isinstance(step, CreateIndex) and step.name in skip_indexes:
+            logger.info('  %s: skipped, a later migration drops it', step.describe())
+            continue
+        logger.info('  %s', step.describe())
+        step.apply(engine, f'{version}:{index}', options)
+    with engine.begin() as conn:
+        conn.execute(schema_migration_progress.delete().where(
+            schema_migration_progress.c.step.like(f'{version}:%')
+        ))
+        conn.execute(schema_migrations.insert().values(version=version, description=description))
+
+
+def migrate(engine, target=None, options=None):
+    """Apply pending migrations in order; returns the versions applied"""
+    options = options or Options()
+    lock = None
+    if _is_postgres(engine):
+        lock = engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        lock.execute(text('SELECT pg_advisory_lock(:id)'), {'id': ADVISORY_LOCK_ID})
+    try:
+        applied = []
+        migrations = pending(engine, target)
+        # e.g. a fresh database gets 0008's partial index without building 0002's first
+        skip = dropped_later(migrations)
+        for migration in migrations:
+            apply_migration(engine, migration, options, skip[migration[0]])
+            applied.append(migration[0])
+        return applied
+    finally:
+        if lock is not None:
+            lock.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': ADVISORY_LOCK_ID})
+            lock.close()
+
+
+def main(argv=None, engine=None):
+    parser = argparse.ArgumentParser(description='Versioned online schema migrations')
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL or instance/tasks.db')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('status')
+    up = sub.add_parser('up')
+    up.add_argument('--target', help='Stop after this version')
+    up.add_argument('--batch-size', type=int, default=1000, help='Rows per backfill transaction')
+    up.add_argument('--sleep-ms', type=int, default=20, help='Pause between backfill batches')
+    up.add_argument('--lock-timeout-ms', type=int, default=5000, help='PostgreSQL only')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    engine = engine or create_engine(database_url_from_env(args.database_url))
+    if 'task' not in inspect(engine).get_table_names():
+        print("❌ No task table found - start the app once to create the base schema")
+        return 1
+
+    if args.command in (None, 'status'):
+        applied = applied_versions(engine)
+        for version, description, _ in MIGRATIONS:
+            when = applied.get(version)
+            print(f"{'✓' if when else '○'} {version} {description}"
+                  + (f" (applied {when:%Y-%m-%d %H:%M})" if when else ''))
+        return 0
+
+    options = Options(args.batch_size, args.sleep_ms, args.lock_timeout_ms)
+    applied = migrate(engine, args.target, options)
+    print(f"✅ Applied {len(applied)} migrations: {', '.join(applied)}" if applied
+          else "✓ Database is already up to date. No migrations needed.")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,286 @@
+"""
+Optional monthly range partitioning on PostgreSQL.
+
+`pomodoro_session` is an append-only event table read by `completed_at`
+ranges, and `task` is read by `due_date`, so both can be declaratively
+partitioned by month. Queries that filter on a range of the partition key
+(today, this week, a month of stats) then only touch the matching partitions.
+
+SQLite deployments are unaffected: every entry point is a no-op unless the
+engine is PostgreSQL.
+
+Notes on the migration:
+- Runs in one transaction holding an ACCESS EXCLUSIVE lock on the table, so
+  schedule it in a quiet window. The old table is kept as
+  `<table>_unpartitioned` unless --drop-old is given.
+- The primary key becomes (id, <partition column>) because PostgreSQL requires
+  unique constraints on a partitioned table to include the partition key. Ids
+  stay unique through the existing sequence.
+- Every other index of the table is recreated on the partitioned one under
+  its own name (the old table's copies get an `_unpartitioned` suffix), with
+  the partition key appended to unique ones. An index that cannot be carried
+  over aborts the migration.
+- Partitioning `task` drops the foreign keys pointing at it
+  (pomodoro_session.task_id, task.recurring_parent_id): a foreign key needs a
+  unique constraint on the referenced column alone. The app always filters by
+  id and user, so integrity is kept at the application level.
+
+Usage:
+    python partitioning.py status
+    python partitioning.py migrate --table pomodoro_session --months-ahead 3
+    python partitioning.py migrate --table task
+    python partitioning.py ensure --months-ahead 3      # create upcoming partitions
+"""
+import argparse
+import logging
+from datetime import date
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+
+from db_url import database_url_from_env
+
+logger = logging.getLogger(__name__)
+
+# Partitioned table -> partition key column
+PARTITION_KEYS = {
+    'pomodoro_session': 'completed_at',
+    'task': 'due_date',
+}
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table, start):
+    return f'{table}_p{start.year:04d}_{start.month:02d}'
+
+
+def is_postgres(engine_or_conn):
+    return engine_or_conn.dialect.name == 'postgresql'
+
+
+def is_partitioned(conn, table):
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = :table AND relnamespace = 'public'::regnamespace"),
+        {'table': table}
+    ).scalar()
+    return relkind == 'p'
+
+
+def existing_partitions(conn, table):
+    return set(conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table"
+    ), {'table': table}).scalars())
+
+
+def create_month_partitions(conn, table, first_month, last_month):
+    """Create monthly partitions covering [first_month, last_month], skipping existing ones"""
+    existing = existing_partitions(conn, table)
+    default = f'{table}_default'
+    key = PARTITION_KEYS[table]
+    created = []
+    current = month_start(first_month)
+    while current <= last_month:
+        name = partition_name(table, current)
+        bounds = f"FROM ('{current.isoformat()}') TO ('{add_months(current, 1).isoformat()}')"
+        if name not in existing:
+            if default in existing:
+                # Rows for this month may already sit in the default partition; move them
+                # into the new table before attaching it, or the attach would fail
+                conn.execute(text(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS)'))
+                moved = (f"{key} >= '{current.isoformat()}' AND {key} < '{add_months(current, 1).isoformat()}'")
+                conn.execute(text(f'INSERT INTO "{name}" SELECT * FROM "{default}" WHERE {moved}'))
+                conn.execute(text(f'DELETE FROM "{default}" WHERE {moved}'))
+                conn.execute(text(f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES {bounds}'))
+            else:
+                conn.execute(text(f'CREATE TABLE "{name}" PARTITION OF "{table}" FOR VALUES {bounds}'))
+            created.append(name)
+        current = add_months(current, 1)
+    return created
+
+
+def ensure_future_partitions(engine, months_ahead=3):
+    """Create partitions for the current month and the next `months_ahead` months.
+
+    Cheap when nothing is missing (one catalog query per table), so it is safe
+    to call on every cold start. Returns the names of the created partitions.
+    """
+    if not is_postgres(engine):
+        return []
+    this_month = month_start(date.today())
+    created = []
+    with engine.begin() as conn:
+        for table in PARTITION_KEYS:
+            if is_partitioned(conn, table):
+                created += create_month_partitions(conn, table, this_month, add_months(this_month, months_ahead))
+    if created:
+        logger.info('Created partitions: %s', ', '.join(created))
+    return created
+
+
+def _outgoing_foreign_keys(conn, table):
+    return conn.execute(text(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'"
+    ), {'table': table}).all()
+
+
+def _incoming_foreign_keys(conn, table):
+    return conn.execute(text(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+        # conparentid = 0 skips the per-partition clones of a partitioned table's constraint
+        "WHERE confrelid = CAST(:table AS regclass) AND contype = 'f' AND conparentid = 0"
+    ), {'table': f'"{table}"'}).all()
+
+
+def _indexes(conn, table):
+    """(name, CREATE INDEX statement) of every index on `table` except its primary key"""
+    return conn.execute(text(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = 'public' AND tablename = :table "
+        "AND indexname NOT IN (SELECT conindid::regclass::text FROM pg_constraint "
+        "WHERE conrelid = CAST(:quoted AS regclass) AND contype = 'p') ORDER BY indexname"
+    ), {'table': table, 'quoted': f'"{table}"'}).all()
+
+
+def _unpartitioned_name(name):
+    # Identifiers are cut at 63 bytes
+    return f'{name[:63 - len("_unpartitioned")]}_unpartitioned'
+
+
+def _with_partition_key(definition, key):
+    """A unique index's definition with the partition key among its columns, which
+    PostgreSQL requires on a partitioned table"""
+    start = definition.index('(', definition.index(' USING '))
+    depth = 0
+    for end in range(start, len(definition)):
+        depth += {'(': 1, ')': -1}.get(definition[end], 0)
+        if depth == 0:
+            break
+    if key in [column.strip().strip('"') for column in definition[start + 1:end].split(',')]:
+        return definition
+    return f'{definition[:end]}, {key}{definition[end:]}'
+
+
+def migrate_to_partitioned(engine, table, months_ahead=3, drop_old=False):
+    """Replace an ordinary table by a monthly range-partitioned copy of it"""
+    if not is_postgres(engine):
+        raise RuntimeError('Partitioning is only available on PostgreSQL')
+    key = PARTITION_KEYS[table]
+    old = f'{table}_unpartitioned'
+
+    with engine.begin() as conn:
+        if is_partitioned(conn, table):
+            logger.info('%s is already partitioned', table)
+            return False
+
+        conn.execute(text(f'LOCK TABLE "{table}" IN ACCESS EXCLUSIVE MODE'))
+
+        # Foreign keys pointing at this table cannot survive partitioning
+        for referencing, constraint in _incoming_foreign_keys(conn, table):
+            logger.warning('Dropping foreign key %s on %s (references %s)', constraint, referencing, table)
+            conn.execute(text(f'ALTER TABLE {referencing} DROP CONSTRAINT "{constraint}"'))
+        outgoing = [(name, definition) for name, definition in _outgoing_foreign_keys(conn, table)
+                    if not any(f'REFERENCES {t}(' in definition and is_partitioned(conn, t) for t in PARTITION_KEYS)]
+
+        # The partition key is part of the primary key, so it cannot be NULL
+        conn.execute(text(f'UPDATE "{table}" SET {key} = CURRENT_DATE WHERE {key} IS NULL'))
+        bounds = conn.execute(text(f'SELECT min({key}), max({key}) FROM "{table}"')).one()
+
+        # Rename the old table's indexes so that the partitioned table can take their names
+        indexes = _indexes(conn, table)
+        conn.execute(text(f'ALTER TABLE "{table}" RENAME TO "{old}"'))
+        for name, _ in indexes:
+            conn.execute(text(f'ALTER INDEX "{name}" RENAME TO "{_unpartitioned_name(name)}"'))
+        conn.execute(text(f'ALTER TABLE "{old}" RENAME CONSTRAINT "{table}_pkey" TO "{old}_pkey"'))
+        conn.execute(text(
+            f'CREATE TABLE "{table}" (LIKE "{old}" INCLUDING DEFAULTS) PARTITION BY RANGE ({key})'
+        ))
+        conn.execute(text(f'ALTER TABLE "{table}" ALTER COLUMN {key} SET NOT NULL'))
+        conn.execute(text(f'ALTER TABLE "{table}" ADD PRIMARY KEY (id, {key})'))
+        for name, definition in outgoing:
+            conn.execute(text(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}_p" {definition}'))
+        conn.execute(text(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY "{table}".id'))
+
+        this_month = month_start(date.today())
+        first = month_start(bounds[0]) if bounds[0] else this_month
+        last = max(month_start(bounds[1]) if bounds[1] else this_month, add_months(this_month, months_ahead))
+        created = create_month_partitions(conn, table, first, last)
+        # Catch-all for rows outside the created months (e.g. far-future due dates)
+        conn.execute(text(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT'))
+
+        conn.execute(text(f'INSERT INTO "{table}" SELECT * FROM "{old}"'))
+        for name, definition in indexes:
+            if definition.startswith('CREATE UNIQUE INDEX'):
+                definition = _with_partition_key(definition, key)
+            try:
+                conn.execute(text(definition))
+            except DBAPIError as error:
+                raise RuntimeError(f'Cannot recreate index {name} on the partitioned {table}: '
+                                   f'{error.orig}') from error
+
+        if drop_old:
+            conn.execute(text(f'DROP TABLE "{old}"'))
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level='AUTOCOMMIT').execute(text(f'ANALYZE "{table}"'))
+    logger.info('Partitioned %s by month on %s (%s partitions)', table, key, len(created))
+    return True
+
+
+def status(engine):
+    rows = []
+    with engine.connect() as conn:
+        for table in PARTITION_KEYS:
+            partitioned = is_partitioned(conn, table)
+            rows.append((table, partitioned, sorted(existing_partitions(conn, table)) if partitioned else []))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Monthly range partitioning on PostgreSQL')
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status')
+    migrate = sub.add_parser('migrate')
+    migrate.add_argument('--table', choices=sorted(PARTITION_KEYS), default='pomodoro_session')
+    migrate.add_argument('--months-ahead', type=int, default=3)
+    migrate.add_argument('--drop-old', action='store_true')
+    ensure = sub.add_parser('ensure')
+    ensure.add_argument('--months-ahead', type=int, default=3)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    engine = create_engine(database_url_from_env(args.database_url))
+    if not is_postgres(engine):
+        print("ℹ️  Not a PostgreSQL database - partitioning does not apply.")
+        return 0
+
+    if args.command == 'status':
+        for table, partitioned, partitions in status(engine):
+            state = f"partitioned ({len(partitions)} partitions)" if partitioned else "not partitioned"
+            print(f"📋 {table}: {state}")
+            for name in partitions:
+                print(f"   - {name}")
+    elif args.command == 'migrate':
+        if migrate_to_partitioned(engine, args.table, args.months_ahead, args.drop_old):
+            print(f"✅ {args.table} is now partitioned by month")
+        else:
+            print(f"✓ {args.table} was already partitioned")
+    else:
+        created = ensure_future_partitions(engine, args.months_ahead)
+        print(f"✅ Created {len(created)} partitions" if created else "✓ All partitions already exist")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
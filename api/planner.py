@@ -0,0 +1,383 @@
+"""
+Day planner: lays a user's open tasks out over the pomodoro slots of a day.
+
+The day is cut into work slots and breaks from the available time windows and
+the break rules (a short break after every pomodoro, a long one after every
+Nth). Tasks due that day or earlier are ordered by an aged priority - each day
+overdue adds `aging_per_day` to the priority, up to `max_aging` - then by due
+date and id, and take consecutive work slots for their remaining pomodoros
+(estimate minus pomodoros already logged). The ordering is a heap, so a plan
+costs O(T + S log T) for T tasks and S slots.
+
+A plan is kept per user in `PlanCache`. Toggling, creating, editing or
+deleting a task updates the cached plan in place: a completed task gives its
+slots to the tasks after it and the heap refills the freed tail; a reopened
+task is inserted at its rank and pushes the tail back into the heap. A
+repeated POST with the same parameters then returns the updated plan without
+reloading or re-ranking anything.
+
+The cache is per process, so every plan carries the user's change number
+(see sync.py) it was built at: a lookup compares it with the user's current
+one - one primary-key read - and a plan another process or a write-behind
+batch has written past is rebuilt. A write updates the plan in place only if
+its change number directly follows the plan's; otherwise the plan is dropped.
+"""
+import heapq
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import or_, select
+
+DEFAULT_RULES = {
+    'work_minutes': 25,
+    'short_break_minutes': 5,
+    'long_break_minutes': 15,
+    'long_break_every': 4,
+    'default_estimate': 1,
+    'aging_per_day': 0.5,
+    'max_aging': 3,
+}
+DEFAULT_WINDOWS = [{'start': '09:00', 'end': '12:00'}, {'start': '13:00', 'end': '17:00'}]
+LIMITS = {
+    'work_minutes': (5, 120),
+    'short_break_minutes': (0, 60),
+    'long_break_minutes': (0, 120),
+    'long_break_every': (1, 12),
+    'default_estimate': (1, 20),
+    'aging_per_day': (0, 5),
+    'max_aging': (0, 20),
+}
+MAX_WINDOWS = 12
+MAX_UNSCHEDULED_LISTED = 100
+
+
+def _minutes(value):
+    hours, minutes = value.split(':')
+    total = int(hours) * 60 + int(minutes)
+    if not 0 <= total <= 24 * 60:
+        raise ValueError
+    return total
+
+
+def _clock(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def parse_plan_request(data, today):
+    """Validate the plan request body; raises ValueError with a user-facing message"""
+    data = data or {}
+    try:
+        day = datetime.strptime(data['date'], '%Y-%m-%d').date() if data.get('date') else today
+    except (TypeError, ValueError):
+        raise ValueError('date must be formatted as YYYY-MM-DD')
+
+    rules = dict(DEFAULT_RULES)
+    for name, (low, high) in LIMITS.items():
+        if name in data:
+            value = data[name]
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or not low <= value <= high:
+                raise ValueError(f'{name} must be a number between {low} and {high}')
+            rules[name] = value if name in ('aging_per_day', 'max_aging') else int(value)
+
+    windows = data.get('windows') or DEFAULT_WINDOWS
+    if not isinstance(windows, list) or len(windows) > MAX_WINDOWS:
+        raise ValueError(f'windows must be a list of at most {MAX_WINDOWS} {{start, end}} objects')
+    try:
+        parsed = sorted((_minutes(w['start']), _minutes(w['end'])) for w in windows)
+        start_at = _minutes(data['start_at']) if data.get('start_at') else None
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise ValueError('Times must be formatted as HH:MM')
+    if any(start >= end for start, end in parsed):
+        raise ValueError('Each window must start before it ends')
+    if start_at is not None:
+        parsed = [(max(start, start_at), end) for start, end in parsed if end > start_at]
+
+    estimates = {}
+    for task_id, estimate in (data.get('estimates') or {}).items():
+        try:
+            task_id, estimate = int(task_id), int(estimate)
+        except (TypeError, ValueError):
+            raise ValueError('estimates must map task ids to pomodoro counts')
+        if not 1 <= estimate <= 20:
+            raise ValueError('Estimates must be between 1 and 20 pomodoros')
+        estimates[task_id] = estimate
+    rules['estimates'] = estimates
+    return day, parsed, rules
+
+
+def build_slots(windows, rules):
+    """Work slots and breaks for the given (start, end) minute windows"""
+    slots = []
+    work = rules['work_minutes']
+    for start, end in windows:
+        now, count = start, 0  # the gap between windows counts as a long break
+        while now + work <= end:
+            slots.append({'type': 'work', 'start': now, 'end': now + work})
+            now += work
+            count += 1
+            long_break = count % rules['long_break_every'] == 0
+            pause = rules['long_break_minutes'] if long_break else rules['short_break_minutes']
+            # Only add a break if another pomodoro fits after it
+            if now + pause + work > end:
+                break
+            if pause:
+                slots.append({'type': 'long_break' if long_break else 'short_break', 'start': now, 'end': now + pause})
+                now += pause
+    return slots
+
+
+def rank_key(task_id, priority, due_date, day, rules):
+    """Heap key: aged priority first (higher wins), then oldest due date, then id"""
+    overdue = max((day - due_date).days, 0)
+    aged = (priority or 1) + min(overdue * rules['aging_per_day'], rules['max_aging'])
+    return (-aged, due_date.toordinal(), task_id)
+
+
+class DayPlan:
+    """One user's plan for one day, updatable in place"""
+
+    def __init__(self, day, windows, rules):
+        self.day = day
+        self.rules = rules
+        self.slots = build_slots(windows, rules)
+        self.capacity = sum(1 for slot in self.slots if slot['type'] == 'work')
+        self.tasks = {}   # id -> task dict with 'key', 'remaining' and 'scheduled'
+        self.blocks = []  # [key, task id, pomodoros] in rank order, filling the work slots
+        self.heap = []    # (key, task id) of tasks with pomodoros not yet scheduled
+        self.used = 0
+
+    def eligible(self, task):
+        return not task['completed'] and not task.get('is_recurring') and task['due_date'] <= self.day
+
+    def _prepare(self, task_id, title, priority, due_date, done):
+        estimate = self.rules['estimates'].get(task_id, self.rules['default_estimate'])
+        return {
+            'id': task_id, 'title': title, 'priority': priority, 'due_date': due_date,
+            'key': rank_key(task_id, priority, due_date, self.day, self.rules),
+            'remaining': max(estimate - (done or 0), 1), 'scheduled': 0,
+        }
+
+    def load(self, rows):
+        """Start from (id, title, priority, due_date, work_pomodoro_count) rows of open tasks"""
+        # rank_key() and _prepare() inlined: this loop runs for every open task
+        today = self.day.toordinal()
+        aging, max_aging = self.rules['aging_per_day'], self.rules['max_aging']
+        estimates, default = self.rules['estimates'], self.rules['default_estimate']
+        heap = []
+        for task_id, title, priority, due_date, done in rows:
+            due = due_date.toordinal()
+            overdue = today - due if today > due else 0
+            key = (-((priority or 1) + min(overdue * aging, max_aging)), due, task_id)
+            self.tasks[task_id] = {
+                'id': task_id, 'title': title, 'priority': priority, 'due_date': due_date, 'key': key,
+                'remaining': max(estimates.get(task_id, default) - (done or 0), 1), 'scheduled': 0,
+            }
+            heap.append((key, task_id))
+        heapq.heapify(heap)
+        self.heap = heap
+        self._fill()
+        return self
+
+    def _fill(self):
+        """Hand free work slots to the best unscheduled tasks"""
+        while self.used < self.capacity and self.heap:
+            key, task_id = heapq.heappop(self.heap)
+            task = self.tasks.get(task_id)
+            if task is None or task['key'] != key:
+                continue  # removed or re-ranked since it was pushed
+            pending = task['remaining'] - task['scheduled']
+            if pending <= 0:
+                continue
+            count = min(pending, self.capacity - self.used)
+            if self.blocks and self.blocks[-1][1] == task_id:
+                self.blocks[-1][2] += count
+            else:
+                self.blocks.append([key, task_id, count])
+            task['scheduled'] += count
+            self.used += count
+            if count < pending:
+                heapq.heappush(self.heap, (key, task_id))
+
+    def _trim(self):
+        """Push pomodoros beyond the capacity back into the heap"""
+        while self.used > self.capacity:
+            block = self.blocks[-1]
+            take = min(self.used - self.capacity, block[2])
+            block[2] -= take
+            self.used -= take
+            self.tasks[block[1]]['scheduled'] -= take
+            heapq.heappush(self.heap, (block[0], block[1]))
+            if not block[2]:
+                self.blocks.pop()
+
+    def remove(self, task_id):
+        task = self.tasks.pop(task_id, None)
+        if task is None:
+            return False
+        if len(self.heap) > 2 * len(self.tasks) + 64:
+            # Drop the entries of removed and re-ranked tasks
+            self.heap = [(t['key'], t['id']) for t in self.tasks.values() if t['scheduled'] < t['remaining']]
+            heapq.heapify(self.heap)
+        if task['scheduled']:
+            self.blocks = [block for block in self.blocks if block[1] != task_id]
+            self.used -= task['scheduled']
+            self._fill()
+        return True
+
+    def add(self, task):
+        self.remove(task['id'])
+        if not self.eligible(task):
+            return
+        task = self._prepare(task['id'], task['title'], task['priority'], task['due_date'],
+                             task.get('work_pomodoro_count'))
+        self.tasks[task['id']] = task
+        position = bisect_right([block[0] for block in self.blocks], task['key'])
+        if position < len(self.blocks) or self.used < self.capacity:
+            self.blocks.insert(position, [task['key'], task['id'], task['remaining']])
+            task['scheduled'] = task['remaining']
+            self.used += task['remaining']
+            self._trim()
+            self._fill()
+        else:
+            heapq.heappush(self.heap, (task['key'], task['id']))
+
+    def render(self):
+        units = iter([(task_id, n + 1) for _, task_id, count in self.blocks for n in range(count)])
+        slots = []
+        for slot in self.slots:
+            entry = {'type': slot['type'], 'start': _clock(slot['start']), 'end': _clock(slot['end'])}
+            if slot['type'] == 'work':
+                unit = next(units, None)
+                if unit is not None:
+                    task = self.tasks[unit[0]]
+                    entry.update({
+                        'task_id': task['id'], 'title': task['title'], 'priority': task['priority'],
+                        'pomodoro': unit[1], 'of': task['remaining'],
+                    })
+            slots.append(entry)
+
+        fully_scheduled = {block[1] for block in self.blocks
+                           if self.tasks[block[1]]['scheduled'] == self.tasks[block[1]]['remaining']}
+        return {
+            'date': self.day.isoformat(),
+            'slots': slots,
+            'unscheduled': [
+                {'task_id': task['id'], 'title': task['title'], 'remaining': task['remaining'] - task['scheduled']}
+                for task in self._unscheduled(MAX_UNSCHEDULED_LISTED)
+            ],
+            'summary': {
+                'open_tasks': len(self.tasks),
+                'work_slots': self.capacity,
+                'scheduled_pomodoros': self.used,
+                'tasks_scheduled': len({block[1] for block in self.blocks}),
+                'unscheduled_tasks': len(self.tasks) - len(fully_scheduled),
+            },
+        }
+
+    def _unscheduled(self, limit):
+        """The best `limit` tasks left in the heap, walked best-first without popping it"""
+        found, seen = [], set()
+        frontier = [(self.heap[0], 0)] if self.heap else []
+        while frontier and len(found) < limit:
+            (key, task_id), index = heapq.heappop(frontier)
+            task = self.tasks.get(task_id)
+            if task is not None and task['key'] == key and task['id'] not in seen \
+                    and task['scheduled'] < task['remaining']:
+                seen.add(task_id)
+                found.append(task)
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(self.heap):
+                    heapq.heappush(frontier, (self.heap[child], child))
+        return found
+
+
+def load_open_tasks(session, task_table, user_id, day):
+    """Open tasks due on `day` or earlier, as the rows DayPlan.load() takes"""
+    t = task_table
+    return session.execute(
+        select(t.c.id, t.c.title, t.c.priority, t.c.due_date, t.c.work_pomodoro_count).where(
+            t.c.user_id == user_id,
+            t.c.due_date <= day,
+            t.c.completed == False,  # noqa: E712
+            t.c.deleted_at.is_(None),
+            or_(t.c.is_recurring == False, t.c.is_recurring.is_(None))  # noqa: E712
+        )
+    ).all()
+
+
+def _fingerprint(day, windows, rules):
+    return (day, tuple(windows), tuple(sorted((k, v) for k, v in rules.items() if k != 'estimates')),
+            tuple(sorted(rules['estimates'].items())))
+
+
+class PlanCache:
+    """Per-user plans (LRU), kept current by the task write routes"""
+
+    def __init__(self, max_users=1000):
+        self.max_users = max_users
+        self._plans = OrderedDict()   # user_id -> (fingerprint, plan, change_seq)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, change_seq, day, windows, rules):
+        """The cached plan for these parameters, or None if there is none or it is
+        older than the user's current `change_seq`"""
+        with self._lock:
+            cached = self._plans.get(user_id)
+            if cached and cached[0] == _fingerprint(day, windows, rules) and cached[2] == change_seq:
+                self._plans.move_to_end(user_id)
+                return dict(cached[1].render(), cached=True)
+        return None
+
+    def build(self, session, task_table, user_id, change_seq, day, windows, rules):
+        """Plan from the database and cache the result; `change_seq` is read before the tasks"""
+        plan = DayPlan(day, windows, rules).load(load_open_tasks(session, task_table, user_id, day))
+        with self._lock:
+            self._plans[user_id] = (_fingerprint(day, windows, rules), plan, change_seq)
+            self._plans.move_to_end(user_id)
+            while len(self._plans) > self.max_users:
+                self._plans.popitem(last=False)
+            return dict(plan.render(), cached=False)
+
+    def _advance(self, user_id, change_seq):
+        """The cached plan if the write stamped `change_seq` is the next one after it, else
+        drop it (a write it has not seen came in between) and None. Holds the lock"""
+        cached = self._plans.get(user_id)
+        if cached is None:
+            return None
+        if cached[2] != change_seq - 1:
+            del self._plans[user_id]
+            return None
+        self._plans[user_id] = cached[:2] + (change_seq,)
+        return cached[1]
+
+    def task_changed(self, user_id, task, change_seq):
+        """A task was created, edited, toggled or reopened: re-rank it in the cached plan"""
+        if task.get('is_recurring'):
+            # A new or edited template can add instances for the planned day
+            self.invalidate(user_id)
+            return
+        with self._lock:
+            plan = self._advance(user_id, change_seq)
+            if plan is not None:
+                plan.add(task)
+
+    def task_removed(self, user_id, task_id, change_seq):
+        with self._lock:
+            plan = self._advance(user_id, change_seq)
+            if plan is not None:
+                plan.remove(task_id)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._plans.pop(user_id, None)
+
+
+def plan_task(task):
+    """The fields the planner needs from a Task model instance"""
+    return {
+        'id': task.id, 'title': task.title, 'priority': task.priority, 'due_date': task.due_date,
+        'completed': task.completed, 'is_recurring': task.is_recurring,
+        'work_pomodoro_count': task.work_pomodoro_count,
+    }
@@ -0,0 +1,334 @@
+"""
+In-process rate limiting and load shedding for the Flask apps.
+
+Nothing is registered unless RATE_LIMIT_ENABLED is set. When enabled, every
+request (except health checks, the admin endpoints and CORS preflights)
+goes through two gates before the view runs:
+
+1. Token buckets per route class and scope. The classes are `auth`
+   (register, login, change password, delete account), `reads` (GET) and
+   `writes` (everything else); the scopes are the JWT user and the client IP.
+   A request needs a token from each bucket that applies to it. When one is
+   empty the answer is 429 with Retry-After set to when it will have a token
+   again.
+
+2. A concurrency gate. At most RATE_LIMIT_MAX_CONCURRENT requests run at
+   once (default: the database pool's pool_size + max_overflow, so requests
+   queue here rather than in the pool). A request waits up to
+   RATE_LIMIT_QUEUE_MS for a place, then gets 503 with Retry-After.
+
+Limits are `<requests>/<seconds>[:<burst>]`, e.g. `20/1:40` (20 per second,
+bursts of 40) or `10/60` (10 a minute). Override a default with
+RATE_LIMIT_<CLASS>_<SCOPE>, e.g. RATE_LIMIT_READS_USER=5/1:10, or turn it off
+with `off`.
+
+Buckets are kept in GCRA form: a single float per bucket, the time at which it
+will be full again. A bucket past that time is the same as a new one, which is
+what lets the memory backend drop it when it needs the room. The backend is
+swappable: RATE_LIMIT_BACKEND=database keeps the buckets in a table of the
+app's database instead, shared by every process and serverless instance at
+the cost of one upsert per bucket per request.
+
+Counters (allowed, throttled per class and scope, shed, in flight) are
+returned by `metrics()` and served by GET /api/metrics.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from collections import Counter
+
+from flask import g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import Boolean, Column, Float, MetaData, String, Table, text
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+ROUTE_CLASSES = ('auth', 'reads', 'writes')
+SCOPES = ('user', 'ip')
+AUTH_ENDPOINTS = {'register', 'login', 'change_password', 'delete_account'}
+EXEMPT_ENDPOINTS = {'health', 'metrics', 'purge_deleted', 'static'}
+READ_METHODS = {'GET', 'HEAD'}
+MAX_IDENTITIES = 10000
+
+DEFAULT_LIMITS = {
+    # Guessing passwords is bounded per IP; a token is not needed to try
+    ('auth', 'ip'): '10/60:10',
+    ('reads', 'user'): '20/1:40',
+    ('reads', 'ip'): '100/1:200',
+    ('writes', 'user'): '10/1:30',
+    ('writes', 'ip'): '50/1:100',
+}
+
+
+def parse_limit(value):
+    """'20/1:40' -> (rate per second, burst); None for 'off'"""
+    if value is None or value.strip().lower() in ('', '0', 'off', 'none'):
+        return None
+    spec, _, burst = value.partition(':')
+    count, _, seconds = spec.partition('/')
+    count = float(count)
+    seconds = float(seconds or 1)
+    burst = float(burst or count)
+    if count <= 0 or seconds <= 0 or burst < 1:
+        raise ValueError(f'Invalid rate limit {value!r}: expected <requests>/<seconds>[:<burst>]')
+    return count / seconds, burst
+
+
+def limits_from_env():
+    limits = {}
+    for route_class in ROUTE_CLASSES:
+        for scope in SCOPES:
+            name = f'RATE_LIMIT_{route_class.upper()}_{scope.upper()}'
+            limit = parse_limit(os.environ.get(name, DEFAULT_LIMITS.get((route_class, scope))))
+            if limit is not None:
+                limits[route_class, scope] = limit
+    return limits
+
+
+class MemoryBackend:
+    """Buckets of this process: one double per bucket in a flat array, found through a dict"""
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self._slots = {}
+        self._full_at = array('d')
+        self._free = []
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        """Take `cost` tokens; returns (allowed, seconds until they would be there)"""
+        now = time.monotonic()
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._allocate(key, now)
+                full_at = now
+            else:
+                full_at = max(self._full_at[slot], now)
+            # The bucket holds burst - (full_at - now) * rate tokens
+            missing = cost - (burst - (full_at - now) * rate)
+            if missing > 1e-9:
+                return False, missing / rate
+            self._full_at[slot] = full_at + cost / rate
+            return True, 0.0
+
+    def _allocate(self, key, now):
+        if len(self._slots) >= self.capacity:
+            self._evict(now)
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._full_at)
+            self._full_at.append(now)
+        self._full_at[slot] = now
+        self._slots[key] = slot
+        return slot
+
+    def _evict(self, now):
+        """Drop the buckets that are full again; if that is not enough, the eighth closest to full"""
+        full = [key for key, slot in self._slots.items() if self._full_at[slot] <= now]
+        if len(full) < self.capacity // 8:
+            by_age = sorted(self._slots, key=lambda key: self._full_at[self._slots[key]])
+            full = by_age[:max(self.capacity // 8, 1)]
+        for key in full:
+            self._free.append(self._slots.pop(key))
+
+    def __len__(self):
+        return len(self._slots)
+
+
+# One statement per bucket, atomic on both PostgreSQL and SQLite (3.35+).
+# backlog = how long until the bucket is full; a request fits while backlog + cost/rate <= burst/rate.
+TAKE_SQL = text("""
+    INSERT INTO rate_limit_bucket AS b (key, full_at, granted)
+    VALUES (:key, :now + :cost_seconds, :cost_seconds <= :burst_seconds)
+    ON CONFLICT (key) DO UPDATE SET
+        granted = (CASE WHEN b.full_at > :now THEN b.full_at - :now ELSE 0 END) + :cost_seconds <= :burst_seconds,
+        full_at = CASE
+            WHEN (CASE WHEN b.full_at > :now THEN b.full_at - :now ELSE 0 END) + :cost_seconds <= :burst_seconds
+            THEN (CASE WHEN b.full_at > :now THEN b.full_at ELSE :now END) + :cost_seconds
+            ELSE b.full_at
+        END
+    RETURNING full_at, granted
+""")
+
+
+class DatabaseBackend:
+    """Buckets in a table of the app's database, shared by all processes (wall-clock time)"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.table = Table(
+            'rate_limit_bucket', MetaData(),
+            Column('key', String(200), primary_key=True),
+            Column('full_at', Float, nullable=False),
+            Column('granted', Boolean, nullable=False),
+            # Losing the buckets in a crash costs nothing, so skip the WAL
+            prefixes=['UNLOGGED'] if engine.dialect.name == 'postgresql' else [],
+        )
+        self._created = False
+
+    def take(self, key, rate, burst, cost=1):
+        if not self._created:
+            self.table.create(self.engine, checkfirst=True)
+            self._created = True
+        now = time.time()
+        with self.engine.begin() as conn:
+            full_at, granted = conn.execute(TAKE_SQL, {
+                'key': key, 'now': now, 'cost_seconds': cost / rate, 'burst_seconds': burst / rate,
+            }).one()
+        if granted:
+            return True, 0.0
+        return False, max(full_at - now + cost / rate - burst / rate, 0.0)
+
+
+class RateLimiter:
+    def __init__(self, limits, backend=None, max_concurrent=None, queue_timeout=0.1, trust_proxy=False):
+        self.limits = limits
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.trust_proxy = trust_proxy
+        self.stats = Counter()
+        self._identities = {}  # Authorization header -> user id
+        self._gate = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak = 0
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    # Request classification
+
+    @staticmethod
+    def route_class():
+        if request.endpoint in AUTH_ENDPOINTS:
+            return 'auth'
+        return 'reads' if request.method in READ_METHODS else 'writes'
+
+    def client_ip(self):
+        if self.trust_proxy:
+            forwarded = request.headers.get('X-Forwarded-For')
+            if forwarded:
+                return forwarded.split(',')[0].strip()
+        return request.remote_addr or 'unknown'
+
+    def user_id(self):
+        """The token's user. Decoding a JWT costs as much as the rest of a throttled request,
+        so verified tokens are remembered; the view still verifies the token itself"""
+        header = request.headers.get('Authorization')
+        if not header:
+            return None
+        user_id = self._identities.get(header)
+        if user_id is None:
+            try:
+                verify_jwt_in_request(optional=True)
+                user_id = get_jwt_identity()
+            except Exception:
+                return None  # bad or expired token: the view answers 401
+            if user_id is None:
+                return None
+            if len(self._identities) >= MAX_IDENTITIES:
+                self._identities.clear()
+            self._identities[header] = user_id
+        return user_id
+
+    # Hooks
+
+    def _before_request(self):
+        if request.method == 'OPTIONS' or request.endpoint in EXEMPT_ENDPOINTS or request.endpoint is None:
+            return None
+        route_class = self.route_class()
+        for scope in SCOPES:
+            limit = self.limits.get((route_class, scope))
+            if limit is None:
+                continue
+            who = self.client_ip() if scope == 'ip' else self.user_id()
+            if who is None:
+                continue
+            try:
+                allowed, retry_after = self.backend.take(f'{route_class}:{scope}:{who}', *limit)
+            except SQLAlchemyError as error:
+                # Fail open: a broken limiter must not take the API down with it
+                self.stats['backend_errors'] += 1
+                logger.warning('Rate limit backend failed: %s', error)
+                continue
+            if not allowed:
+                self.stats[f'throttled.{route_class}.{scope}'] += 1
+                return self._refuse(429, 'Too many requests', retry_after)
+
+        if self._gate is not None:
+            if not self._gate.acquire(timeout=self.queue_timeout):
+                self.stats['shed'] += 1
+                return self._refuse(503, 'Server busy, try again shortly', 1)
+            g.rate_limit_slot = True
+            with self._lock:
+                self._in_flight += 1
+                self._peak = max(self._peak, self._in_flight)
+        self.stats['allowed'] += 1
+        return None
+
+    def _teardown_request(self, exc):
+        if g.pop('rate_limit_slot', False):
+            with self._lock:
+                self._in_flight -= 1
+            self._gate.release()
+
+    @staticmethod
+    def _refuse(status, message, retry_after):
+        retry_after = max(math.ceil(retry_after), 1)
+        response = jsonify({'error': message, 'retry_after': retry_after})
+        response.status_code = status
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    def metrics(self):
+        return {
+            'counters': dict(self.stats),
+            'in_flight': self._in_flight,
+            'peak_in_flight': self._peak,
+            'max_concurrent': self.max_concurrent,
+            'buckets': len(self.backend) if isinstance(self.backend, MemoryBackend) else None,
+            'limits': {f'{route_class}.{scope}': {'per_second': rate, 'burst': burst}
+                       for (route_class, scope), (rate, burst) in self.limits.items()},
+        }
+
+
+def init_app(app, engine=None):
+    """Register the limiter hooks if RATE_LIMIT_ENABLED is set, otherwise do nothing.
+    `engine` is only needed for RATE_LIMIT_BACKEND=database"""
+    if os.environ.get('RATE_LIMIT_ENABLED', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    backend_name = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    if backend_name == 'memory':
+        backend = MemoryBackend(capacity=int(os.environ.get('RATE_LIMIT_MAX_BUCKETS', 100000)))
+    elif backend_name == 'database':
+        if engine is None:
+            raise ValueError('RATE_LIMIT_BACKEND=database needs the database engine')
+        backend = DatabaseBackend(engine)
+    else:
+        raise ValueError(f'Unknown RATE_LIMIT_BACKEND {backend_name!r} (memory or database)')
+
+    if os.environ.get('RATE_LIMIT_MAX_CONCURRENT'):
+        max_concurrent = int(os.environ['RATE_LIMIT_MAX_CONCURRENT']) or None
+    else:
+        # SQLAlchemy's QueuePool defaults
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        max_concurrent = options.get('pool_size', 5) + options.get('max_overflow', 10)
+
+    limiter = RateLimiter(
+        limits_from_env(),
+        backend=backend,
+        max_concurrent=max_concurrent,
+        queue_timeout=float(os.environ.get('RATE_LIMIT_QUEUE_MS', 100)) / 1000.0,
+        trust_proxy=os.environ.get('RATE_LIMIT_TRUST_PROXY', '').lower() in ('1', 'true', 'yes'),
+    )
+    limiter.init_app(app)
+    logger.info('Rate limiting enabled (%s backend, at most %s concurrent requests)', backend_name, max_concurrent)
+    return limiter
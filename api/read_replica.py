@@ -0,0 +1,167 @@
+"""
+Optional read-replica routing.
+
+With DATABASE_READ_URL set, views decorated with `router.reads` run their
+queries on the replica engine instead of the primary. This works through
+`RoutingSession.get_bind`, so the view code is unchanged. Flushes always go
+to the primary, and a `with router.primary():` block pins its statements to
+the primary (get_tasks generates today's recurring instances that way before
+it reads).
+
+Read-your-writes: every commit that wrote something (a flush, or an UPDATE,
+DELETE or INSERT statement run through the session) records the user's
+last-write time. For DATABASE_READ_STICKY_SECONDS afterwards (default 5 -
+keep it above the replica's usual lag) that user's reads stay on the
+primary. The timestamps are per process: a serverless instance that did not
+see the write does not know about it.
+
+Fallback: if a statement fails on the replica, the view is run again on the
+primary. Connection failures also take the replica out of rotation for
+DATABASE_READ_RETRY_SECONDS (default 30).
+
+Without DATABASE_READ_URL, everything goes to the primary.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# The _Route of the routed view being run, else None
+_routing = ContextVar('read_replica_routing', default=None)
+
+
+class RoutingSession(Session):
+    """Session that sends statements to the replica while a routed view is running"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        route = _routing.get()
+        if route is not None and bind is None and not self._flushing:
+            engine = route.engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class _Route:
+    """One routed request. Decided per statement, so a write earlier in the view makes the
+    reads after it stick to the primary"""
+
+    def __init__(self, router, user_id):
+        self.router = router
+        self.user_id = user_id
+        self.used_replica = False
+        self.failed = None
+
+    def engine(self):
+        if self.router.replica_ok(self.user_id):
+            self.used_replica = True
+            return self.router.engine
+        return None
+
+
+class ReadRouter:
+    def __init__(self, sticky_seconds=5, retry_seconds=30):
+        self.db = None
+        self.engine = None
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self._last_write = {}
+        self._down_until = 0
+        self._lock = threading.Lock()
+        self.stats = {'replica': 0, 'primary': 0, 'fallbacks': 0}
+
+    def init_app(self, db, engine):
+        """Route reads to `engine`; `db` is the Flask-SQLAlchemy instance using RoutingSession"""
+        self.db = db
+        self.engine = engine
+        event.listen(engine, 'handle_error', self._replica_error)
+        event.listen(db.session, 'after_flush', self._flushed)
+        event.listen(db.session, 'do_orm_execute', self._executed)
+        event.listen(db.session, 'after_commit', self._committed)
+        event.listen(db.session, 'after_rollback', self._rolled_back)
+
+    # Last writes
+
+    def wrote(self, user_id):
+        with self._lock:
+            self._last_write[user_id] = time.monotonic()
+            if len(self._last_write) > 10000:
+                cutoff = time.monotonic() - self.sticky_seconds
+                self._last_write = {u: t for u, t in self._last_write.items() if t > cutoff}
+
+    @staticmethod
+    def _flushed(session, flush_context):
+        session.info['wrote'] = True
+
+    @staticmethod
+    def _executed(orm_execute_state):
+        # Set-based UPDATE/DELETE/INSERT through session.execute() never flush
+        if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+            orm_execute_state.session.info['wrote'] = True
+
+    def _committed(self, session):
+        if not session.info.pop('wrote', False):
+            return
+        try:
+            user_id = get_jwt_identity()
+        except RuntimeError:
+            return  # no request or no verified token (register, CLI)
+        if user_id is not None:
+            self.wrote(int(user_id))
+
+    @staticmethod
+    def _rolled_back(session):
+        session.info.pop('wrote', None)
+
+    # Routing
+
+    def replica_ok(self, user_id):
+        now = time.monotonic()
+        if now < self._down_until:
+            return False
+        return now - self._last_write.get(user_id, float('-inf')) >= self.sticky_seconds
+
+    def _replica_error(self, context):
+        route = _routing.get()
+        if route is not None:
+            route.failed = context.original_exception
+        if context.is_disconnect or context.connection is None:
+            self._down_until = time.monotonic() + self.retry_seconds
+
+    @contextmanager
+    def primary(self):
+        """Pin the statements in this block to the primary"""
+        token = _routing.set(None)
+        try:
+            yield
+        finally:
+            _routing.reset(token)
+
+    def reads(self, view):
+        """Run a read-only view on the replica, falling back to the primary if it fails"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if self.engine is None:
+                return view(*args, **kwargs)
+            route = _Route(self, int(get_jwt_identity()))
+            token = _routing.set(route)
+            try:
+                response = view(*args, **kwargs)
+            finally:
+                _routing.reset(token)
+            if route.failed is not None:
+                logger.warning("Replica read failed, retrying on the primary: %s", route.failed)
+                self.stats['fallbacks'] += 1
+                self.db.session.rollback()
+                return view(*args, **kwargs)
+            self.stats['replica' if route.used_replica else 'primary'] += 1
+            return response
+        return wrapper
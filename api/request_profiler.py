@@ -0,0 +1,183 @@
+"""
+Per-request profiler hook for the Flask apps.
+
+Nothing is registered unless PROFILER_ENABLED is set, so the disabled path
+costs nothing on the request path. When enabled, a request is profiled if:
+
+- On demand: it carries `X-Profile: cprofile` or `X-Profile: sample` together
+  with `X-Admin-Token` matching the ADMIN_TOKEN env var.
+- Continuous sampling: PROFILER_SAMPLE_RATE (0.0-1.0) of all requests are
+  profiled with the low-overhead sampling profiler.
+
+Output formats:
+- cprofile: a deterministic cProfile dump (`.pstats`), readable with
+  `python -m pstats` or snakeviz.
+- sample: collapsed stacks (`.folded`), one `frame;frame;frame count` line per
+  stack, ready for flamegraph.pl or speedscope.
+
+Profiles are written to PROFILER_DIR. On-demand responses carry the file's
+path in `X-Profile-File`; sampled requests never asked for one, so their path
+is only logged. On-demand requests can send `X-Profile-Output: inline` to get
+the profile back as the response body instead of the endpoint's payload.
+"""
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.counts[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.counts.most_common())
+
+
+class RequestProfiler:
+    def __init__(self, output_dir, admin_token=None, sample_rate=0.0, sample_interval=0.005):
+        self.output_dir = output_dir
+        self.admin_token = admin_token
+        self.sample_rate = sample_rate
+        self.sample_interval = sample_interval
+        os.makedirs(output_dir, exist_ok=True)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _requested_mode(self):
+        mode = request.headers.get('X-Profile')
+        if mode and self.admin_token:
+            token = request.headers.get('X-Admin-Token', '')
+            if hmac.compare_digest(token, self.admin_token) and mode in ('cprofile', 'sample'):
+                return mode, True
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample', False
+        return None, False
+
+    def _before_request(self):
+        mode, on_demand = self._requested_mode()
+        if mode is None:
+            return
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already active on this thread
+                return
+        else:
+            profiler = StackSampler(threading.get_ident(), self.sample_interval).start()
+        g.request_profile = (mode, on_demand, profiler, time.perf_counter())
+
+    def _stop(self):
+        state = g.pop('request_profile', None)
+        if state is None:
+            return None
+        mode, on_demand, profiler, started = state
+        if mode == 'cprofile':
+            profiler.disable()
+        else:
+            profiler.stop()
+        return mode, on_demand, profiler, time.perf_counter() - started
+
+    def _after_request(self, response):
+        state = self._stop()
+        if state is None:
+            return response
+        mode, on_demand, profiler, elapsed = state
+        path = self._write(mode, profiler, elapsed)
+        if on_demand:
+            response.headers['X-Profile-File'] = path
+        else:
+            self._log(path, elapsed)
+        if on_demand and request.headers.get('X-Profile-Output') == 'inline':
+            response.set_data(self._render(mode, profiler))
+            response.mimetype = 'text/plain'
+        return response
+
+    def _teardown_request(self, exc):
+        # after_request is skipped for unhandled errors; make sure nothing keeps running
+        state = self._stop()
+        if state is not None:
+            mode, _, profiler, elapsed = state
+            self._log(self._write(mode, profiler, elapsed), elapsed)
+
+    def _write(self, mode, profiler, elapsed):
+        endpoint = (request.endpoint or 'unknown').replace('.', '_')
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        base = os.path.join(self.output_dir, f'{stamp}-{endpoint}-{int(elapsed * 1000)}ms-{os.getpid()}')
+        if mode == 'cprofile':
+            path = base + '.pstats'
+            profiler.dump_stats(path)
+        else:
+            path = base + '.folded'
+            with open(path, 'w') as f:
+                f.write(profiler.collapsed())
+        return path
+
+    @staticmethod
+    def _log(path, elapsed):
+        logger.info('Profiled %s %s in %.1fms -> %s', request.method, request.path, elapsed * 1000, path)
+
+    @staticmethod
+    def _render(mode, profiler):
+        if mode == 'sample':
+            return profiler.collapsed()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(40)
+        return out.getvalue()
+
+
+def init_app(app, default_dir):
+    """Register the profiler hooks if PROFILER_ENABLED is set, otherwise do nothing"""
+    if os.environ.get('PROFILER_ENABLED', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    profiler = RequestProfiler(
+        output_dir=os.environ.get('PROFILER_DIR', default_dir),
+        admin_token=os.environ.get('ADMIN_TOKEN'),
+        sample_rate=float(os.environ.get('PROFILER_SAMPLE_RATE', 0)),
+        sample_interval=float(os.environ.get('PROFILER_SAMPLE_INTERVAL_MS', 5)) / 1000.0,
+    )
+    profiler.init_app(app)
+    logger.info('Request profiler enabled (sample rate %s, output %s)', profiler.sample_rate, profiler.output_dir)
+    return profiler
@@ -0,0 +1,271 @@
+"""
+Full-text task search on the database's native text index.
+
+SQLite: an FTS5 table `task_fts` with external content (it stores only the
+index, reading rows through the `task_fts_source` view) kept in sync with
+`task` by triggers. Besides title and description it indexes an `owner`
+token (`u<user_id>`), so the per-user filter is resolved inside the index
+instead of ranking every user's matches.
+
+PostgreSQL: a GIN expression index over the weighted title/description
+tsvector. It is built CONCURRENTLY by the migration runner and needs no extra
+column, so there is no table rewrite (and nothing to carry over when the table
+is partitioned).
+
+The last search term is prefix-matched as you type ("quarterly rep" finds
+"quarterly report"); earlier terms match whole words, which lets the index
+skip through their postings instead of merging every word with that prefix.
+Results are ranked (bm25 / ts_rank_cd, titles weigh more than descriptions)
+or sorted by due date, and pages are fetched with a keyset cursor of
+(sort value, id), so deep pages cost the same as the first one.
+
+Usage:
+    python search.py rebuild      # create the index if missing and repopulate it
+"""
+import argparse
+import base64
+import json
+import re
+from datetime import datetime
+
+from sqlalchemy import Date, Float, bindparam, column, create_engine, event, text
+
+import archive
+from db_url import database_url_from_env
+
+INDEX_NAME = 'ix_task_search'
+TEXT_SEARCH_CONFIG = 'simple'  # no stemming: task text comes in any language
+SORTS = ('relevance', 'recent')
+MAX_TERMS = 8
+
+# Must match the indexed expression exactly for PostgreSQL to use the index
+DOCUMENT_SQL = (
+    f"(setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(description, '')), 'B'))"
+)
+
+SQLITE_DDL = [
+    "CREATE VIEW IF NOT EXISTS task_fts_source AS "
+    "SELECT id, 'u' || user_id AS owner, title, description FROM task",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5("
+    "owner, title, description, content='task_fts_source', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_insert AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_fts(rowid, owner, title, description) "
+    "VALUES (new.id, 'u' || new.user_id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_delete AFTER DELETE ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, owner, title, description) "
+    "VALUES ('delete', old.id, 'u' || old.user_id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_update AFTER UPDATE OF title, description, user_id ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, owner, title, description) "
+    "VALUES ('delete', old.id, 'u' || old.user_id, old.title, old.description); "
+    "INSERT INTO task_fts(rowid, owner, title, description) "
+    "VALUES (new.id, 'u' || new.user_id, new.title, new.description); END",
+]
+
+
+def _sqlite_index_exists(conn):
+    return conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'task_fts'")).first() is not None
+
+
+def create_index(conn):
+    """Create the search index inside the caller's transaction (fine for new or small tables)"""
+    if conn.dialect.name == 'sqlite':
+        existed = _sqlite_index_exists(conn)
+        for statement in SQLITE_DDL:
+            conn.execute(text(statement))
+        if not existed:
+            conn.execute(text("INSERT INTO task_fts(task_fts) VALUES ('rebuild')"))
+    elif conn.dialect.name == 'postgresql':
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON task USING gin ({DOCUMENT_SQL})'))
+
+
+def attach(task_table):
+    """Create the index whenever create_all() creates the task table"""
+    event.listen(task_table, 'after_create', lambda target, connection, **kw: create_index(connection))
+
+
+def ensure_index(engine):
+    """Create the index if it is missing, without blocking writes on PostgreSQL"""
+    if engine.dialect.name == 'sqlite':
+        with engine.begin() as conn:
+            create_index(conn)
+        return
+    # Deferred: migrations.py imports this module
+    import migrations
+    migrations.CreateIndex(INDEX_NAME, 'task', (DOCUMENT_SQL,), using='gin').apply(
+        engine, 'search', migrations.Options()
+    )
+
+
+def rebuild(engine):
+    """Create the index if it is missing, otherwise rebuild it from the task table"""
+    if engine.dialect.name == 'sqlite':
+        with engine.begin() as conn:
+            if _sqlite_index_exists(conn):
+                conn.execute(text("INSERT INTO task_fts(task_fts) VALUES ('rebuild')"))
+                conn.execute(text("INSERT INTO task_fts(task_fts) VALUES ('optimize')"))
+                return
+    elif engine.dialect.name == 'postgresql':
+        with engine.connect() as conn:
+            conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+            if conn.execute(text("SELECT to_regclass(:name)"), {'name': INDEX_NAME}).scalar():
+                conn.execute(text(f'REINDEX INDEX CONCURRENTLY {INDEX_NAME}'))
+                return
+    ensure_index(engine)
+
+
+# Queries
+
+def search_terms(query):
+    terms = re.findall(r'\w+', query.lower())[:MAX_TERMS]
+    if not terms:
+        raise ValueError('q must contain at least one word')
+    return terms
+
+
+def encode_cursor(sort, value, task_id):
+    payload = json.dumps([sort, value, task_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, task_id = json.loads(payload)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if cursor_sort != sort:
+        raise ValueError('Cursor belongs to a different sort order')
+    return value, task_id
+
+
+def parse_search_args(args):
+    """Validate search query arguments; raises ValueError with a user-facing message"""
+    params = {
+        'terms': search_terms(args.get('q', '')),
+        'sort': args.get('sort', 'relevance'),
+        'limit': 20,
+        'cursor': None,
+        'from': None,
+        'to': None,
+        'priorities': None,
+        'completed': None,
+    }
+    if params['sort'] not in SORTS:
+        raise ValueError('sort must be one of: ' + ', '.join(SORTS))
+    try:
+        for key in ('from', 'to'):
+            if args.get(key):
+                params[key] = datetime.strptime(args[key], '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('Dates must be formatted as YYYY-MM-DD')
+    try:
+        params['limit'] = min(max(int(args.get('limit', 20)), 1), 100)
+        if args.get('priority'):
+            params['priorities'] = [int(p) for p in args['priority'].split(',')]
+    except ValueError:
+        raise ValueError('limit and priority must be numbers')
+    if args.get('completed') in ('true', 'false'):
+        params['completed'] = args['completed'] == 'true'
+    if args.get('cursor'):
+        params['cursor'] = decode_cursor(args['cursor'], params['sort'])
+    return params
+
+
+def search_tasks(session, task_table, user_id, params):
+    """One page of matching tasks: {'tasks': [...], 'next_cursor': str or None}"""
+    dialect = session.get_bind().dialect.name
+    terms = params['terms']
+    bind = {'user_id': user_id, 'limit': params['limit'] + 1}
+
+    relevance = params['sort'] == 'relevance'
+
+    if dialect == 'sqlite':
+        words = [f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*']
+        bind['match'] = f'owner : "u{user_id}" AND {{title description}} : ({" AND ".join(words)})'
+        score = '-bm25(task_fts, 0.0, 10.0, 1.0)'
+        source = 'task_fts JOIN task ON task.id = task_fts.rowid'
+        conditions = ['task_fts MATCH :match']
+    else:
+        bind['query'] = ' & '.join(terms[:-1] + [f'{terms[-1]}:*'])
+        score = f'CAST(ts_rank_cd({DOCUMENT_SQL}, query) AS float8)'
+        source = f"task, to_tsquery('{TEXT_SEARCH_CONFIG}', :query) AS query"
+        conditions = [f'{DOCUMENT_SQL} @@ query']
+    if not relevance:
+        score = '0.0'  # ranking reads every match's positions; skip it when sorting by date
+
+    conditions += ['task.user_id = :user_id', 'task.deleted_at IS NULL', '(task.is_recurring = :false OR task.is_recurring IS NULL)']
+    bind['false'] = False
+    dates = []
+    if params['from']:
+        conditions.append('task.due_date >= :from_date')
+        bind['from_date'] = params['from']
+        dates.append(bindparam('from_date', type_=Date))
+    if params['to']:
+        conditions.append('task.due_date <= :to_date')
+        bind['to_date'] = params['to']
+        dates.append(bindparam('to_date', type_=Date))
+    if params['priorities']:
+        names = []
+        for i, priority in enumerate(params['priorities']):
+            names.append(f':priority_{i}')
+            bind[f'priority_{i}'] = priority
+        conditions.append(f'task.priority IN ({", ".join(names)})')
+    if params['completed'] is not None:
+        conditions.append('task.completed = :completed')
+        bind['completed'] = params['completed']
+
+    sort_column = 'score' if relevance else 'due_date'
+    keyset = ''
+    if params['cursor']:
+        value, last_id = params['cursor']
+        keyset = f'WHERE ({sort_column} < :after OR ({sort_column} = :after AND id < :after_id))'
+        if sort_column == 'score':
+            bind['after'] = value
+        else:
+            bind['after'] = datetime.strptime(value, '%Y-%m-%d').date()
+            dates.append(bindparam('after', type_=Date))
+        bind['after_id'] = last_id
+
+    # Typed columns, so SQLite's raw dates and booleans come back as Python objects
+    columns = list(task_table.c) + [column('score', Float)]
+    select_list = ', '.join(f'task.{c.name}' for c in task_table.c)
+    matches = ', '.join(c.name for c in columns)
+    rows = session.execute(text(
+        f'SELECT {matches} FROM (SELECT {select_list}, {score} AS score FROM {source} '
+        f'WHERE {" AND ".join(conditions)}) matches '
+        f'{keyset} ORDER BY {sort_column} DESC, id DESC LIMIT :limit'
+    ).bindparams(*dates).columns(*columns), bind).mappings().all()
+
+    page = rows[:params['limit']]
+    next_cursor = None
+    if len(rows) > params['limit']:
+        last = page[-1]
+        value = last['score'] if sort_column == 'score' else last['due_date'].isoformat()
+        next_cursor = encode_cursor(params['sort'], value, last['id'])
+
+    tasks = []
+    for row in page:
+        task = archive.task_dict(row)
+        if relevance:
+            task['score'] = row['score']
+        tasks.append(task)
+    return {'tasks': tasks, 'next_cursor': next_cursor}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Full-text search index maintenance')
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL or instance/tasks.db')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('rebuild')
+    args = parser.parse_args(argv)
+
+    engine = create_engine(database_url_from_env(args.database_url))
+    rebuild(engine)
+    print("✅ Search index rebuilt")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,311 @@
+"""
+Slow query recorder for SQLAlchemy engines.
+
+Hooks the engine's cursor events, times every statement and records the ones
+slower than a configurable threshold. Statements are fingerprinted by their
+normalized SQL (literals and bind parameters replaced by `?`), and the first
+slow occurrence of each fingerprint gets its query plan captured:
+`EXPLAIN` on PostgreSQL, `EXPLAIN QUERY PLAN` on SQLite.
+
+Recorded entries go to a bounded in-memory ring and, optionally, to a rotating
+JSON-lines file that the CLI below can summarize.
+
+Usage from an app:
+    recorder = install(db.engine, threshold_ms=200, log_path='instance/slow_queries.log')
+    recorder.top(10)
+
+Summarize a log file (rotated siblings are read too):
+    python slow_query_log.py instance/slow_queries.log --top 10 --sort total
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_PARAM_RE = re.compile(r'%\(\w+\)s|%s|(?<!:):\w+|\$\d+|\?')
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+# Only statements that can be explained without side effects
+_EXPLAINABLE = ('select', 'with')
+
+
+def normalize_sql(statement):
+    """Reduce a SQL statement to its shape so identical queries share a fingerprint"""
+    sql = _COMMENT_RE.sub(' ', statement)
+    sql = _STRING_RE.sub('?', sql)
+    sql = _PARAM_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip().lower()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode('utf-8')).hexdigest()[:16]
+
+
+def _current_route():
+    """Best-effort request path, so a slow statement can be tied to its endpoint"""
+    try:
+        from flask import has_request_context, request
+        if has_request_context():
+            return f'{request.method} {request.path}'
+    except ImportError:
+        pass
+    return None
+
+
+class SlowQueryRecorder:
+    """Collects statements slower than `threshold_ms` from one engine"""
+
+    def __init__(self, threshold_ms=200, ring_size=500, log_path=None,
+                 max_bytes=5 * 1024 * 1024, backup_count=3, explain=True):
+        self.threshold = threshold_ms / 1000.0
+        self.explain = explain
+        self.ring = deque(maxlen=ring_size)
+        self.stats = {}
+        self.plans = {}
+        self._lock = threading.Lock()
+        self._file_logger = None
+        if log_path:
+            self._file_logger = self._build_file_logger(log_path, max_bytes, backup_count)
+
+    @staticmethod
+    def _build_file_logger(log_path, max_bytes, backup_count):
+        directory = os.path.dirname(os.path.abspath(log_path))
+        os.makedirs(directory, exist_ok=True)
+        file_logger = logging.getLogger(f'{__name__}.file.{os.path.abspath(log_path)}')
+        file_logger.setLevel(logging.INFO)
+        file_logger.propagate = False
+        if not file_logger.handlers:
+            handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            file_logger.addHandler(handler)
+        return file_logger
+
+    # Engine hooks
+
+    def attach(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+        return self
+
+    def detach(self, engine):
+        event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.remove(engine, 'handle_error', self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_start', []).append((cursor, time.perf_counter()))
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        _, started = conn.info['slow_query_start'].pop()
+        elapsed = time.perf_counter() - started
+        if elapsed < self.threshold:
+            return
+        self.record(conn, cursor, statement, parameters, executemany, elapsed)
+
+    def _handle_error(self, context):
+        # A failed statement gets no after_cursor_execute: drop its start time. Errors
+        # raised before the cursor ran (compiling, connecting) have none to drop
+        cursor = getattr(context.execution_context, 'cursor', None)
+        if context.connection is None or cursor is None:
+            return
+        started = context.connection.info.get('slow_query_start')
+        if started and started[-1][0] is cursor:
+            started.pop()
+
+    # Recording
+
+    def record(self, conn, cursor, statement, parameters, executemany, elapsed):
+        normalized = normalize_sql(statement)
+        fp = fingerprint(normalized)
+        duration_ms = round(elapsed * 1000, 2)
+
+        with self._lock:
+            first_seen = fp not in self.stats
+            agg = self.stats.get(fp)
+            if agg is None:
+                agg = self.stats[fp] = {
+                    'fingerprint': fp,
+                    'statement': normalized,
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                }
+            agg['count'] += 1
+            agg['total_ms'] += duration_ms
+            agg['max_ms'] = max(agg['max_ms'], duration_ms)
+
+        plan = None
+        if first_seen and self.explain and not executemany:
+            plan = self._capture_plan(conn, cursor, statement, parameters)
+            if plan is not None:
+                with self._lock:
+                    self.plans[fp] = plan
+
+        entry = {
+            'ts': datetime.utcnow().isoformat(),
+            'fingerprint': fp,
+            'duration_ms': duration_ms,
+            'route': _current_route(),
+            'statement': normalized,
+        }
+        if plan is not None:
+            entry['plan'] = plan
+        self.ring.append(entry)
+        if self._file_logger is not None:
+            self._file_logger.info(json.dumps(entry))
+
+    def _capture_plan(self, conn, cursor, statement, parameters):
+        """Run EXPLAIN for a statement on the connection that just executed it.
+
+        The plan query goes straight to the DBAPI connection so it does not
+        re-enter these event hooks. On PostgreSQL it runs inside a savepoint,
+        otherwise a failing EXPLAIN would abort the caller's transaction.
+        """
+        if not statement.lstrip().lower().startswith(_EXPLAINABLE):
+            return None
+        dialect = conn.dialect.name
+        if dialect == 'postgresql':
+            prefix = 'EXPLAIN '
+        elif dialect == 'sqlite':
+            prefix = 'EXPLAIN QUERY PLAN '
+        else:
+            return None
+
+        raw = cursor.connection
+        plan_cursor = raw.cursor()
+        try:
+            if dialect == 'postgresql':
+                plan_cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                plan_cursor.execute(prefix + statement, parameters or ())
+                rows = plan_cursor.fetchall()
+            except Exception as e:
+                if dialect == 'postgresql':
+                    plan_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                logger.warning('Could not capture plan for slow query: %s', e)
+                return None
+            if dialect == 'postgresql':
+                plan_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+                return [row[0] for row in rows]
+            # EXPLAIN QUERY PLAN rows are (id, parent, notused, detail)
+            return [row[-1] for row in rows]
+        finally:
+            plan_cursor.close()
+
+    # Reporting
+
+    def recent(self, limit=50):
+        return list(self.ring)[-limit:]
+
+    def top(self, limit=10, sort='total'):
+        with self._lock:
+            aggregates = [dict(agg, plan=self.plans.get(fp)) for fp, agg in self.stats.items()]
+        return _rank(aggregates, limit, sort)
+
+
+def _rank(aggregates, limit, sort):
+    for agg in aggregates:
+        agg['total_ms'] = round(agg['total_ms'], 2)
+        agg['mean_ms'] = round(agg['total_ms'] / agg['count'], 2) if agg['count'] else 0.0
+    key = {
+        'total': lambda a: a['total_ms'],
+        'count': lambda a: a['count'],
+        'max': lambda a: a['max_ms'],
+        'mean': lambda a: a['mean_ms'],
+    }[sort]
+    return sorted(aggregates, key=key, reverse=True)[:limit]
+
+
+def install(engine, threshold_ms=200, ring_size=500, log_path=None, **kwargs):
+    """Create a recorder and attach it to `engine`"""
+    recorder = SlowQueryRecorder(threshold_ms=threshold_ms, ring_size=ring_size,
+                                 log_path=log_path, **kwargs)
+    recorder.attach(engine)
+    logger.info('Slow query log enabled (threshold %sms, file %s)', threshold_ms, log_path or 'none')
+    return recorder
+
+
+def summarize_log(path, limit=10, sort='total'):
+    """Aggregate a slow query log file and its rotated backups"""
+    paths = [path] + [f'{path}.{i}' for i in range(1, 100) if os.path.exists(f'{path}.{i}')]
+    aggregates = {}
+    for log_file in paths:
+        if not os.path.exists(log_file):
+            continue
+        with open(log_file) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                agg = aggregates.setdefault(entry['fingerprint'], {
+                    'fingerprint': entry['fingerprint'],
+                    'statement': entry['statement'],
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'routes': set(),
+                    'plan': None,
+                })
+                agg['count'] += 1
+                agg['total_ms'] += entry['duration_ms']
+                agg['max_ms'] = max(agg['max_ms'], entry['duration_ms'])
+                if entry.get('route'):
+                    agg['routes'].add(entry['route'])
+                if entry.get('plan') and agg['plan'] is None:
+                    agg['plan'] = entry['plan']
+    return _rank(list(aggregates.values()), limit, sort)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize a slow query log')
+    parser.add_argument('log_path', help='Path to the slow query log file')
+    parser.add_argument('--top', type=int, default=10, help='Number of fingerprints to show')
+    parser.add_argument('--sort', choices=['total', 'count', 'max', 'mean'], default='total')
+    parser.add_argument('--plans', action='store_true', help='Print captured query plans')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.log_path):
+        print(f"❌ Log file not found: {args.log_path}")
+        return 1
+
+    offenders = summarize_log(args.log_path, args.top, args.sort)
+    if not offenders:
+        print("✅ No slow queries recorded.")
+        return 0
+
+    print(f"🐢 Top {len(offenders)} slow query fingerprints (sorted by {args.sort})")
+    print("=" * 60)
+    for rank, agg in enumerate(offenders, 1):
+        print(f"{rank}. [{agg['fingerprint']}] count={agg['count']} total={agg['total_ms']}ms "
+              f"mean={agg['mean_ms']}ms max={agg['max_ms']}ms")
+        print(f"   {agg['statement'][:200]}")
+        if agg['routes']:
+            print(f"   routes: {', '.join(sorted(agg['routes']))}")
+        if args.plans and agg['plan']:
+            for line in agg['plan']:
+                print(f"     | {line}")
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,134 @@
+"""
+Delta sync: what changed for a user since a cursor.
+
+Every write stamps the rows it touches with `change_seq`, the user's next
+change number, taken by next_seq() in the same transaction:
+
+    UPDATE "user" SET change_seq = change_seq + 1 WHERE id = :user RETURNING change_seq
+
+The UPDATE also locks the user's row until the commit, so a user's writes
+commit in the order of their numbers. A reader that sees number N has
+therefore seen every row stamped N or lower, and GET /api/sync?cursor=N can
+return exactly the rows stamped higher. Soft deletes stamp the row like any
+other change; the deleted row is the tombstone.
+
+Tombstones last until the purge removes the row. The purge records the
+highest number it removed in `user.purged_seq` (see soft_delete.py); a
+cursor below it can have missed deletions, so that client gets a full
+snapshot again (`reset`), as does a cursor above the user's number.
+
+Not reported as changes: sessions of a deleted task (the task's tombstone
+covers them), rows moved to the archive (still listed by
+GET /api/tasks/history) and instances detached from a purged template.
+Rows written before change numbers existed carry 0 and arrive with the
+first full snapshot.
+"""
+from sqlalchemy import select
+
+import archive
+import soft_delete
+
+DEFAULT_LIMIT = 500
+
+
+def next_seq(conn, user_table, user_id, *conditions):
+    """Take the user's next change number; holds the user's row lock until the commit.
+
+    With `conditions` (e.g. that the task to write exists) the number is only
+    taken if they hold, in the same statement; None if they don't.
+    """
+    u = user_table
+    statement = u.update().where(u.c.id == user_id, *conditions).values(change_seq=u.c.change_seq + 1)
+    # A Session (request handlers) or a Connection (write-behind batches)
+    dialect = conn.dialect if hasattr(conn, 'dialect') else conn.get_bind().dialect
+    if dialect.update_returning:
+        return conn.execute(statement.returning(u.c.change_seq)).scalar_one_or_none()
+    if not conn.execute(statement).rowcount:
+        return None
+    return conn.execute(select(u.c.change_seq).where(u.c.id == user_id)).scalar_one()
+
+
+def current_seq(conn, user_table, user_id):
+    """The user's last change number"""
+    u = user_table
+    return conn.execute(select(u.c.change_seq).where(u.c.id == user_id)).scalar_one()
+
+
+def parse_cursor(value):
+    """The cursor of a request; None for a full snapshot. Raises ValueError"""
+    if value in (None, ''):
+        return None
+    cursor = int(value)
+    if cursor < 0:
+        raise ValueError('cursor must not be negative')
+    return cursor
+
+
+def _changed(conn, table, user_id, cursor, upper, limit, *conditions):
+    """Rows stamped in (cursor, upper], by change number; limit + 1 to tell if there are more"""
+    statement = select(table).where(
+        table.c.user_id == user_id, table.c.change_seq <= upper, *conditions
+    ).order_by(table.c.change_seq, table.c.id)
+    if cursor is not None:
+        statement = statement.where(table.c.change_seq > cursor)
+    if limit is not None:
+        statement = statement.limit(limit + 1)
+    return conn.execute(statement).all()
+
+
+def changes(conn, tables, user_id, cursor=None, limit=DEFAULT_LIMIT):
+    """Tasks, templates and sessions changed after `cursor` (everything live if None).
+
+    Returns the rows, the ids of deleted tasks and templates, the next cursor
+    and whether more pages follow. A page never splits the rows of one change
+    number, so a change larger than `limit` arrives whole.
+    """
+    task, session, user = tables
+    current, purged = conn.execute(
+        select(user.c.change_seq, user.c.purged_seq).where(user.c.id == user_id)
+    ).one()
+    # Tombstones this client needs are gone, or the cursor is not ours: start over
+    reset = cursor is not None and (cursor < purged or cursor > current)
+    if reset:
+        cursor = None
+
+    # A full snapshot leaves deleted rows out: the client has nothing to remove
+    sources = [
+        (task, () if cursor is not None else (task.c.deleted_at.is_(None),)),
+        (session, (soft_delete.live_sessions(session, task, user_id),)),
+    ]
+    pages = [_changed(conn, table, user_id, cursor, current, limit, *conditions) for table, conditions in sources]
+    upper = current
+    for rows in pages:
+        if len(rows) > limit:
+            upper = min(upper, rows[limit].change_seq - 1)
+    if upper < current:
+        upper = max(upper, min(rows[0].change_seq for rows in pages if rows))
+        for i, (table, conditions) in enumerate(sources):
+            if len(pages[i]) > limit and pages[i][limit].change_seq <= upper:
+                pages[i] = _changed(conn, table, user_id, cursor, upper, None, *conditions)
+            else:
+                pages[i] = [row for row in pages[i][:limit] if row.change_seq <= upper]
+    task_rows, session_rows = pages
+
+    result = {'tasks': [], 'recurring_tasks': [], 'pomodoro_sessions': [session_dict(row) for row in session_rows],
+              'deleted': {'tasks': [], 'recurring_tasks': []}}
+    for row in task_rows:
+        kind = 'recurring_tasks' if row.is_recurring and row.recurring_parent_id is None else 'tasks'
+        if row.deleted_at is not None:
+            result['deleted'][kind].append(row.id)
+        else:
+            result[kind].append(archive.task_dict(row._mapping))
+    result.update(cursor=str(upper), has_more=upper < current, reset=reset)
+    return result
+
+
+def session_dict(row):
+    """A session row serialized like PomodoroSession.to_dict"""
+    return {
+        'id': row.id,
+        'task_id': row.task_id,
+        'duration': row.duration,
+        'type': row.type,
+        'completed_at': row.completed_at.isoformat(),
+    }
@@ -0,0 +1,142 @@
+"""
+Denormalized per-task focus counters.
+
+`task.work_pomodoro_count` and `task.focus_minutes` are kept up to date in the
+same transaction as the pomodoro session that changes them, with
+`UPDATE task SET x = x + :n` so concurrent sessions never lose an increment.
+Task listings read the counters instead of loading every session.
+
+Counters can drift if sessions are changed outside the app (manual SQL,
+restores). `check` compares them against the sessions in task-id ranges and
+`repair` recomputes the mismatched tasks.
+
+Usage:
+    python task_counters.py check
+    python task_counters.py repair --chunk-size 5000
+"""
+import argparse
+import logging
+
+from sqlalchemy import MetaData, and_, create_engine, func, inspect, or_, select
+
+from db_url import database_url_from_env
+
+logger = logging.getLogger(__name__)
+
+
+def apply_session(conn, task_table, user_id, task_id, session_type, duration, sign=1, change_seq=None):
+    """Add (sign=1) or remove (sign=-1) one session's contribution to its task"""
+    if task_id is None or session_type != 'work':
+        return
+    apply_totals(conn, task_table, user_id, task_id, sign, sign * (duration or 0), change_seq)
+
+
+def apply_totals(conn, task_table, user_id, task_id, sessions, minutes, change_seq=None):
+    """Add `sessions` work sessions totalling `minutes` to a task (batched writers).
+    `change_seq` stamps the task as changed for delta sync (see sync.py)"""
+    values = {
+        'work_pomodoro_count': task_table.c.work_pomodoro_count + sessions,
+        'focus_minutes': task_table.c.focus_minutes + minutes,
+    }
+    if change_seq is not None:
+        values['change_seq'] = change_seq
+    conn.execute(task_table.update().where(task_table.c.id == task_id, task_table.c.user_id == user_id)
+                 .values(**values))
+
+
+def recompute_sql(task_table, session_table):
+    """SET clause recomputing both counters from the sessions (used by backfills)"""
+    sessions = f"FROM {session_table} s WHERE s.task_id = {task_table}.id AND s.type = 'work'"
+    return (f'work_pomodoro_count = (SELECT COUNT(*) {sessions}), '
+            f'focus_minutes = (SELECT COALESCE(SUM(s.duration), 0) {sessions})')
+
+
+def _actual(session_table, lo, hi):
+    return (
+        select(
+            session_table.c.task_id,
+            func.count().label('count'),
+            func.coalesce(func.sum(session_table.c.duration), 0).label('minutes'),
+        ).where(
+            session_table.c.task_id.between(lo, hi), session_table.c.type == 'work'
+        ).group_by(session_table.c.task_id).subquery('actual')
+    )
+
+
+def mismatches(conn, task_table, session_table, lo, hi):
+    """Tasks in [lo, hi] whose counters disagree with their sessions"""
+    actual = _actual(session_table, lo, hi)
+    count = func.coalesce(actual.c.count, 0)
+    minutes = func.coalesce(actual.c.minutes, 0)
+    return conn.execute(
+        select(task_table.c.id, task_table.c.work_pomodoro_count, task_table.c.focus_minutes,
+               count.label('count'), minutes.label('minutes'))
+        .select_from(task_table.outerjoin(actual, actual.c.task_id == task_table.c.id))
+        .where(
+            task_table.c.id.between(lo, hi),
+            or_(task_table.c.work_pomodoro_count != count, task_table.c.focus_minutes != minutes)
+        )
+    ).all()
+
+
+def repair_rows(conn, task_table, session_table, ids):
+    """Recompute the counters of `ids` inside the UPDATE, so concurrent increments are not lost"""
+    work = and_(session_table.c.task_id == task_table.c.id, session_table.c.type == 'work')
+    conn.execute(task_table.update().where(task_table.c.id.in_(ids)).values(
+        work_pomodoro_count=select(func.count()).where(work).scalar_subquery(),
+        focus_minutes=select(func.coalesce(func.sum(session_table.c.duration), 0)).where(work).scalar_subquery(),
+    ))
+
+
+def scan(engine, pairs, chunk_size=5000, repair=False):
+    """Check (and optionally repair) every (task table, session table) pair; returns mismatch count"""
+    found = 0
+    for task_table, session_table in pairs:
+        with engine.connect() as conn:
+            low, high = conn.execute(select(func.min(task_table.c.id), func.max(task_table.c.id))).one()
+        if low is None:
+            continue
+        for lo in range(low, high + 1, chunk_size):
+            hi = min(lo + chunk_size - 1, high)
+            with engine.begin() as conn:
+                rows = mismatches(conn, task_table, session_table, lo, hi)
+                for row in rows[:10]:
+                    logger.warning('%s %s: stored %s/%s min, actual %s/%s min', task_table.name, row.id,
+                                   row.work_pomodoro_count, row.focus_minutes, row.count, row.minutes)
+                if repair and rows:
+                    repair_rows(conn, task_table, session_table, [row.id for row in rows])
+            found += len(rows)
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check or repair the per-task pomodoro counters')
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL or instance/tasks.db')
+    parser.add_argument('command', choices=['check', 'repair'])
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Task ids per query')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    engine = create_engine(database_url_from_env(args.database_url))
+    names = set(inspect(engine).get_table_names())
+    if 'work_pomodoro_count' not in {c['name'] for c in inspect(engine).get_columns('task')}:
+        print("❌ Counter columns not found - run migrate_db.py first")
+        return 1
+    metadata = MetaData()
+    pairs = [('task', 'pomodoro_session'), ('task_archive', 'pomodoro_session_archive')]
+    metadata.reflect(engine, only=[name for pair in pairs for name in pair if name in names])
+    pairs = [(metadata.tables[t], metadata.tables[s]) for t, s in pairs if t in names and s in names]
+
+    found = scan(engine, pairs, args.chunk_size, repair=args.command == 'repair')
+    if not found:
+        print("✅ All task counters match their pomodoro sessions")
+    elif args.command == 'repair':
+        print(f"🔧 Repaired {found} tasks")
+    else:
+        print(f"⚠️  {found} tasks have stale counters - run: python task_counters.py repair")
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,85 @@
+"""
+Core fast path for the hot task reads.
+
+GET /api/tasks, GET /api/recurring-tasks, GET /api/dashboard and the
+analytics summary only serialize tasks, they never change them. Loading
+them as ORM `Task` objects (identity map, instance state, attribute
+instrumentation) costs more than the query for a long list, so these reads
+select the columns the responses need as plain rows and turn each row into
+its dict directly. Writes keep using the ORM.
+
+The statements are lambda_stmt()s. SQLAlchemy builds each one once, caches
+it together with its compiled SQL under the lambda's code location, and on
+every later call only extracts the new parameter values (user, dates), so a
+request skips both building the select and computing its cache key.
+"""
+from sqlalchemy import lambda_stmt, or_, select
+
+# What task_dict() needs, in this order (not user_id, deleted_at or change_seq)
+COLUMNS = ('id', 'title', 'description', 'priority', 'completed', 'due_date', 'created_at',
+           'work_pomodoro_count', 'focus_minutes', 'is_recurring', 'recurrence_type',
+           'recurrence_days', 'recurring_parent_id')
+
+
+def _columns(t):
+    return [t.c[name] for name in COLUMNS]
+
+
+def today_tasks(session, task_table, user_id, today):
+    """Today's live tasks without templates, highest priority first, as rows of COLUMNS"""
+    t, columns = task_table, _columns(task_table)
+    statement = lambda_stmt(lambda: select(*columns).where(
+        t.c.user_id == user_id,
+        t.c.due_date == today,
+        t.c.deleted_at.is_(None),
+        or_(t.c.is_recurring == False, t.c.is_recurring.is_(None))  # noqa: E712
+    ).order_by(t.c.priority.desc(), t.c.created_at.asc()))
+    return session.execute(statement).all()
+
+
+def window_tasks(session, task_table, user_id, start, end):
+    """Live tasks (templates included) due from `start` to `end`, highest priority first"""
+    t, columns = task_table, _columns(task_table)
+    statement = lambda_stmt(lambda: select(*columns).where(
+        t.c.user_id == user_id,
+        t.c.due_date >= start,
+        t.c.due_date <= end,
+        t.c.deleted_at.is_(None)
+    ).order_by(t.c.priority.desc(), t.c.created_at.asc()))
+    return session.execute(statement).all()
+
+
+def recurring_templates(session, task_table, user_id):
+    """The user's live recurring templates, newest first"""
+    t, columns = task_table, _columns(task_table)
+    statement = lambda_stmt(lambda: select(*columns).where(
+        t.c.user_id == user_id,
+        t.c.is_recurring == True,  # noqa: E712
+        t.c.recurring_parent_id.is_(None),  # templates, not their instances
+        t.c.deleted_at.is_(None)
+    ).order_by(t.c.created_at.desc()))
+    return session.execute(statement).all()
+
+
+def task_dict(row):
+    """A row of COLUMNS serialized like Task.to_dict"""
+    (task_id, title, description, priority, completed, due_date, created_at, pomodoros, minutes,
+     is_recurring, recurrence_type, recurrence_days, parent_id) = row
+    result = {
+        'id': task_id,
+        'title': title,
+        'description': description,
+        'priority': priority,
+        'completed': completed,
+        'due_date': due_date.isoformat(),
+        'created_at': created_at.isoformat(),
+        'pomodoro_count': pomodoros or 0,
+        'focus_minutes': minutes or 0,
+        'is_recurring': is_recurring,
+    }
+    if is_recurring:
+        result['recurrence_type'] = recurrence_type
+        result['recurrence_days'] = recurrence_days
+    if parent_id:
+        result['recurring_parent_id'] = parent_id
+    return result
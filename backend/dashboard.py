@@ -0,0 +1,137 @@
+"""
+The dashboard's first paint in one request.
+
+GET /api/dashboard returns what the dashboard used to fetch from four
+endpoints, in the same shapes: today's tasks, the analytics summary, the
+pomodoro stats and the recurring templates. It needs three queries in one
+transaction, plus whatever recurring generation writes:
+
+- the templates, which recurring generation loads anyway;
+- the live tasks due in the analytics window (this week and the last seven
+  days), from which both today's list and every analytics count are derived;
+- one aggregate over this week's work sessions.
+
+GET /api/analytics (without a range) and GET /api/pomodoros/stats use the
+same functions, so the numbers always agree.
+
+The response carries an ETag (a hash of the body) and `Cache-Control:
+no-cache`, so browsers revalidate it with If-None-Match and get an empty
+304 while nothing changed.
+"""
+import hashlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, select
+
+import soft_delete
+import task_reads
+
+
+def analytics_window(today):
+    """(first day of the analytics window, start of this week)"""
+    week_start = today - timedelta(days=today.weekday())
+    return min(week_start, today - timedelta(days=6)), week_start
+
+
+def load_tasks(session, task_table, user_id, today):
+    """The user's live tasks due in the analytics window, highest priority first (rows of
+    task_reads.COLUMNS)"""
+    start, _ = analytics_window(today)
+    return task_reads.window_tasks(session, task_table, user_id, start, today)
+
+
+def today_tasks(rows, today, pending=None):
+    """Today's tasks (without templates) as GET /api/tasks lists them; `pending` maps task ids
+    to (pomodoros, minutes) not written yet"""
+    tasks = []
+    for row in rows:
+        if row.due_date != today or row.is_recurring:
+            continue
+        task = task_reads.task_dict(row)
+        if pending and task['id'] in pending:
+            task['pomodoro_count'] += pending[task['id']][0]
+            task['focus_minutes'] += pending[task['id']][1]
+        tasks.append(task)
+    return tasks
+
+
+def _rate(completed, total):
+    return round((completed / total * 100) if total > 0 else 0, 1)
+
+
+def task_analytics(rows, today):
+    """The GET /api/analytics summary: today, this week, the 7-day trend and completion by priority"""
+    _, week_start = analytics_window(today)
+    week = [row for row in rows if row.due_date >= week_start]
+
+    def counts(tasks):
+        return sum(1 for task in tasks if task.completed), len(tasks)
+
+    today_completed, today_total = counts([row for row in rows if row.due_date == today])
+    week_completed, week_total = counts(week)
+
+    daily_stats = []
+    for i in range(6, -1, -1):
+        day = today - timedelta(days=i)
+        completed, total = counts([row for row in rows if row.due_date == day])
+        daily_stats.append({'date': day.isoformat(), 'completed': completed, 'total': total,
+                            'day': day.strftime('%a')})
+
+    priority_stats = []
+    for priority in range(1, 6):
+        completed, total = counts([row for row in week if row.priority == priority])
+        priority_stats.append({'priority': priority, 'completed': completed, 'total': total})
+
+    return {
+        'today': {'completed': today_completed, 'total': today_total,
+                  'rate': _rate(today_completed, today_total)},
+        'week': {'completed': week_completed, 'total': week_total,
+                 'rate': _rate(week_completed, week_total)},
+        'daily_trend': daily_stats,
+        'priority_stats': priority_stats
+    }
+
+
+def pomodoro_stats(session, session_table, task_table, user_id, today, pending=()):
+    """Work sessions and focus minutes today and this week, in one aggregate query.
+    `pending` holds sessions accepted but not written yet (write-behind events)"""
+    s = session_table
+    _, week_start = analytics_window(today)
+    # Plain ranges on completed_at (rather than date(completed_at) == today) can use
+    # the (user_id, completed_at) index and prune monthly partitions on PostgreSQL
+    week_start_at = datetime.combine(week_start, datetime.min.time())
+    today_start = datetime.combine(today, datetime.min.time())
+    tomorrow_start = today_start + timedelta(days=1)
+    is_today = s.c.completed_at >= today_start
+    week_count, week_minutes, today_count, today_minutes = session.execute(
+        select(
+            func.count(),
+            func.sum(s.c.duration),
+            func.sum(case((is_today, 1), else_=0)),
+            func.sum(case((is_today, s.c.duration), else_=0))
+        ).where(
+            s.c.user_id == user_id,
+            s.c.type == 'work',
+            s.c.completed_at >= week_start_at,
+            s.c.completed_at < tomorrow_start,
+            soft_delete.live_sessions(s, task_table, user_id)
+        )
+    ).one()
+    stats = {
+        'today': {'count': today_count or 0, 'focus_time': today_minutes or 0},
+        'week': {'count': week_count, 'focus_time': week_minutes or 0},
+    }
+    for event in pending:
+        if event['type'] == 'work' and week_start_at <= event['completed_at'] < tomorrow_start:
+            periods = ('week', 'today') if event['completed_at'] >= today_start else ('week',)
+            for period in periods:
+                stats[period]['count'] += 1
+                stats[period]['focus_time'] += event['duration']
+    return stats
+
+
+def conditional(response, request):
+    """Tag a JSON response with an ETag of its body; 304 if the request already has it"""
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
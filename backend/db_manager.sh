@@ -26,6 +26,7 @@ show_usage() {
     echo "  list            List all available backups"
     echo "  restore [file]  Restore database from a backup file"
     echo "  verify          Verify current database status"
+    echo "  migrate         Apply pending schema migrations"
     echo "  help            Show this help message"
     echo ""
 }
@@ -119,6 +120,10 @@ verify_database() {
     python3 "$SCRIPT_DIR/verify_database.py"
 }
 
+migrate_database() {
+    python3 "$SCRIPT_DIR/migrate_db.py" up
+}
+
 # Main script logic
 case "$1" in
     backup)
@@ -133,6 +138,9 @@ case "$1" in
     verify)
         verify_database
         ;;
+    migrate)
+        migrate_database
+        ;;
     help|--help|-h)
         show_usage
         ;;
@@ -0,0 +1,85 @@
+"""
+Gunicorn settings for serving backend/app.py in production.
+
+    gunicorn -c gunicorn.conf.py app:app      (or ./start_server.sh)
+
+The app is imported once in the master (preload_app), which creates the
+schema and then forks the workers, so they share its memory pages
+copy-on-write. Each worker then drops the connections it inherited
+(post_fork): two processes must never use the same database connection.
+Background threads are started in the workers, never in the master: the
+job workers right after the fork (so queued jobs run even before a request
+arrives), the write-behind flusher on first use.
+
+Workers are recycled after GUNICORN_MAX_REQUESTS requests (with jitter so
+they do not all restart at once). `kill -HUP <master>` (or
+`./start_server.sh reload`) replaces the workers gracefully: in-flight
+requests finish, new ones go to the new workers (see gunicorn_worker.py for
+why the stock gthread worker is not used). Code changes need a restart,
+because the code is loaded before the fork.
+
+Settings (environment):
+    PORT                    5000
+    WEB_CONCURRENCY         worker processes (default: CPU count)
+    GUNICORN_THREADS        threads per worker (default 4)
+    GUNICORN_MAX_REQUESTS   requests before a worker is recycled (default 1000, 0 = never)
+    GUNICORN_TIMEOUT        seconds before a stuck worker is killed (default 30)
+    GUNICORN_ACCESS_LOG     access log file, `-` for stdout (default: none)
+    GUNICORN_PIDFILE        default instance/gunicorn.pid (used by start_server.sh reload)
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gunicorn_worker.DrainingThreadWorker'  # gthread that answers every accepted request
+preload_app = True
+
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+instance_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+os.makedirs(instance_dir, exist_ok=True)
+pidfile = os.environ.get('GUNICORN_PIDFILE', os.path.join(instance_dir, 'gunicorn.pid'))
+
+
+def _engines():
+    from app import app, db
+    with app.app_context():
+        return list(db.engines.values())
+
+
+def when_ready(server):
+    """In the master, after the preload and before the first fork"""
+    from app import app, db
+    with app.app_context():
+        db.create_all()
+    for engine in _engines():  # the main database and the shards (SHARD_COUNT)
+        if engine.dialect.name == 'sqlite':
+            # Readers in one worker must not wait for a writer in another
+            with engine.connect() as conn:
+                conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+        engine.dispose()
+
+
+def post_fork(server, worker):
+    # Forget the pooled connections copied from the master without closing them
+    # (close=False): they still belong to it
+    for engine in _engines():
+        engine.dispose(close=False)
+    # Jobs queued before this worker started (a restart, a recycled worker)
+    from app import start_jobs
+    start_jobs()
+
+
+def worker_exit(server, worker):
+    """Write buffered pomodoro sessions before a recycled or reloaded worker exits"""
+    from app import pomodoro_buffer
+    if pomodoro_buffer is not None:
+        pomodoro_buffer.close()
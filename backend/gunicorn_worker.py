@@ -0,0 +1,35 @@
+"""
+Gunicorn's threaded worker, without dropping connections when it exits.
+
+The stock gthread worker accepts a connection, then waits in its event loop
+for the request to arrive before handing it to a thread. When the worker
+stops (recycled after max_requests, or replaced by a HUP reload) the
+connections still waiting there are closed unanswered, and their clients
+see "connection reset". This worker hands every accepted connection to the
+thread pool at once; the worker waits for the pool (up to graceful_timeout)
+before it exits, so each accepted request gets its response.
+
+A thread now waits for the request instead of the event loop, so a socket
+timeout keeps clients that connect and send nothing from holding a thread.
+"""
+import errno
+
+from gunicorn.workers.gthread import TConn, ThreadWorker
+
+
+class DrainingThreadWorker(ThreadWorker):
+    def accept(self, server, listener):
+        try:
+            sock, client = listener.accept()
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.ECONNABORTED, errno.EWOULDBLOCK):
+                raise
+            return
+        self.nr_conns += 1
+        self.enqueue_req(TConn(self.cfg, sock, client, server))
+
+    def enqueue_req(self, conn):
+        conn.init()
+        conn.sock.settimeout(self.cfg.timeout)
+        fs = self.tpool.submit(self.handle, conn)
+        self._wrap_future(fs, conn)
@@ -0,0 +1,345 @@
+"""
+Durable job queue for deferred work, stored in the app's own database.
+
+A route whose follow-up work does not change its response (purging what it
+deleted, archiving) inserts a row into `job` inside its own transaction and
+returns: the job exists exactly when the route's changes were committed, and
+survives restarts. Workers claim due jobs, run the handler registered for
+the job's kind and delete the row once it succeeds.
+
+- **Claiming:** one `UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED)
+  RETURNING`. On PostgreSQL concurrent workers skip the rows another worker
+  is claiming instead of waiting for it. SQLite has no row locks: the
+  statement takes the database's write lock, so one claimer at a time.
+- **Leases:** a claimed job is `running` until `locked_until`. If its worker
+  dies, the job is claimed again once the lease has expired, so handlers
+  must be safe to run twice.
+- **Retries:** a failed job is queued again after JOB_RETRY_BASE_SECONDS x
+  2^(attempts - 1), with jitter and capped at an hour. After `max_attempts`
+  it stays `failed` for inspection (`python jobs.py retry` queues it again).
+- **Priority:** higher first, then the longest due.
+- **Deduplication:** at most one queued job per `dedup_key` (a partial unique
+  index); enqueueing another one is a no-op.
+
+Where jobs run: the backend starts JOB_WORKERS threads in each process that
+serves requests, whether or not it queues anything itself: jobs queued
+before a restart are picked up by the next process (JobWorker). Serverless
+deployments call POST
+/api/admin/jobs/run from a scheduler, or run `python jobs.py work` on a
+machine that stays up.
+
+Usage:
+    python jobs.py status
+    python jobs.py work --max-seconds 60
+    python jobs.py retry --kind purge
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import (Column, DateTime, Index, Integer, MetaData, String, Table, Text, and_, create_engine,
+                        func, or_, select, text)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+
+from db_url import database_url_from_env
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, FAILED = 'queued', 'running', 'failed'
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_LEASE_SECONDS = 300
+MAX_RETRY_DELAY_SECONDS = 3600
+
+
+def define_job_table(metadata):
+    """The `job` table, added to `metadata` (the app's, so create_all() makes it)"""
+    return Table(
+        'job', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('kind', String(50), nullable=False),
+        Column('payload', Text, nullable=False),  # JSON
+        Column('priority', Integer, nullable=False, default=0),
+        Column('dedup_key', String(200)),
+        Column('status', String(10), nullable=False),
+        Column('attempts', Integer, nullable=False, default=0),
+        Column('max_attempts', Integer, nullable=False),
+        Column('run_at', DateTime, nullable=False),  # due from; pushed back by retries
+        Column('created_at', DateTime, nullable=False),
+        Column('locked_until', DateTime),  # lease of the worker running it
+        Column('last_error', Text),
+        # What the claim scans: due jobs by priority
+        Index('ix_job_status_priority_run_at', 'status', 'priority', 'run_at'),
+        Index('ux_job_queued_dedup_key', 'dedup_key', unique=True,
+              sqlite_where=text("status = 'queued'"), postgresql_where=text("status = 'queued'")),
+    )
+
+
+def create_table(engine):
+    """Create `job` in an existing database (migration 0011)"""
+    define_job_table(MetaData()).create(engine, checkfirst=True)
+
+
+def enqueue(conn, table, kind, payload=None, priority=0, delay_seconds=0, dedup_key=None,
+            max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Add a job in the caller's transaction (a Connection or Session). Returns its id, or None
+    if a job with the same `dedup_key` is already queued"""
+    now = datetime.utcnow()
+    values = dict(kind=kind, payload=json.dumps(payload or {}), priority=priority, dedup_key=dedup_key,
+                  status=QUEUED, attempts=0, max_attempts=max_attempts,
+                  run_at=now + timedelta(seconds=delay_seconds), created_at=now)
+    dialect = conn.dialect.name if hasattr(conn, 'dialect') else conn.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    statement = insert(table).values(**values)
+    if dedup_key is not None:
+        statement = statement.on_conflict_do_nothing(index_elements=['dedup_key'],
+                                                     index_where=table.c.status == QUEUED)
+    return conn.execute(statement.returning(table.c.id)).scalar()
+
+
+def claim(engine, table, limit=1, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """Mark up to `limit` due jobs as running under a lease; returns their rows, most urgent first"""
+    now = datetime.utcnow()
+    t = table
+    due = select(t.c.id).where(or_(
+        and_(t.c.status == QUEUED, t.c.run_at <= now),
+        and_(t.c.status == RUNNING, t.c.locked_until < now)  # the worker holding it is gone
+    )).order_by(t.c.priority.desc(), t.c.run_at, t.c.id).limit(limit).with_for_update(skip_locked=True)
+    with engine.begin() as conn:
+        rows = conn.execute(
+            t.update().where(t.c.id.in_(due))
+            .values(status=RUNNING, attempts=t.c.attempts + 1, locked_until=now + timedelta(seconds=lease_seconds))
+            .returning(t.c.id, t.c.kind, t.c.payload, t.c.priority, t.c.attempts, t.c.max_attempts, t.c.run_at)
+        ).all()
+    return sorted(rows, key=lambda row: (-row.priority, row.run_at, row.id))
+
+
+def retry_delay(attempts, base_seconds):
+    """Exponential backoff with jitter, so jobs that failed together do not retry together"""
+    delay = min(base_seconds * 2 ** (attempts - 1), MAX_RETRY_DELAY_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def finish(engine, table, job_id):
+    with engine.begin() as conn:
+        conn.execute(table.delete().where(table.c.id == job_id))
+
+
+def _no_queued_twin(table):
+    # Re-queueing a job must not collide with a job queued since under the same key
+    queued = table.alias('queued')
+    return ~select(queued.c.id).where(queued.c.dedup_key == table.c.dedup_key, queued.c.status == QUEUED).exists()
+
+
+def fail(engine, table, job, error, base_seconds):
+    """Queue the job again after a backoff, or give up on it. Returns True if it will be retried"""
+    t = table
+    with engine.begin() as conn:
+        if job.attempts >= job.max_attempts:
+            conn.execute(t.update().where(t.c.id == job.id).values(status=FAILED, locked_until=None,
+                                                                     last_error=error))
+            return False
+        retried = conn.execute(
+            t.update().where(t.c.id == job.id, _no_queued_twin(t)).values(
+                status=QUEUED, locked_until=None, last_error=error,
+                run_at=datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts, base_seconds)))
+        ).rowcount
+        if not retried:
+            # The job queued under the same key will do the work
+            conn.execute(t.delete().where(t.c.id == job.id))
+    return True
+
+
+def depth(conn, table):
+    """Jobs per status, and how long the longest-waiting due job has waited"""
+    counts = dict(conn.execute(select(table.c.status, func.count()).group_by(table.c.status)).all())
+    oldest = conn.execute(select(func.min(table.c.run_at)).where(
+        table.c.status == QUEUED, table.c.run_at <= datetime.utcnow())).scalar()
+    return {
+        'queued': counts.get(QUEUED, 0),
+        'running': counts.get(RUNNING, 0),
+        'failed': counts.get(FAILED, 0),
+        'oldest_due_seconds': round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0,
+    }
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    return {'p50': round(ordered[len(ordered) // 2], 1), 'p95': round(ordered[int(len(ordered) * 0.95)], 1)}
+
+
+class JobQueue:
+    """The handlers, by kind, and the databases whose `job` tables they serve.
+
+    A handler is called as handler(engine, payload) with the engine the job
+    was queued in; an exception counts as a failure and is retried.
+    """
+
+    def __init__(self, table, engines, lease_seconds=DEFAULT_LEASE_SECONDS, retry_base_seconds=30):
+        self.table = table
+        self.engines = engines
+        self.lease_seconds = lease_seconds
+        self.retry_base_seconds = retry_base_seconds
+        self.handlers = {}
+        self.stats = Counter()
+        self._waits = deque(maxlen=1000)  # ms from due to started
+        self._runs = deque(maxlen=1000)  # ms running
+
+    def handler(self, kind):
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    def run_one(self, engine):
+        """Claim and run one due job from `engine`; returns False if none was due"""
+        jobs = claim(engine, self.table, 1, self.lease_seconds)
+        if not jobs:
+            return False
+        job = jobs[0]
+        self._waits.append((datetime.utcnow() - job.run_at).total_seconds() * 1000)
+        started = time.perf_counter()
+        try:
+            handler = self.handlers.get(job.kind)
+            if handler is None:
+                raise LookupError(f'No handler for job kind {job.kind!r}')
+            handler(engine, json.loads(job.payload))
+        except Exception as error:
+            retried = fail(engine, self.table, job, f'{type(error).__name__}: {error}', self.retry_base_seconds)
+            self.stats['retried' if retried else 'failed'] += 1
+            logger.warning('Job %s (%s) failed, attempt %s of %s: %s', job.id, job.kind, job.attempts,
+                           job.max_attempts, error)
+        else:
+            finish(engine, self.table, job.id)
+            self.stats['done'] += 1
+            self.stats[f'done.{job.kind}'] += 1
+        self._runs.append((time.perf_counter() - started) * 1000)
+        return True
+
+    def run_for(self, max_seconds):
+        """Run due jobs until none is left or `max_seconds` have passed (for schedulers)"""
+        started = time.monotonic()
+        ran = 0
+        while time.monotonic() - started < max_seconds:
+            done = sum(self.run_one(engine) for engine in self.engines)
+            if not done:
+                return {'ran': ran, 'complete': True}
+            ran += done
+        return {'ran': ran, 'complete': False}
+
+    def metrics(self):
+        totals = Counter()
+        oldest = 0
+        for engine in self.engines:
+            with engine.connect() as conn:
+                counts = depth(conn, self.table)
+            oldest = max(oldest, counts.pop('oldest_due_seconds'))
+            totals.update(counts)
+        return dict(self.stats, **totals, oldest_due_seconds=oldest,
+                    wait_ms=_percentiles(self._waits), run_ms=_percentiles(self._runs))
+
+
+class JobWorker:
+    """`threads` threads running due jobs in this process.
+
+    The app starts the pool once the process serves requests (gunicorn's
+    post_fork, the first request) rather than at import, so it runs in the
+    process that serves them, not a parent that forks them. Idle threads look
+    for due jobs every `poll_seconds`.
+    """
+
+    def __init__(self, queue, threads=2, poll_seconds=1.0):
+        self.queue = queue
+        self.threads = threads
+        self.poll_seconds = poll_seconds
+        self._pool = []
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if not self._pool:
+            with self._lock:
+                if not self._pool:
+                    self._pool = [threading.Thread(target=self._run, name=f'jobs-{i}', daemon=True)
+                                  for i in range(self.threads)]
+                    for thread in self._pool:
+                        thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                busy = any([self.queue.run_one(engine) for engine in self.queue.engines])
+            except SQLAlchemyError as error:
+                self.queue.stats['errors'] += 1
+                logger.warning('Claiming jobs failed, retrying in %ss: %s', self.poll_seconds, error)
+                busy = False
+            if not busy:
+                time.sleep(self.poll_seconds)
+
+
+def _load_app():
+    """The app module next to this file, which registers the handlers"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    return importlib.import_module('index' if os.path.exists(os.path.join(here, 'index.py')) else 'app')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run and inspect deferred jobs')
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL or instance/tasks.db')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help='Jobs per kind and status')
+    work = sub.add_parser('work', help="Run due jobs with the app's handlers")
+    work.add_argument('--max-seconds', type=float, help='Stop after this long (default: run until stopped)')
+    work.add_argument('--poll-seconds', type=float, default=1.0)
+    retry = sub.add_parser('retry', help='Queue failed jobs again')
+    retry.add_argument('--kind')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    if args.command == 'work':
+        if args.database_url:
+            os.environ['DATABASE_URL'] = args.database_url
+        queue = _load_app().job_queue
+        deadline = None if args.max_seconds is None else time.monotonic() + args.max_seconds
+        while deadline is None or time.monotonic() < deadline:
+            if queue.run_for(60 if deadline is None else deadline - time.monotonic())['complete']:
+                time.sleep(args.poll_seconds)
+        print(f"✅ Ran {queue.stats['done']} jobs ({queue.stats['retried']} retries, {queue.stats['failed']} failed)")
+        return 0
+
+    engine = create_engine(database_url_from_env(args.database_url))
+    create_table(engine)
+    table = define_job_table(MetaData())
+
+    if args.command == 'status':
+        with engine.connect() as conn:
+            rows = conn.execute(select(table.c.kind, table.c.status, func.count())
+                                .group_by(table.c.kind, table.c.status).order_by(table.c.kind)).all()
+            summary = depth(conn, table)
+        for kind, status, count in rows:
+            print(f'{kind:<20} {status:<8} {count}')
+        print(f"📊 {summary['queued']} queued, {summary['running']} running, {summary['failed']} failed; "
+              f"oldest due job waiting {summary['oldest_due_seconds']}s")
+        return 0
+
+    # retry
+    with engine.begin() as conn:
+        condition = and_(table.c.status == FAILED, _no_queued_twin(table))
+        if args.kind:
+            condition = and_(condition, table.c.kind == args.kind)
+        count = conn.execute(table.update().where(condition).values(
+            status=QUEUED, attempts=0, run_at=datetime.utcnow(), last_error=None)).rowcount
+    print(f'✅ Queued {count} failed jobs again')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
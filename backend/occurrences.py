@@ -0,0 +1,164 @@
+"""
+Recurring occurrences for calendar ranges, computed instead of stored.
+
+GET /api/calendar?from=&to= lists the tasks due in a range. The occurrences
+of recurring templates that have no row yet are derived from the templates
+in memory ("virtual" occurrences: `id` null, `virtual` true), so viewing a
+month costs no writes and no rows. An occurrence is written only when the
+user acts on it:
+
+- PUT /api/recurring-tasks/<id>/occurrences/<date> writes it and applies the
+  changes in the body (completed, title, description, priority);
+- DELETE /api/recurring-tasks/<id>/occurrences/<date> skips it. The row is
+  written already deleted and acts as the exception that hides that day.
+
+Today's occurrences are still written when GET /api/tasks lists them:
+today's list is where tasks get pomodoros. Each instance row remembers the
+day it stands for in `occurrence_date`, so an instance moved to another due
+date still hides its original day and is never generated a second time.
+
+Virtual occurrences start today. Past days show the rows that exist: what
+happened, not what was scheduled. Skipped days are only kept until they
+are over (see soft_delete.py), so the past could not be computed anyway.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, select
+
+import archive
+import task_reads
+
+MAX_DAYS = 92
+
+
+def parse_range_args(args, today):
+    """Validate ?from=&to= (default: this day and the next six); raises ValueError"""
+    try:
+        start = datetime.strptime(args['from'], '%Y-%m-%d').date() if args.get('from') else today
+        end = datetime.strptime(args['to'], '%Y-%m-%d').date() if args.get('to') else start + timedelta(days=6)
+    except ValueError:
+        raise ValueError('Dates must be formatted as YYYY-MM-DD')
+    if start > end:
+        raise ValueError('from must be before to')
+    if (end - start).days >= MAX_DAYS:
+        raise ValueError(f'Range too long (max {MAX_DAYS} days)')
+    return start, end
+
+
+def occurs_on(template, day):
+    """True if the template (a row) recurs on `day`"""
+    if template.recurrence_type == 'daily':
+        return True
+    if template.recurrence_type == 'weekly' and template.recurrence_days:
+        # Comma-separated weekdays, 0 = Monday
+        return day.weekday() in [int(d.strip()) for d in template.recurrence_days.split(',')]
+    return False
+
+
+def _days(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def calendar(session, tables, user_id, start, end, today, templates=None):
+    """The user's tasks due in [start, end], written and virtual, by day and priority"""
+    task, _, task_archive, _ = tables
+    include_archive = archive.reaches_archive(session, task_archive, user_id, 'due_date', start)
+    tasks = archive.tiered(task, task_archive, include_archive)
+    rows = session.execute(
+        select(*[tasks.c[name] for name in task_reads.COLUMNS]).where(
+            tasks.c.user_id == user_id,
+            tasks.c.due_date >= start,
+            tasks.c.due_date <= end,
+            tasks.c.deleted_at.is_(None),
+            or_(tasks.c.is_recurring == False, tasks.c.is_recurring.is_(None))  # noqa: E712
+        )
+    ).all()
+    entries = [(row.due_date, row.priority, row.created_at, task_reads.task_dict(row)) for row in rows]
+
+    first = max(start, today)
+    if templates is None:
+        templates = task_reads.recurring_templates(session, task, user_id)
+    if first <= end and templates:
+        # Days that already have a row, wherever it is due now (or deleted: skipped)
+        written = set(session.execute(
+            select(task.c.recurring_parent_id, task.c.occurrence_date).where(
+                task.c.user_id == user_id,
+                task.c.recurring_parent_id.in_([template.id for template in templates]),
+                task.c.occurrence_date >= first,
+                task.c.occurrence_date <= end
+            )
+        ).tuples())
+        for day in _days(first, end):
+            for template in templates:
+                if occurs_on(template, day) and (template.id, day) not in written:
+                    entries.append((day, template.priority, template.created_at, virtual_dict(template, day)))
+
+    entries.sort(key=lambda entry: (entry[0], -(entry[1] or 0), entry[2]))
+    return {'from': start.isoformat(), 'to': end.isoformat(), 'tasks': [entry[3] for entry in entries]}
+
+
+def virtual_dict(template, day):
+    """An occurrence without a row, shaped like its instance would be"""
+    return {
+        'id': None,
+        'title': template.title,
+        'description': template.description,
+        'priority': template.priority,
+        'completed': False,
+        'due_date': day.isoformat(),
+        'created_at': template.created_at.isoformat(),
+        'pomodoro_count': 0,
+        'focus_minutes': 0,
+        'is_recurring': False,
+        'recurring_parent_id': template.id,
+        'virtual': True,
+    }
+
+
+def instance_values(template, user_id, day, change_seq):
+    """The row generation or materialize() writes for one occurrence"""
+    return {
+        'title': template.title,
+        'description': template.description,
+        'priority': template.priority,
+        'due_date': day,
+        'occurrence_date': day,
+        'user_id': user_id,
+        'is_recurring': False,
+        'recurring_parent_id': template.id,
+        'change_seq': change_seq,
+    }
+
+
+def find_template(session, task_table, user_id, template_id):
+    """The user's live recurring template (a row of task_reads.COLUMNS), or None"""
+    t = task_table
+    return session.execute(
+        select(*[t.c[name] for name in task_reads.COLUMNS]).where(
+            t.c.id == template_id,
+            t.c.user_id == user_id,
+            t.c.is_recurring.is_(True),
+            t.c.recurring_parent_id.is_(None),
+            t.c.deleted_at.is_(None)
+        )
+    ).first()
+
+
+def find_instance(session, task_table, user_id, template_id, day):
+    """(id, deleted_at) of the row written for the occurrence, or None"""
+    t = task_table
+    return session.execute(
+        select(t.c.id, t.c.deleted_at).where(
+            t.c.user_id == user_id,
+            t.c.recurring_parent_id == template_id,
+            t.c.occurrence_date == day
+        ).order_by(t.c.deleted_at.isnot(None), t.c.id)
+    ).first()
+
+
+def materialize(session, task_table, user_id, template, day, change_seq, deleted_at=None):
+    """Write the occurrence of `template` on `day`; returns the new row's id"""
+    values = instance_values(template, user_id, day, change_seq)
+    if deleted_at is not None:
+        values['deleted_at'] = deleted_at
+    return session.execute(task_table.insert().values(**values)).inserted_primary_key[0]
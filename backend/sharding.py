@@ -0,0 +1,397 @@
+"""
+User-sharded SQLite storage (optional).
+
+A SQLite file has one write lock, so with every user in instance/tasks.db
+all writers wait for each other. With SHARD_COUNT=N each user's data (tasks,
+sessions, archives, activity counters) lives in one of N files,
+SHARD_DIR/shard-<k>.db, and users on different shards write in parallel.
+
+The main database becomes the directory: the accounts (registration, login
+and token checks only read it) and `user_shard`, which shard holds each
+user. A new user is placed on blake2b(user_id) mod N. From then on the
+directory row decides, so changing SHARD_COUNT moves nobody until
+`rebalance` does.
+
+Per request, the app resolves the token's user to a shard (one primary-key
+read on the directory) and binds the session to that shard's engine
+(ShardedSession), so the views run unchanged. Code that needs the accounts
+themselves runs in `with directory():`. Each shard also has a `user` row
+for each of its users, with placeholder credentials: it carries the user's
+change numbers (sync.py) and the foreign keys.
+
+Moving a user marks it as moving in the directory (its requests get a 503
+with Retry-After), waits for requests already running, copies its rows into
+the target shard in one transaction, points the directory there and deletes
+the originals. Row ids are only unique within a file, so the copies get new
+ids, and the user's sync cursors are reset (its clients take a full
+snapshot). An interrupted move is finished by running it again.
+
+Turning sharding on for an existing database: stop the server, run
+`SHARD_COUNT=N python sharding.py init` (moves every user's data from the
+main database into its shard), start the server with the same SHARD_COUNT.
+Schema migrations run per file (migrations.py --database-url).
+
+Usage:
+    python sharding.py init
+    python sharding.py status
+    python sharding.py move --user 42 --to 3
+    python sharding.py rebalance --dry-run
+"""
+import argparse
+import hashlib
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import (Column, DateTime, Integer, MetaData, Table, func, insert, select,
+                        union_all)
+
+from db_url import database_url_from_env
+
+logger = logging.getLogger(__name__)
+
+directory_metadata = MetaData()
+
+user_shard = Table(
+    'user_shard', directory_metadata,
+    Column('user_id', Integer, primary_key=True, autoincrement=False),
+    Column('shard', Integer, nullable=False),
+    Column('moving_since', DateTime),  # set while sharding.py moves the user
+)
+
+
+class UserMoving(Exception):
+    """The user's data is being moved to another shard; retry shortly"""
+
+
+class ShardedSession(Session):
+    """Session that runs every statement on the shard bound to the current request"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            engine = g.get('shard_engine')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def directory():
+    """Run the statements in this block on the directory (the accounts)"""
+    engine = g.pop('shard_engine', None) if has_app_context() else None
+    try:
+        yield
+    finally:
+        if engine is not None:
+            g.shard_engine = engine
+
+
+def default_dir(basedir):
+    return os.path.join(basedir, 'instance', 'shards')
+
+
+def shard_binds(count, shard_dir):
+    """SQLALCHEMY_BINDS entries for the shard files"""
+    os.makedirs(shard_dir, exist_ok=True)
+    return {f'shard-{k}': 'sqlite:///' + os.path.join(shard_dir, f'shard-{k}.db') for k in range(count)}
+
+
+def default_shard(user_id, count):
+    """Where a new user goes: stable across processes and restarts, unlike hash()"""
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count
+
+
+def _placeholder(user_table, user_id):
+    """A shard's row of a user: no credentials, those stay in the directory"""
+    return insert(user_table).prefix_with('OR IGNORE').values(
+        id=user_id, username=f'user-{user_id}', email=f'user-{user_id}@shard.invalid', password='')
+
+
+class ShardMap:
+    """The shard engines and the directory lookups, for the app"""
+
+    def __init__(self, directory_engine, engines, metadata, user_table, task_table, on_moved=None):
+        self.directory_engine = directory_engine
+        self.engines = engines
+        self.user_table = user_table
+        self.task_table = task_table
+        self.on_moved = on_moved
+        self._served = {}  # user_id -> shard last served by this process
+        directory_metadata.create_all(directory_engine)
+        for engine in engines:
+            metadata.create_all(engine)
+
+    def shard_of(self, user_id):
+        """The user's shard, placing a user that has none. Raises UserMoving"""
+        with self.directory_engine.connect() as conn:
+            row = conn.execute(
+                select(user_shard.c.shard, user_shard.c.moving_since).where(user_shard.c.user_id == user_id)
+            ).first()
+        if row is None:
+            return self.place(user_id)
+        if row.moving_since is not None:
+            raise UserMoving(user_id)
+        return row.shard
+
+    def place(self, user_id):
+        """Assign the user to its default shard; its row there comes first, so the directory
+        never points at a shard without it"""
+        task = self.task_table
+        with self.directory_engine.connect() as conn:
+            if conn.execute(select(task.c.id).where(task.c.user_id == user_id).limit(1)).first():
+                raise RuntimeError(f'User {user_id} has data in the main database: run `python sharding.py init`')
+        shard = default_shard(user_id, len(self.engines))
+        with self.engines[shard].begin() as conn:
+            conn.execute(_placeholder(self.user_table, user_id))
+        with self.directory_engine.begin() as conn:
+            conn.execute(insert(user_shard).prefix_with('OR IGNORE').values(user_id=user_id, shard=shard))
+            return conn.execute(select(user_shard.c.shard).where(user_shard.c.user_id == user_id)).scalar_one()
+
+    def bind(self, user_id):
+        """Send this request's statements to the user's shard. Raises UserMoving"""
+        shard = self.shard_of(user_id)
+        previous = self._served.get(user_id)
+        if previous is not None and previous != shard and self.on_moved is not None:
+            # Moved since this process last served the user: cached ids are stale
+            self.on_moved(user_id)
+        if len(self._served) >= 100000:
+            self._served.clear()
+        self._served[user_id] = shard
+        g.shard_engine = self.engines[shard]
+        return shard
+
+
+# Moving users (the command-line tool)
+
+def _user_rows(conn, table, user_id):
+    return conn.execute(select(table).where(table.c.user_id == user_id).order_by(table.c.id)).mappings().all()
+
+
+def _next_id(conn, *tables):
+    return max(conn.execute(select(func.coalesce(func.max(t.c.id), 0))).scalar() for t in tables) + 1
+
+
+def _renumbered(rows, base):
+    return {row['id']: base + i for i, row in enumerate(rows)}
+
+
+def copy_user(source, target, tables, user_id):
+    """Copy the user's rows from the `source` connection into `target` (inside a transaction),
+    with new ids there. Returns how many rows were copied per table"""
+    task, session, task_archive, session_archive, user, activity = tables
+    counts = {}
+    seq = source.execute(select(user.c.change_seq).where(user.c.id == user_id)).scalar() or 0
+    deleted_at = source.execute(select(user.c.deleted_at).where(user.c.id == user_id)).scalar()
+    # Written first: it takes the target's write lock, so the free ids read next stay free.
+    # purged_seq above every cursor handed out: the clients start over with the new ids
+    target.execute(_placeholder(user, user_id))
+    target.execute(user.update().where(user.c.id == user_id)
+                   .values(change_seq=seq + 1, purged_seq=seq + 1, deleted_at=deleted_at))
+
+    # Archived rows get the lower new ids: future ids of the hot table continue after the
+    # highest one in use, and must not reach ids already in the archive
+    task_ids = {}
+    for hot, archived, reference in ((task, task_archive, 'recurring_parent_id'),
+                                     (session, session_archive, 'task_id')):
+        rows = (_user_rows(source, archived, user_id), _user_rows(source, hot, user_id))
+        ids = _renumbered(rows[0] + rows[1], _next_id(target, hot, archived))
+        if hot is task:
+            task_ids = ids
+        for table, table_rows in zip((archived, hot), rows):
+            values = [dict(row, id=ids[row['id']]) for row in table_rows]
+            for row in values:
+                if row[reference] is not None:
+                    # Both columns point at the user's own tasks
+                    row[reference] = task_ids.get(row[reference])
+            if values:
+                target.execute(insert(table), values)
+            counts[table.name] = len(values)
+
+    values = [dict(row) for row in source.execute(
+        select(activity).where(activity.c.user_id == user_id)).mappings()]
+    if values:
+        target.execute(insert(activity), values)
+    counts[activity.name] = len(values)
+    return counts
+
+
+def delete_user_rows(engine, tables, user_id, batch_size=500, keep_user=False):
+    """Delete the user's rows in batches, one transaction each (the user row too unless
+    `keep_user`)"""
+    task, session, task_archive, session_archive, user, activity = tables
+    for table in (session, session_archive, task_archive, task):
+        while True:
+            with engine.begin() as conn:
+                batch = select(table.c.id).where(table.c.user_id == user_id).limit(batch_size)
+                deleted = conn.execute(table.delete().where(table.c.id.in_(batch))).rowcount
+            if deleted < batch_size:
+                break
+    with engine.begin() as conn:
+        conn.execute(activity.delete().where(activity.c.user_id == user_id))
+        if not keep_user:
+            conn.execute(user.delete().where(user.c.id == user_id))
+
+
+def move_user(directory_engine, source_engine, target_engine, target, tables, user_id,
+              settle_seconds=2.0, batch_size=500, keep_source_user=False):
+    """Move one user's data to shard `target` and point the directory at it"""
+    with directory_engine.begin() as conn:
+        conn.execute(insert(user_shard).prefix_with('OR IGNORE').values(user_id=user_id, shard=target))
+        conn.execute(user_shard.update().where(user_shard.c.user_id == user_id)
+                     .values(moving_since=datetime.utcnow()))
+    # Requests that looked the shard up before the mark finish on the old one
+    time.sleep(settle_seconds)
+
+    # Leftovers of an interrupted move into the target go first
+    delete_user_rows(target_engine, tables, user_id, batch_size)
+    with source_engine.connect() as source, target_engine.begin() as conn:
+        counts = copy_user(source, conn, tables, user_id)
+    with directory_engine.begin() as conn:
+        conn.execute(user_shard.update().where(user_shard.c.user_id == user_id)
+                     .values(shard=target, moving_since=None))
+    delete_user_rows(source_engine, tables, user_id, batch_size, keep_user=keep_source_user)
+    return counts
+
+
+def user_loads(engine, tables):
+    """{user_id: task rows (hot and archived)} on one shard"""
+    task, _, task_archive, _, user, _ = tables
+    rows = union_all(select(task.c.user_id), select(task_archive.c.user_id)).subquery()
+    with engine.connect() as conn:
+        loads = {user_id: 0 for user_id in conn.execute(select(user.c.id)).scalars()}
+        for user_id, count in conn.execute(select(rows.c.user_id, func.count()).group_by(rows.c.user_id)):
+            loads[user_id] = count
+    return loads
+
+
+def plan_rebalance(loads, max_moves=None):
+    """Moves (user_id, from, to) that even out the task rows per shard. Greedy: from the
+    fullest shard to the emptiest, the largest user that narrows the gap"""
+    loads = {shard: dict(users) for shard, users in loads.items()}
+    totals = {shard: sum(users.values()) for shard, users in loads.items()}
+    moves = []
+    while max_moves is None or len(moves) < max_moves:
+        fullest = max(totals, key=totals.get)
+        emptiest = min(totals, key=totals.get)
+        gap = totals[fullest] - totals[emptiest]
+        candidates = [(load, user_id) for user_id, load in loads[fullest].items() if 0 < load < gap]
+        if not candidates:
+            break
+        load, user_id = max(candidates)
+        moves.append((user_id, fullest, emptiest))
+        del loads[fullest][user_id]
+        loads[emptiest][user_id] = load
+        totals[fullest] -= load
+        totals[emptiest] += load
+    return moves
+
+
+def _open(args):
+    """(directory engine, shard engines, the tables purge() takes) of the app configured by `args`"""
+    os.environ.update(DATABASE_URL=args.database_url, SHARD_COUNT=str(args.shards))
+    if args.shard_dir:
+        os.environ['SHARD_DIR'] = args.shard_dir
+    import app  # creates the shards' tables
+    with app.app.app_context():
+        app.db.create_all()
+        return app.shard_map.directory_engine, app.shard_map.engines, app.SOFT_DELETE_TABLES
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description='User shards: place, inspect and move users')
+    parser.add_argument('--database-url', default=database_url_from_env(), help='The directory database')
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('SHARD_COUNT', 0)),
+                        help='Number of shards (default: SHARD_COUNT)')
+    parser.add_argument('--shard-dir', default=os.environ.get('SHARD_DIR'))
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--settle-seconds', type=float, default=2.0,
+                        help='Wait after marking a user as moving, for its running requests')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('init', help="Move every user's data from the main database into its shard")
+    sub.add_parser('status', help='Users and task rows per shard')
+    move = sub.add_parser('move', help='Move one user to another shard')
+    move.add_argument('--user', type=int, required=True)
+    move.add_argument('--to', type=int, required=True)
+    rebalance = sub.add_parser('rebalance', help='Move users until the shards hold similar numbers of tasks')
+    rebalance.add_argument('--max-moves', type=int)
+    rebalance.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.shards < 1:
+        print('❌ Set SHARD_COUNT (or --shards) to the number of shards')
+        return 1
+    directory_engine, engines, tables = _open(args)
+    user = tables[4]
+
+    if args.command == 'init':
+        with directory_engine.connect() as conn:
+            placed = set(conn.execute(select(user_shard.c.user_id)).scalars())
+            users = [u for u in conn.execute(select(user.c.id).order_by(user.c.id)).scalars() if u not in placed]
+        for user_id in users:
+            shard = default_shard(user_id, args.shards)
+            counts = move_user(directory_engine, directory_engine, engines[shard], shard, tables, user_id,
+                               settle_seconds=0, batch_size=args.batch_size, keep_source_user=True)
+            logger.info('User %s -> shard %s: %s', user_id, shard, counts)
+        print(f'✅ Placed {len(users)} users on {args.shards} shards')
+        return 0
+
+    if args.command == 'status':
+        with directory_engine.connect() as conn:
+            placed = dict(conn.execute(
+                select(user_shard.c.shard, func.count()).group_by(user_shard.c.shard)).all())
+            moving = conn.execute(select(func.count()).where(user_shard.c.moving_since.isnot(None))).scalar()
+        for shard, engine in enumerate(engines):
+            loads = user_loads(engine, tables)
+            print(f'shard {shard}: {placed.get(shard, 0)} users, {sum(loads.values())} tasks '
+                  f'({engine.url.database})')
+        if moving:
+            print(f'⚠️  {moving} users marked as moving: run their move again')
+        return 0
+
+    if args.command == 'move':
+        if not 0 <= args.to < args.shards:
+            print(f'❌ --to must be between 0 and {args.shards - 1}')
+            return 1
+        with directory_engine.connect() as conn:
+            source = conn.execute(select(user_shard.c.shard).where(user_shard.c.user_id == args.user)).scalar()
+        if source is None:
+            print(f'❌ User {args.user} has no shard yet')
+            return 1
+        if source == args.to:
+            print(f'✅ User {args.user} is already on shard {args.to}')
+            return 0
+        counts = move_user(directory_engine, engines[source], engines[args.to], args.to, tables, args.user,
+                           args.settle_seconds, args.batch_size)
+        print(f'✅ Moved user {args.user} from shard {source} to {args.to}: {counts}')
+        return 0
+
+    # rebalance
+    with directory_engine.begin() as conn:
+        # Accounts purged from the directory leave their row here
+        conn.execute(user_shard.delete().where(user_shard.c.user_id.not_in(select(user.c.id))))
+        placed = dict(conn.execute(select(user_shard.c.user_id, user_shard.c.shard)).all())
+    loads = {shard: {} for shard in range(args.shards)}
+    for shard, engine in enumerate(engines):
+        for user_id, load in user_loads(engine, tables).items():
+            if placed.get(user_id) == shard:
+                loads[shard][user_id] = load
+    moves = plan_rebalance(loads, args.max_moves)
+    for user_id, source, target in moves:
+        if args.dry_run:
+            print(f'would move user {user_id}: shard {source} -> {target} ({loads[source][user_id]} tasks)')
+            continue
+        move_user(directory_engine, engines[source], engines[target], target, tables, user_id,
+                  args.settle_seconds, args.batch_size)
+        logger.info('Moved user %s: shard %s -> %s', user_id, source, target)
+    print(f'✅ {"Planned" if args.dry_run else "Made"} {len(moves)} moves')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
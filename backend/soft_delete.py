@@ -0,0 +1,220 @@
+"""
+Soft deletes and the background purge.
+
+Deleting a task, a recurring template or an account only stamps `deleted_at`:
+one UPDATE, whatever the row has collected. Read paths filter on
+`deleted_at IS NULL`; the indexes they use are partial on that condition, so
+deleted rows cost them nothing. A second partial index covers the few rows
+that are deleted and waiting for the purge. It serves the purge itself and
+`live_sessions()`, which hides the pomodoro sessions of deleted tasks.
+
+An account deletion closes the account at once: its username and email are
+released and its tokens are refused (see AccountStatus). Its data is purged
+later, like everything else.
+
+The purge hard-deletes in batches of set-based statements, one transaction
+per batch, children first (sessions, then tasks, then the account). Instances
+of a purged template are detached from it. A deleted recurring instance is
+kept until the day it stood for is over, so that it is not generated again
+(see occurrences.py). Rows are only
+purged PURGE_MIN_AGE_SECONDS (default 300) after their deletion: longer than
+AccountStatus takes to reach every process, so a deleted account's last
+requests cannot write rows after its purge.
+
+The apps run the purge as a job (see jobs.py), queued by each delete. To run
+it on demand, call POST /api/admin/purge or run this module:
+
+Usage:
+    python soft_delete.py status
+    python soft_delete.py purge --batch-size 500 --sleep-ms 20
+"""
+import argparse
+import logging
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import MetaData, create_engine, func, or_, select
+
+import archive
+from db_url import database_url_from_env
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_AGE_SECONDS = 300
+
+
+def live_sessions(sessions, tasks, user_id):
+    """Condition excluding the sessions of the user's deleted tasks that still await the purge"""
+    deleted = select(tasks.c.id).where(tasks.c.user_id == user_id, tasks.c.deleted_at.isnot(None))
+    return or_(sessions.c.task_id.is_(None), sessions.c.task_id.not_in(deleted))
+
+
+class AccountStatus:
+    """Which accounts are deleted, checked once per `ttl` seconds per user and process.
+
+    Another process learns about a deletion within `ttl`; the purge removes
+    whatever a stale token wrote in between.
+    """
+
+    def __init__(self, ttl=60, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._checked = {}  # user_id -> (deleted, valid until)
+
+    def is_deleted(self, session, user_table, user_id):
+        now = time.monotonic()
+        entry = self._checked.get(user_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        row = session.execute(select(user_table.c.deleted_at).where(user_table.c.id == user_id)).first()
+        deleted = row is None or row[0] is not None  # purged accounts have no row at all
+        if len(self._checked) >= self.max_entries:
+            self._checked.clear()
+        self._checked[user_id] = (deleted, now + self.ttl)
+        return deleted
+
+    def mark_deleted(self, user_id):
+        self._checked[user_id] = (True, float('inf'))
+
+
+# Purge
+
+def _delete_tasks(conn, task, session, ids):
+    conn.execute(task.update().where(task.c.recurring_parent_id.in_(ids)).values(recurring_parent_id=None))
+    conn.execute(session.delete().where(session.c.task_id.in_(ids)))
+    return conn.execute(task.delete().where(task.c.id.in_(ids))).rowcount
+
+
+def purge_tasks_batch(conn, tables, cutoff, today, batch_size):
+    """Hard-delete one batch of tasks deleted before `cutoff`; returns how many went"""
+    task, session, user = tables[0], tables[1], tables[4]
+    rows = conn.execute(
+        select(task.c.id, task.c.user_id, task.c.change_seq).where(
+            task.c.deleted_at.isnot(None),
+            task.c.deleted_at <= cutoff,
+            or_(task.c.recurring_parent_id.is_(None), task.c.occurrence_date < today)
+        ).order_by(task.c.id).limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+    # Sync cursors older than a purged tombstone must start over (see sync.py)
+    purged = {}
+    for row in rows:
+        purged[row.user_id] = max(purged.get(row.user_id, 0), row.change_seq)
+    for user_id, seq in purged.items():
+        conn.execute(user.update().where(user.c.id == user_id, user.c.purged_seq < seq).values(purged_seq=seq))
+    return _delete_tasks(conn, task, session, [row.id for row in rows])
+
+
+def purge_account_batch(conn, tables, user_id, batch_size):
+    """Hard-delete up to `batch_size` of a deleted account's rows, children first.
+    Returns (table name, rows); the account row itself goes last"""
+    task, session, task_archive, session_archive, user, user_activity = tables
+    for table in (session, session_archive, task_archive):
+        batch = select(table.c.id).where(table.c.user_id == user_id).limit(batch_size)
+        deleted = conn.execute(table.delete().where(table.c.id.in_(batch))).rowcount
+        if deleted:
+            return table.name, deleted
+    # Two passes so each one can use its partial index
+    for condition in (task.c.deleted_at.is_(None), task.c.deleted_at.isnot(None)):
+        ids = conn.execute(
+            select(task.c.id).where(task.c.user_id == user_id, condition).limit(batch_size)
+        ).scalars().all()
+        if ids:
+            return task.name, _delete_tasks(conn, task, session, ids)
+    conn.execute(user_activity.delete().where(user_activity.c.user_id == user_id))
+    return user.name, conn.execute(user.delete().where(user.c.id == user_id)).rowcount
+
+
+def purge(engine, tables, min_age_seconds=0, batch_size=500, sleep_ms=0, max_seconds=None):
+    """Hard-delete everything soft-deleted at least `min_age_seconds` ago, one transaction per
+    batch. Stops early after `max_seconds` (the rest is left for the next run)"""
+    user = tables[4]
+    started = time.monotonic()
+    cutoff = datetime.utcnow() - timedelta(seconds=min_age_seconds)
+    summary = Counter()
+
+    def batches(step):
+        while True:
+            if max_seconds is not None and time.monotonic() - started > max_seconds:
+                return False
+            with engine.begin() as conn:
+                done = step(conn)
+            if not done:
+                return True
+            summary['batches'] += 1
+            if sleep_ms:
+                time.sleep(sleep_ms / 1000.0)
+
+    with engine.connect() as conn:
+        accounts = conn.execute(
+            select(user.c.id).where(user.c.deleted_at.isnot(None), user.c.deleted_at <= cutoff)
+        ).scalars().all()
+    for user_id in accounts:
+        def account_step(conn, user_id=user_id):
+            name, deleted = purge_account_batch(conn, tables, user_id, batch_size)
+            summary[name] += deleted
+            return name != user.name
+        if not batches(account_step):
+            return dict(summary, complete=False)
+        logger.info('Purged deleted account %s', user_id)
+
+    def task_step(conn):
+        deleted = purge_tasks_batch(conn, tables, cutoff, date.today(), batch_size)
+        summary['task'] += deleted
+        return deleted
+    complete = batches(task_step)
+    return dict(summary, complete=complete)
+
+
+def pending(conn, tables):
+    """How many deleted tasks and accounts are waiting for the purge"""
+    task, user = tables[0], tables[4]
+    return {
+        'tasks': conn.execute(select(func.count()).select_from(task).where(task.c.deleted_at.isnot(None))).scalar(),
+        'accounts': conn.execute(select(func.count()).select_from(user).where(user.c.deleted_at.isnot(None))).scalar(),
+    }
+
+
+def reflect_tables(engine):
+    """The tables purge() takes, in its order, loaded from the database"""
+    metadata = MetaData()
+    metadata.reflect(engine, only=['task', 'pomodoro_session', 'user', 'user_activity'])
+    task_archive, session_archive = archive.define_archive_tables(metadata)
+    metadata.create_all(engine, tables=[task_archive, session_archive])
+    tables = metadata.tables
+    return (tables['task'], tables['pomodoro_session'], task_archive, session_archive,
+            tables['user'], tables['user_activity'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Hard-delete soft-deleted tasks and accounts')
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL or instance/tasks.db')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status')
+    run = sub.add_parser('purge')
+    run.add_argument('--min-age-seconds', type=int, default=DEFAULT_MIN_AGE_SECONDS, help='Only purge rows deleted this long ago')
+    run.add_argument('--batch-size', type=int, default=500)
+    run.add_argument('--sleep-ms', type=int, default=20, help='Pause between batches to limit load')
+    run.add_argument('--max-seconds', type=float, help='Stop after this long (resume later)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    engine = create_engine(database_url_from_env(args.database_url))
+    tables = reflect_tables(engine)
+    if args.command == 'status':
+        with engine.connect() as conn:
+            counts = pending(conn, tables)
+        print(f"🗑️  {counts['tasks']} deleted tasks and {counts['accounts']} deleted accounts awaiting purge")
+        return 0
+
+    summary = purge(engine, tables, args.min_age_seconds, args.batch_size, args.sleep_ms, args.max_seconds)
+    print(f"✅ Purged {summary.get('user', 0)} accounts, {summary.get('task', 0)} tasks and "
+          f"{summary.get('pomodoro_session', 0)} sessions in {summary.get('batches', 0)} batches"
+          + ('' if summary['complete'] else ' (stopped early, run again to continue)'))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -2,6 +2,10 @@
 
 # Script to start the Flask backend server with proper configuration
 # This ensures the database persists correctly
+#
+#   ./start_server.sh          production: gunicorn workers (see gunicorn.conf.py)
+#   ./start_server.sh dev      Flask development server (auto-reload, debugger)
+#   ./start_server.sh reload   replace the running gunicorn workers gracefully
 
 # Get the directory where this script is located
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
@@ -16,14 +20,29 @@ if [ -d "venv" ]; then
     source venv/bin/activate
 fi
 
+if [ "$1" = "reload" ]; then
+    if [ ! -f instance/gunicorn.pid ]; then
+        echo "No running server found (instance/gunicorn.pid)"
+        exit 1
+    fi
+    echo "Reloading workers..."
+    kill -HUP "$(cat instance/gunicorn.pid)"
+    exit $?
+fi
+
 # Check if required packages are installed
-if ! python3 -c "import flask" 2>/dev/null; then
+if ! python3 -c "import flask, gunicorn" 2>/dev/null; then
     echo "Installing required packages..."
     pip install -r requirements.txt
 fi
 
 # Start the server
-echo "Starting Flask server..."
 echo "Database location: $SCRIPT_DIR/instance/tasks.db"
-python3 app.py
+if [ "$1" = "dev" ]; then
+    echo "Starting Flask development server..."
+    python3 app.py
+else
+    echo "Starting gunicorn..."
+    exec gunicorn -c gunicorn.conf.py app:app
+fi
 
@@ -0,0 +1,76 @@
+"""
+Single-statement task writes.
+
+Toggling a task or editing some of its fields is one UPDATE ... RETURNING.
+The ownership check, the change and the row for the response come back in a
+single round trip. Nothing is loaded into the ORM session, which would also
+re-read the row after the commit to serialize it.
+
+SQLite has RETURNING from 3.35 on. Older builds run the UPDATE and read the
+row back with a SELECT in the same transaction.
+"""
+from sqlalchemy import exists, false, func, not_, select
+
+import archive
+
+
+def _owned(task_table, task_id, user_id):
+    return (task_table.c.id == task_id, task_table.c.user_id == user_id, task_table.c.deleted_at.is_(None))
+
+
+def live(task_table, task_id, user_id):
+    """EXISTS clause for the user's live task, to take a change number only if there is one"""
+    return exists().where(*_owned(task_table, task_id, user_id))
+
+
+def update_returning(session, task_table, task_id, user_id, values, *conditions):
+    """UPDATE the user's live task with `values`; returns the updated row, or None if none matched"""
+    statement = task_table.update().where(*_owned(task_table, task_id, user_id), *conditions).values(**values)
+    if session.get_bind().dialect.update_returning:
+        return session.execute(statement.returning(*task_table.c)).first()
+    if not session.execute(statement).rowcount:
+        return None
+    return session.execute(select(task_table).where(task_table.c.id == task_id)).first()
+
+
+def toggle(session, task_table, task_id, user_id, change_seq):
+    """Flip `completed` in the database; returns the updated row or None"""
+    completed = func.coalesce(task_table.c.completed, false())
+    return update_returning(session, task_table, task_id, user_id,
+                            {'completed': not_(completed), 'change_seq': change_seq})
+
+
+def update_fields(session, task_table, task_id, user_id, values, change_seq):
+    """Partial update. Returns (row, completion changed); row is None if the task was not found.
+
+    A new `completed` value goes in the WHERE clause, so the statement only
+    matches when completion actually changes. Sending the stored value back
+    costs a second UPDATE for the other fields. `change_seq` is stamped on
+    the row when something is written (see sync.py).
+    """
+    if 'completed' in values:
+        completed = bool(values['completed'])
+        row = update_returning(session, task_table, task_id, user_id,
+                               dict(values, completed=completed, change_seq=change_seq),
+                               func.coalesce(task_table.c.completed, false()) != completed)
+        if row is not None:
+            return row, True
+        values = {field: value for field, value in values.items() if field != 'completed'}
+    if not values:
+        return session.execute(select(task_table).where(*_owned(task_table, task_id, user_id))).first(), False
+    return update_returning(session, task_table, task_id, user_id, dict(values, change_seq=change_seq)), False
+
+
+def due_date_for_update(session, task_table, task_id, user_id):
+    """The due date of the user's live task before an update changes it (None if there is no
+    such task), locked on PostgreSQL until the transaction ends. Called after the change
+    number, so the user's row is locked first like in every other write"""
+    query = select(task_table.c.due_date).where(*_owned(task_table, task_id, user_id))
+    if session.get_bind().dialect.name == 'postgresql':
+        query = query.with_for_update()
+    return session.execute(query).scalar()
+
+
+def task_dict(row):
+    """A returned row serialized like Task.to_dict"""
+    return archive.task_dict(row._mapping)
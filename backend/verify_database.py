@@ -2,138 +2,341 @@
 """
 Database Verification Script
 This script checks the database status and displays information about stored data.
+
+Works against the self-hosted SQLite file and PostgreSQL alike, and is safe to
+run against production:
+- Row counts come from planner statistics (pg_class / sqlite_stat1) instead of
+  full COUNT(*) scans.
+- Sizes, index usage and bloat indicators come from catalog views
+  (pg_stat_user_tables / dbstat, freelist pages on SQLite).
+- Exact checks (--exact: precise counts, orphaned instances and sessions) are
+  split into primary-key ranges and run concurrently on a thread pool, each
+  chunk being a short indexed range query.
+- Connections are read-only, and on PostgreSQL each statement has a timeout.
+
+Usage:
+    python verify_database.py                       # instance/tasks.db or DATABASE_URL
+    python verify_database.py --database-url postgresql://... --exact --workers 4
 """
 
+import argparse
 import os
-import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from sqlalchemy import create_engine, event, inspect, text
+
+from db_url import database_url_from_env
+
+TABLES = ['user', 'task', 'pomodoro_session', 'task_archive', 'pomodoro_session_archive', 'user_activity']
+
+# Exact checks: name -> (table, SQL counting matches among ids in [:lo, :hi])
+EXACT_CHECKS = {
+    'Users': ('user', 'SELECT COUNT(*) FROM "user" WHERE id BETWEEN :lo AND :hi'),
+    # Live tasks; the estimates count the deleted ones too, until the purge (soft_delete.py)
+    'Tasks': ('task', 'SELECT COUNT(*) FROM task WHERE id BETWEEN :lo AND :hi AND deleted_at IS NULL'),
+    'Deleted tasks awaiting the purge': ('task', 'SELECT COUNT(*) FROM task WHERE id BETWEEN :lo AND :hi '
+                                                 'AND deleted_at IS NOT NULL'),
+    'Completed tasks': ('task', 'SELECT COUNT(*) FROM task WHERE id BETWEEN :lo AND :hi AND completed = :true '
+                                'AND deleted_at IS NULL'),
+    'Recurring templates': ('task', 'SELECT COUNT(*) FROM task WHERE id BETWEEN :lo AND :hi '
+                                    'AND is_recurring = :true AND recurring_parent_id IS NULL AND deleted_at IS NULL'),
+    'Pomodoro sessions': ('pomodoro_session', 'SELECT COUNT(*) FROM pomodoro_session WHERE id BETWEEN :lo AND :hi'),
+    'Focus minutes': ('pomodoro_session', "SELECT COALESCE(SUM(duration), 0) FROM pomodoro_session "
+                                          "WHERE id BETWEEN :lo AND :hi AND type = 'work'"),
+}
+
+ORPHAN_CHECKS = {
+    'Instances with a missing template': (
+        'task',
+        'SELECT COUNT(*) FROM task t WHERE t.id BETWEEN :lo AND :hi AND t.recurring_parent_id IS NOT NULL '
+        'AND NOT EXISTS (SELECT 1 FROM task p WHERE p.id = t.recurring_parent_id)'
+    ),
+    'Sessions with a missing task': (
+        'pomodoro_session',
+        'SELECT COUNT(*) FROM pomodoro_session s WHERE s.id BETWEEN :lo AND :hi AND s.task_id IS NOT NULL '
+        'AND NOT EXISTS (SELECT 1 FROM task t WHERE t.id = s.task_id)'
+    ),
+    'Tasks with a missing user': (
+        'task',
+        'SELECT COUNT(*) FROM task t WHERE t.id BETWEEN :lo AND :hi '
+        'AND NOT EXISTS (SELECT 1 FROM "user" u WHERE u.id = t.user_id)'
+    ),
+    'Sessions with a missing user': (
+        'pomodoro_session',
+        'SELECT COUNT(*) FROM pomodoro_session s WHERE s.id BETWEEN :lo AND :hi '
+        'AND NOT EXISTS (SELECT 1 FROM "user" u WHERE u.id = s.user_id)'
+    ),
+}
+
+
+def make_engine(url, statement_timeout_ms):
+    if url.startswith('postgresql'):
+        options = f'-c statement_timeout={statement_timeout_ms} -c default_transaction_read_only=on'
+        return create_engine(url, connect_args={'options': options})
+
+    engine = create_engine(url)
+
+    @event.listens_for(engine, 'connect')
+    def _read_only(dbapi_connection, connection_record):
+        dbapi_connection.execute('PRAGMA query_only = ON')
+
+    return engine
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:,.0f} {unit}" if unit == 'B' else f"{size:,.2f} {unit}"
+        size /= 1024
+
+
+# Estimates and catalog statistics
+
+def estimated_counts(conn, tables):
+    if conn.dialect.name == 'postgresql':
+        # Partitioned parents have no tuples of their own, so add up their partitions.
+        # reltuples is -1 until the first ANALYZE; fall back to the stats collector then.
+        rows = conn.execute(text(
+            "SELECT parent.relname, SUM(CASE WHEN c.reltuples >= 0 THEN c.reltuples "
+            "                                ELSE COALESCE(s.n_live_tup, 0) END), "
+            "       BOOL_AND(c.reltuples >= 0) "
+            "FROM pg_class parent "
+            "LEFT JOIN pg_inherits i ON i.inhparent = parent.oid "
+            "JOIN pg_class c ON c.oid = CASE WHEN parent.relkind = 'p' THEN i.inhrelid ELSE parent.oid END "
+            "LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid "
+            "WHERE parent.relkind IN ('r', 'p') AND parent.relnamespace = 'public'::regnamespace "
+            "GROUP BY parent.relname"
+        )).all()
+        found = {name: (int(count), 'pg_class' if analyzed else 'pg_stat_user_tables')
+                 for name, count, analyzed in rows}
+        return {table: found.get(table, (0, 'pg_class')) for table in tables}
+
+    stats = {}
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")).first():
+        # One row per index, counting that index's entries (a partial index holds fewer than
+        # the table), or a single row with no index for a table without any
+        for table, index, stat in conn.execute(text('SELECT tbl, idx, stat FROM sqlite_stat1')):
+            stats.setdefault(table, {})[index] = int(stat.split()[0])
+    result = {}
+    for table in tables:
+        if table in stats:
+            counts = stats[table]
+            result[table] = (counts[None] if None in counts else max(counts.values()), 'sqlite_stat1')
+        else:
+            # Without ANALYZE statistics, max(rowid) is an O(log n) upper bound
+            high = conn.execute(text(f'SELECT MAX(rowid) FROM "{table}"')).scalar() or 0
+            result[table] = (high, 'max(rowid)')
+    return result
+
+
+def table_sizes(conn, tables):
+    """{table: (table bytes, index bytes)} where the database can tell"""
+    if conn.dialect.name == 'postgresql':
+        rows = conn.execute(text(
+            "SELECT c.relname, "
+            "  COALESCE((SELECT SUM(pg_table_size(i.inhrelid)) FROM pg_inherits i WHERE i.inhparent = c.oid), 0) "
+            "    + pg_table_size(c.oid), "
+            "  COALESCE((SELECT SUM(pg_indexes_size(i.inhrelid)) FROM pg_inherits i WHERE i.inhparent = c.oid), 0) "
+            "    + pg_indexes_size(c.oid) "
+            "FROM pg_class c WHERE c.relkind IN ('r', 'p') AND c.relnamespace = 'public'::regnamespace"
+        )).all()
+        sizes = {name: (int(data), int(index)) for name, data, index in rows}
+        return {table: sizes[table] for table in tables if table in sizes}
+
+    try:
+        rows = conn.execute(text(
+            "SELECT m.tbl_name, m.type, SUM(d.pgsize) FROM dbstat d "
+            "JOIN sqlite_master m ON m.name = d.name GROUP BY m.tbl_name, m.type"
+        )).all()
+    except Exception:
+        return {}  # SQLite built without the dbstat virtual table
+    sizes = {}
+    for table, kind, size in rows:
+        data, index = sizes.get(table, (0, 0))
+        sizes[table] = (data + size, index) if kind == 'table' else (data, index + size)
+    return {table: sizes[table] for table in tables if table in sizes}
+
+
+def index_usage(conn):
+    if conn.dialect.name != 'postgresql':
+        return None
+    return conn.execute(text(
+        "SELECT relname, indexrelname, idx_scan, pg_relation_size(indexrelid) "
+        "FROM pg_stat_user_indexes ORDER BY idx_scan ASC, pg_relation_size(indexrelid) DESC"
+    )).all()
+
+
+def bloat_indicators(conn):
+    if conn.dialect.name == 'postgresql':
+        return conn.execute(text(
+            "SELECT relname, n_live_tup, n_dead_tup, last_autovacuum, last_autoanalyze "
+            "FROM pg_stat_user_tables ORDER BY n_dead_tup DESC"
+        )).all()
+    page_size = conn.execute(text('PRAGMA page_size')).scalar()
+    page_count = conn.execute(text('PRAGMA page_count')).scalar()
+    freelist = conn.execute(text('PRAGMA freelist_count')).scalar()
+    return {'page_size': page_size, 'page_count': page_count, 'freelist_count': freelist}
+
+
+# Exact checks, chunked by primary key range
+
+def id_ranges(conn, table, chunk_size):
+    quoted = f'"{table}"'
+    low, high = conn.execute(text(f'SELECT MIN(id), MAX(id) FROM {quoted}')).one()
+    if low is None:
+        return []
+    return [(start, min(start + chunk_size - 1, high)) for start in range(low, high + 1, chunk_size)]
+
+
+def run_chunked(engine, checks, chunk_size, workers):
+    """Run each check over primary-key chunks on a thread pool and sum the results"""
+    with engine.connect() as conn:
+        ranges = {table: id_ranges(conn, table, chunk_size) for table, _ in checks.values()}
+
+    def run_chunk(sql, lo, hi):
+        with engine.connect() as conn:
+            return conn.execute(text(sql), {'lo': lo, 'hi': hi, 'true': True}).scalar() or 0
+
+    totals = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            name: [pool.submit(run_chunk, sql, lo, hi) for lo, hi in ranges[table]]
+            for name, (table, sql) in checks.items()
+        }
+        for name, chunk_futures in futures.items():
+            totals[name] = sum(future.result() for future in chunk_futures)
+    return totals
+
+
 def main():
-    # Get the script directory
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    db_path = os.path.join(script_dir, 'instance', 'tasks.db')
-    
+    parser = argparse.ArgumentParser(description='Database statistics and integrity checks')
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL or instance/tasks.db')
+    parser.add_argument('--exact', action='store_true', help='Run exact counts and orphan checks')
+    parser.add_argument('--workers', type=int, default=4, help='Threads for the exact checks')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Primary-key range per query')
+    parser.add_argument('--statement-timeout-ms', type=int, default=30000, help='PostgreSQL only')
+    args = parser.parse_args()
+
+    url = database_url_from_env(args.database_url)
+
     print("=" * 60)
     print("DATABASE VERIFICATION")
     print("=" * 60)
     print()
-    
-    # Check if database exists
-    if not os.path.exists(db_path):
-        print("❌ Database file not found!")
-        print(f"   Expected location: {db_path}")
-        print()
-        print("The database will be created automatically when you start the server.")
-        return
-    
-    # Get database file info
-    file_size = os.path.getsize(db_path)
-    file_modified = datetime.fromtimestamp(os.path.getmtime(db_path))
-    
-    print(f"✅ Database file found")
-    print(f"   Location: {db_path}")
-    print(f"   Size: {file_size:,} bytes ({file_size / 1024:.2f} KB)")
-    print(f"   Last modified: {file_modified.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    if url.startswith('sqlite:///'):
+        db_path = url[len('sqlite:///'):]
+        # Check if database exists
+        if not os.path.exists(db_path):
+            print("❌ Database file not found!")
+            print(f"   Expected location: {db_path}")
+            print()
+            print("The database will be created automatically when you start the server.")
+            return
+
+        file_size = os.path.getsize(db_path)
+        file_modified = datetime.fromtimestamp(os.path.getmtime(db_path))
+        print(f"✅ Database file found")
+        print(f"   Location: {db_path}")
+        print(f"   Size: {format_bytes(file_size)}")
+        print(f"   Last modified: {file_modified.strftime('%Y-%m-%d %H:%M:%S')}")
+    else:
+        print(f"✅ Database: {url.split('@')[-1]}")
     print()
-    
-    # Connect to database and get statistics
+
+    engine = make_engine(url, args.statement_timeout_ms)
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Get table list
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = [row[0] for row in cursor.fetchall()]
-        
-        print("📊 Database Tables:")
-        for table in tables:
-            print(f"   - {table}")
-        print()
-        
-        # Get user count
-        cursor.execute('SELECT COUNT(*) FROM user')
-        user_count = cursor.fetchone()[0]
-        
-        # Get task count
-        cursor.execute('SELECT COUNT(*) FROM task')
-        task_count = cursor.fetchone()[0]
-        
-        # Get completed tasks count
-        cursor.execute('SELECT COUNT(*) FROM task WHERE completed = 1')
-        completed_count = cursor.fetchone()[0]
-        
-        # Get recurring tasks count
-        cursor.execute('SELECT COUNT(*) FROM task WHERE is_recurring = 1')
-        recurring_count = cursor.fetchone()[0]
-        
-        # Get pomodoro count
-        cursor.execute('SELECT COUNT(*) FROM pomodoro_session')
-        pomodoro_count = cursor.fetchone()[0]
-        
-        print("📈 Data Statistics:")
-        print(f"   Users: {user_count}")
-        print(f"   Total Tasks: {task_count}")
-        print(f"   - Completed: {completed_count}")
-        print(f"   - Active: {task_count - completed_count}")
-        print(f"   - Recurring Templates: {recurring_count}")
-        print(f"   Pomodoro Sessions: {pomodoro_count}")
-        print()
-        
-        # Get recent users
-        if user_count > 0:
-            cursor.execute('SELECT id, username, email FROM user ORDER BY id DESC LIMIT 5')
-            users = cursor.fetchall()
-            print("👥 Users:")
-            for user in users:
-                print(f"   - {user[1]} ({user[2]})")
+        with engine.connect() as conn:
+            dialect = conn.dialect.name
+            tables = [t for t in TABLES if t in set(inspect(conn).get_table_names())]
+
+            print("📊 Estimated Row Counts:")
+            for table, (count, source) in estimated_counts(conn, tables).items():
+                print(f"   - {table}: ~{count:,} ({source})")
             print()
-        
-        # Get recent tasks
-        if task_count > 0:
-            cursor.execute('''
-                SELECT id, title, priority, completed, due_date 
-                FROM task 
-                WHERE is_recurring = 0 OR is_recurring IS NULL
-                ORDER BY created_at DESC 
-                LIMIT 5
-            ''')
-            tasks = cursor.fetchall()
-            print("📋 Recent Tasks:")
-            for task in tasks:
-                status = "✓" if task[3] else "○"
-                print(f"   {status} [{task[2]}] {task[1]} (due: {task[4]})")
+
+            sizes = table_sizes(conn, tables)
+            if sizes:
+                print("💾 Table and Index Sizes:")
+                for table, (data, index) in sizes.items():
+                    print(f"   - {table}: table {format_bytes(data)}, indexes {format_bytes(index)}")
+                print()
+
+            usage = index_usage(conn)
+            if usage is not None:
+                print("🔎 Index Usage (least used first):")
+                for table, index, scans, size in usage:
+                    flag = " ⚠️  unused" if scans == 0 else ""
+                    print(f"   - {table}.{index}: {scans:,} scans, {format_bytes(size)}{flag}")
+                print()
+
+            bloat = bloat_indicators(conn)
+            print("🧹 Bloat Indicators:")
+            if dialect == 'postgresql':
+                for table, live, dead, vacuumed, analyzed in bloat:
+                    ratio = dead / (live + dead) * 100 if live + dead else 0
+                    flag = " ⚠️" if ratio > 20 else ""
+                    print(f"   - {table}: {live:,} live, {dead:,} dead ({ratio:.1f}%){flag}, "
+                          f"last autovacuum {vacuumed or 'never'}")
+            else:
+                free = bloat['freelist_count'] * bloat['page_size']
+                ratio = bloat['freelist_count'] / bloat['page_count'] * 100 if bloat['page_count'] else 0
+                print(f"   - free pages: {bloat['freelist_count']:,} of {bloat['page_count']:,} "
+                      f"({format_bytes(free)}, {ratio:.1f}%){' ⚠️  consider VACUUM' if ratio > 20 else ''}")
+            print()
+
+            # Recent rows come straight off the primary key index
+            if 'user' in tables:
+                users = conn.execute(text('SELECT id, username, email FROM "user" ORDER BY id DESC LIMIT 5')).all()
+                if users:
+                    print("👥 Recent Users:")
+                    for user in users:
+                        print(f"   - {user[1]} ({user[2]})")
+                    print()
+
+            if 'task' in tables:
+                tasks = conn.execute(text(
+                    'SELECT id, title, priority, completed, due_date FROM task ORDER BY id DESC LIMIT 5'
+                )).all()
+                if tasks:
+                    print("📋 Recent Tasks:")
+                    for task in tasks:
+                        status = "✓" if task[3] else "○"
+                        print(f"   {status} [{task[2]}] {task[1]} (due: {task[4]})")
+                    print()
+
+        if args.exact:
+            print(f"📈 Exact Checks ({args.workers} workers, {args.chunk_size:,} ids per chunk):")
+            totals = run_chunked(engine, EXACT_CHECKS, args.chunk_size, args.workers)
+            for name, value in totals.items():
+                print(f"   {name}: {value:,}")
             print()
-        
-        # Get pomodoro stats
-        if pomodoro_count > 0:
-            cursor.execute('''
-                SELECT SUM(duration), COUNT(*) 
-                FROM pomodoro_session 
-                WHERE type = 'work'
-            ''')
-            result = cursor.fetchone()
-            total_focus_time = result[0] or 0
-            work_sessions = result[1] or 0
-            
-            print("🍅 Pomodoro Statistics:")
-            print(f"   Total Work Sessions: {work_sessions}")
-            print(f"   Total Focus Time: {total_focus_time} minutes ({total_focus_time / 60:.1f} hours)")
+
+            print("🔗 Orphan Checks:")
+            orphans = run_chunked(engine, ORPHAN_CHECKS, args.chunk_size, args.workers)
+            for name, value in orphans.items():
+                print(f"   {'⚠️ ' if value else '✓'} {name}: {value:,}")
             print()
-        
-        conn.close()
-        
+
         print("=" * 60)
-        print("✅ Database is healthy and contains data!")
+        print("✅ Database is reachable and statistics were collected")
         print("=" * 60)
-        print()
-        print("💡 Tip: Your data will persist across server restarts.")
-        print("   To backup your database, copy: backend/instance/tasks.db")
-        
-    except sqlite3.Error as e:
+        if dialect == 'sqlite':
+            print()
+            print("💡 Tip: Your data will persist across server restarts.")
+            print("   To backup your database, copy: backend/instance/tasks.db")
+            print("   Run ANALYZE occasionally so row estimates stay accurate.")
+        if not args.exact:
+            print()
+            print("💡 Use --exact for precise counts and orphan checks.")
+
+    except Exception as e:
         print(f"❌ Database error: {e}")
-        conn.close()
         return
+    finally:
+        engine.dispose()
+
 
 if __name__ == '__main__':
     main()
-
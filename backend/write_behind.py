@@ -0,0 +1,359 @@
+"""
+Write-behind ingestion of pomodoro sessions for the long-running server.
+
+By default every POST /api/pomodoros is its own transaction, and on SQLite
+each commit waits for an fsync. With POMODORO_WRITE_BEHIND=1 sessions go into
+a bounded in-process buffer instead. A background thread writes them in one
+transaction per batch, every WRITE_BEHIND_FLUSH_MS or WRITE_BEHIND_BATCH_SIZE
+sessions, whichever comes first. The task counters and activity counters are
+updated once per task and per day within the batch.
+
+Durability (WRITE_BEHIND_DURABILITY):
+    journal   Each session is appended to a local journal before the request
+              returns 202. After a crash the journal is replayed from the
+              checkpoint that commits with every batch, so nothing is lost or
+              written twice. The journal is not fsynced: a process crash
+              loses nothing, a power loss can lose the last sessions.
+    flush     The request waits until its batch has committed and returns 201
+              with the id (group commit). Nothing is acknowledged early.
+
+Sessions accepted but not committed yet are returned by pending(); the read
+endpoints merge them, so stats, task counters and activity include a session
+as soon as it is accepted. When WRITE_BEHIND_MAX_PENDING sessions are
+waiting, submit() raises BufferFull and the app answers 503.
+
+Each process claims its own journal (`pomodoro_journal.<slot>.log`, locked
+with flock). A crashed process's journal is replayed by the next process to
+claim its slot.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, select
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
+
+import activity
+import sync
+import task_counters
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ('journal', 'flush')
+MAX_JOURNALS = 64
+JOURNAL_TRUNCATE_BYTES = 1 << 20
+FLUSH_WAIT_SECONDS = 30
+CLOSE_RETRIES = 3
+MAX_RETRIES = 10  # about 20 seconds of backoff
+
+checkpoint_metadata = MetaData()
+checkpoint_table = Table(
+    'ingest_checkpoint', checkpoint_metadata,
+    Column('name', String(80), primary_key=True),
+    Column('seq', Integer, nullable=False),
+)
+
+
+class BufferFull(Exception):
+    """Too many sessions are waiting to be written"""
+
+
+def session_dict(event):
+    """The shape PomodoroSession.to_dict() returns; id is None until the session is written"""
+    return {
+        'id': event.get('id'),
+        'task_id': event['task_id'],
+        'duration': event['duration'],
+        'type': event['type'],
+        'completed_at': event['completed_at'].isoformat(),
+    }
+
+
+def pending_totals(events):
+    """{task_id: [work sessions, minutes]} of buffered sessions"""
+    totals = defaultdict(lambda: [0, 0])
+    for event in events:
+        if event['type'] == 'work' and event['task_id'] is not None:
+            totals[event['task_id']][0] += 1
+            totals[event['task_id']][1] += event['duration'] or 0
+    return totals
+
+
+def pending_days(events):
+    """Days with a buffered work session, once per session (as activity counts them)"""
+    return [event['completed_at'].date() for event in events if event['type'] == 'work']
+
+
+class PomodoroBuffer:
+    def __init__(self, engine, session_table, task_table, activity_table, user_table, flush_ms=50, batch_size=500,
+                 max_pending=10000, durability='journal', journal_dir=None, on_flushed=None):
+        if durability not in DURABILITY_MODES:
+            raise ValueError('durability must be one of: ' + ', '.join(DURABILITY_MODES))
+        if durability == 'journal' and not journal_dir:
+            raise ValueError('journal durability needs a journal_dir')
+        self.engine = engine
+        self.session_table = session_table
+        self.task_table = task_table
+        self.activity_table = activity_table
+        self.user_table = user_table
+        self.flush_ms = flush_ms
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.durability = durability
+        self.journal_dir = journal_dir
+        self.on_flushed = on_flushed
+        self.stats = Counter()
+        self._cond = threading.Condition()
+        self._queue = deque()  # accepted, not yet taken by the flusher
+        self._pending = {}     # user_id -> {seq: event} until committed
+        self._count = 0
+        self._seq = 0
+        self._thread = None
+        self._closing = False
+        self._journal = None
+        self._checkpoint_name = None
+
+    # Lifecycle: started by the first submit() or pending(), i.e. in the process
+    # that serves requests (after a fork, never before)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is not None:
+                return
+            if self.durability == 'journal':
+                checkpoint_table.create(self.engine, checkfirst=True)
+                self._open_journal()
+            self._thread = threading.Thread(target=self._run, name='pomodoro-write-behind', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _open_journal(self):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        for slot in range(MAX_JOURNALS):
+            path = os.path.join(self.journal_dir, f'pomodoro_journal.{slot}.log')
+            handle = open(path, 'a+b')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                continue
+            self._journal = handle
+            self._checkpoint_name = f'pomodoro_journal.{slot}'
+            self._replay()
+            return
+        raise RuntimeError(f'All {MAX_JOURNALS} pomodoro journals are in use')
+
+    def _replay(self):
+        """Queue the journaled sessions a previous process accepted but never committed"""
+        with self.engine.connect() as conn:
+            checkpoint = conn.execute(
+                select(checkpoint_table.c.seq).where(checkpoint_table.c.name == self._checkpoint_name)
+            ).scalar() or 0
+        self._seq = checkpoint
+        self._journal.seek(0)
+        line = b'\n'
+        for line in self._journal:
+            try:
+                event = json.loads(line)
+                event['completed_at'] = datetime.fromisoformat(event['completed_at'])
+            except ValueError:
+                logger.warning('Skipping a torn line in %s', self._journal.name)
+                continue
+            self._seq = max(self._seq, event['seq'])
+            if event['seq'] > checkpoint:
+                self._enqueue(event)
+                self.stats['replayed'] += 1
+        if not line.endswith(b'\n'):
+            self._journal.write(b'\n')  # so the next session does not extend the torn line
+            self._journal.flush()
+        if self.stats['replayed']:
+            logger.info('Replaying %d pomodoro sessions from %s', self.stats['replayed'], self._journal.name)
+        elif self._journal.tell():
+            self._journal.truncate(0)
+            self._journal.seek(0)
+
+    def close(self):
+        """Write everything still buffered and stop the flusher"""
+        with self._cond:
+            if self._thread is None or self._closing:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        if self._journal:
+            self._journal.close()
+
+    # Producers and readers
+
+    def _enqueue(self, event):
+        self._queue.append(event)
+        self._pending.setdefault(event['user_id'], {})[event['seq']] = event
+        self._count += 1
+        if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+            self._cond.notify_all()
+
+    def submit(self, user_id, task_id, duration, session_type):
+        """Accept one session; in flush mode, return only once it is committed"""
+        self._ensure_started()
+        with self._cond:
+            if self._count >= self.max_pending or self._closing:
+                self.stats['rejected'] += 1
+                raise BufferFull()
+            self._seq += 1
+            event = {'seq': self._seq, 'user_id': user_id, 'task_id': task_id, 'duration': duration,
+                     'type': session_type, 'completed_at': datetime.utcnow()}
+            if self._journal:
+                line = dict(event, completed_at=event['completed_at'].isoformat())
+                self._journal.write(json.dumps(line).encode() + b'\n')
+                self._journal.flush()
+            self._enqueue(event)
+            self.stats['accepted'] += 1
+            if self.durability == 'flush':
+                committed = self._cond.wait_for(lambda: 'id' in event or 'error' in event, FLUSH_WAIT_SECONDS)
+                if not committed:
+                    raise RuntimeError('Timed out waiting for the pomodoro to be written')
+                if 'error' in event:
+                    raise RuntimeError(event['error'])
+        return event
+
+    def pending(self, user_id):
+        """The user's accepted sessions that are not committed yet"""
+        self._ensure_started()
+        with self._cond:
+            return list(self._pending.get(user_id, {}).values())
+
+    def status(self):
+        with self._cond:
+            return dict(self.stats, pending=self._count, queued=len(self._queue), durability=self.durability)
+
+    # Flusher
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closing)
+                # Let the batch fill up for at most flush_ms
+                self._cond.wait_for(lambda: len(self._queue) >= self.batch_size or self._closing,
+                                    self.flush_ms / 1000)
+                if not self._queue:
+                    return
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.batch_size))]
+            self._write(batch)
+
+    def _write(self, batch):
+        delay, attempt = 0.1, 0
+        while True:
+            attempt += 1
+            try:
+                ids = self._commit(batch)
+            except (IntegrityError, DataError) as error:
+                # Some session is invalid (e.g. its task was deleted): write the rest one by one
+                if len(batch) > 1:
+                    for event in batch:
+                        self._write([event])
+                    return
+                logger.error('Dropping pomodoro session %s: %s', batch[0], error)
+                self.stats['dropped'] += 1
+                self._done(batch, error=str(error.orig))
+                return
+            except SQLAlchemyError as error:
+                # Database locked or unreachable: keep the batch and try again
+                self.stats['retries'] += 1
+                if self._closing and attempt >= CLOSE_RETRIES:
+                    logger.error('Giving up on %d buffered pomodoro sessions at shutdown: %s', len(batch), error)
+                    return
+                if attempt >= MAX_RETRIES:
+                    # Not a passing lock (e.g. a broken schema): drop the batch rather than
+                    # stall every batch behind it until the buffer is full
+                    for event in batch:
+                        logger.error('Dropping pomodoro session %s after %d attempts: %s', event, attempt, error)
+                    self.stats['dropped'] += len(batch)
+                    self._done(batch, error=str(getattr(error, 'orig', None) or error))
+                    return
+                logger.warning('Writing %d pomodoro sessions failed, retrying: %s', len(batch), error)
+                time.sleep(delay)
+                delay = min(delay * 2, 5)
+            else:
+                self._done(batch, ids=ids)
+                return
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        t = self.task_table
+        task_ids = {event['task_id'] for event in batch if event['task_id'] is not None}
+        with self.engine.begin() as conn:
+            # A task deleted since its session was accepted may have been purged, or be purged
+            # after its sessions were: its sessions are kept without the task
+            live = set(conn.execute(
+                select(t.c.id, t.c.user_id).where(t.c.id.in_(task_ids), t.c.deleted_at.is_(None))
+            ).tuples()) if task_ids else set()
+            rows = []
+            tasks = defaultdict(lambda: [0, 0])
+            days = Counter()
+            for event in batch:
+                task_id = event['task_id'] if (event['task_id'], event['user_id']) in live else None
+                rows.append({'user_id': event['user_id'], 'task_id': task_id, 'duration': event['duration'],
+                             'type': event['type'], 'completed_at': event['completed_at']})
+                if event['type'] == 'work':
+                    if task_id is not None:
+                        tasks[event['user_id'], task_id][0] += 1
+                        tasks[event['user_id'], task_id][1] += event['duration'] or 0
+                    days[event['user_id'], event['completed_at'].date()] += 1
+
+            # One change number per user and batch (see sync.py), taken in id order
+            change_seqs = {user_id: sync.next_seq(conn, self.user_table, user_id)
+                           for user_id in sorted({row['user_id'] for row in rows})}
+            for row in rows:
+                row['change_seq'] = change_seqs[row['user_id']]
+            ids = conn.execute(
+                self.session_table.insert().returning(self.session_table.c.id, sort_by_parameter_order=True), rows
+            ).scalars().all()
+            for (user_id, task_id), (count, minutes) in tasks.items():
+                task_counters.apply_totals(conn, self.task_table, user_id, task_id, count, minutes,
+                                           change_seqs[user_id])
+            for (user_id, day), count in days.items():
+                activity.record(conn, self.activity_table, user_id, day, count)
+            if self._checkpoint_name:
+                seq = batch[-1]['seq']
+                updated = conn.execute(checkpoint_table.update().where(
+                    checkpoint_table.c.name == self._checkpoint_name
+                ).values(seq=seq)).rowcount
+                if not updated:
+                    conn.execute(checkpoint_table.insert().values(name=self._checkpoint_name, seq=seq))
+        self.stats['batches'] += 1
+        self.stats['flush_ms_total'] += round((time.perf_counter() - started) * 1000)
+        return ids
+
+    def _done(self, batch, ids=None, error=None):
+        with self._cond:
+            for i, event in enumerate(batch):
+                if ids is not None:
+                    event['id'] = ids[i]
+                else:
+                    event['error'] = error
+                user_events = self._pending.get(event['user_id'])
+                if user_events is not None:
+                    user_events.pop(event['seq'], None)
+                    if not user_events:
+                        del self._pending[event['user_id']]
+                self._count -= 1
+            if ids is not None:
+                self.stats['written'] += len(batch)
+            # Everything journaled is committed: start the journal over
+            if self._journal and not self._count and self._journal.tell() > JOURNAL_TRUNCATE_BYTES:
+                self._journal.truncate(0)
+                self._journal.seek(0)
+            self._cond.notify_all()
+        if self.on_flushed and ids is not None:
+            try:
+                self.on_flushed(batch)
+            except Exception:
+                logger.exception('on_flushed callback failed')
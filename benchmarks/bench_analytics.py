@@ -0,0 +1,72 @@
+"""
+Range analytics latency on a seeded year of history.
+
+Seeds one user with --tasks-per-day tasks and --pomodoros-per-day sessions for
+--days days, then times GET /api/analytics with day/week/month buckets over the
+whole range next to the legacy today/week/7-day response.
+
+    python benchmarks/bench_analytics.py --days 365
+    python benchmarks/bench_analytics.py --kind backend --database-url postgresql://localhost/scratch
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import auth_headers, load_app, measure, report  # noqa: E402
+
+
+def seed_history(module, user_id, days, tasks_per_day, pomodoros_per_day):
+    rng = random.Random(42)
+    today = date.today()
+    task_rows, session_rows = [], []
+    for offset in range(days):
+        day = today - timedelta(days=offset)
+        for _ in range(tasks_per_day):
+            task_rows.append({
+                'title': 'seeded', 'description': '', 'priority': rng.randint(1, 5),
+                'completed': rng.random() < 0.6, 'due_date': day,
+                'created_at': datetime.combine(day, datetime.min.time()),
+                'user_id': user_id, 'is_recurring': False,
+            })
+        for _ in range(pomodoros_per_day):
+            session_rows.append({
+                'user_id': user_id, 'duration': 25, 'type': 'work',
+                'completed_at': datetime.combine(day, datetime.min.time()) + timedelta(minutes=rng.randint(0, 1439)),
+            })
+    with module.app.app_context():
+        module.db.session.execute(module.Task.__table__.insert(), task_rows)
+        module.db.session.execute(module.PomodoroSession.__table__.insert(), session_rows)
+        module.db.session.commit()
+    return len(task_rows), len(session_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Range analytics benchmark')
+    parser.add_argument('--kind', choices=['api', 'backend'], default='api')
+    parser.add_argument('--database-url')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--tasks-per-day', type=int, default=10)
+    parser.add_argument('--pomodoros-per-day', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=100)
+    args = parser.parse_args()
+
+    module = load_app(args.kind, args.database_url)
+    client = module.app.test_client()
+    headers = auth_headers(client)
+    with module.app.app_context():
+        user_id = module.User.query.filter_by(username='bench').first().id
+    tasks, sessions = seed_history(module, user_id, args.days, args.tasks_per_day, args.pomodoros_per_day)
+    print(f"Seeded {tasks:,} tasks and {sessions:,} pomodoro sessions over {args.days} days")
+
+    start = (date.today() - timedelta(days=args.days - 1)).isoformat()
+    report('legacy /api/analytics', measure(lambda: client.get('/api/analytics', headers=headers), args.iterations))
+    for bucket in ('day', 'week', 'month'):
+        url = f'/api/analytics?from={start}&bucket={bucket}'
+        report(f'{args.days}d by {bucket}', measure(lambda: client.get(url, headers=headers), args.iterations))
+
+
+if __name__ == '__main__':
+    main()
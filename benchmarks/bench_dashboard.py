@@ -0,0 +1,78 @@
+"""
+Dashboard first paint: the four requests the dashboard used to send on load
+(tasks, analytics, pomodoro stats, recurring templates) against one
+GET /api/dashboard, and a revalidation of it with If-None-Match.
+
+Counts the statements each sends; --latency-ms adds that much delay to every
+round trip, like a database across the network.
+
+    python benchmarks/bench_dashboard.py --latency-ms 0 2
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import auth_headers, load_app, measure, report  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dashboard bootstrap benchmark')
+    parser.add_argument('--kind', choices=['api', 'backend'], default='backend')
+    parser.add_argument('--database-url')
+    parser.add_argument('--latency-ms', type=float, nargs='+', default=[0, 2])
+    parser.add_argument('--tasks', type=int, default=50, help='Tasks per day over the last week')
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    module = load_app(args.kind, args.database_url)
+    client = module.app.test_client()
+    headers = auth_headers(client)
+    today = datetime.date.today()
+    for days_ago in range(7):
+        for i in range(args.tasks):
+            client.post('/api/tasks', json={'title': f'bench {i}', 'priority': i % 5 + 1,
+                                            'due_date': (today - datetime.timedelta(days=days_ago)).isoformat()},
+                        headers=headers)
+    for _ in range(3):
+        client.post('/api/tasks', json={'title': 'daily', 'is_recurring': True, 'recurrence_type': 'daily'},
+                    headers=headers)
+    for _ in range(8):
+        client.post('/api/pomodoros', json={'duration': 25}, headers=headers)
+    etag = client.get('/api/dashboard', headers=headers).headers['ETag']
+
+    delay = 0
+    round_trips = []
+
+    def round_trip(*_):
+        round_trips.append(1)
+        if delay:
+            time.sleep(delay)
+
+    with module.app.app_context():
+        event.listen(module.db.engine, 'before_cursor_execute', round_trip)
+
+    def separate():
+        for path in ('/api/tasks', '/api/analytics', '/api/pomodoros/stats', '/api/recurring-tasks'):
+            assert client.get(path, headers=headers).status_code == 200
+
+    requests = {
+        'four endpoints': separate,
+        'dashboard': lambda: client.get('/api/dashboard', headers=headers),
+        'dashboard, 304': lambda: client.get('/api/dashboard', headers={**headers, 'If-None-Match': etag}),
+    }
+    for latency in args.latency_ms:
+        delay = latency / 1000
+        for label, request in requests.items():
+            round_trips.clear()
+            request()
+            trips = len(round_trips)
+            report(f'{label}, {latency:g}ms/trip ({trips} statements)', measure(request, args.iterations))
+
+
+if __name__ == '__main__':
+    main()
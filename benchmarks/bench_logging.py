@@ -0,0 +1,81 @@
+"""
+Latency of the pomodoro endpoints with logging off, synchronous and queued.
+
+Each mode runs in its own process (logging is configured at import time) with
+stdout redirected to a file, so log writes hit a real file descriptor.
+
+    python benchmarks/bench_logging.py --iterations 1000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+MODES = {
+    'off': {'LOG_LEVEL': 'WARNING'},
+    'sync': {'LOG_ASYNC': '0', 'LOG_INFO_RATE': '0'},
+    'queued': {'LOG_ASYNC': '1', 'LOG_INFO_RATE': '0'},
+    'queued+rate-limited': {'LOG_ASYNC': '1', 'LOG_INFO_RATE': '20', 'LOG_INFO_BURST': '50'},
+}
+
+
+def child(iterations, result_path):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from harness import auth_headers, load_app, measure
+
+    module = load_app('api')
+    client = module.app.test_client()
+    headers = auth_headers(client)
+    task = client.post('/api/tasks', json={'title': 'bench'}, headers=headers).get_json()['task']
+
+    results = {
+        'POST /api/pomodoros': measure(
+            lambda: client.post('/api/pomodoros', json={'task_id': task['id'], 'duration': 25}, headers=headers),
+            iterations),
+        'GET /api/pomodoros/stats': measure(
+            lambda: client.get('/api/pomodoros/stats', headers=headers), iterations),
+    }
+    with open(result_path, 'w') as f:
+        json.dump(results, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.iterations, args.result)
+        return
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from harness import report
+
+    baseline = {}
+    for mode, env in MODES.items():
+        with tempfile.NamedTemporaryFile('w', suffix='.log') as sink, \
+                tempfile.NamedTemporaryFile(suffix='.json') as result:
+            subprocess.run(
+                [sys.executable, __file__, '--child', mode, '--result', result.name,
+                 '--iterations', str(args.iterations)],
+                env={**os.environ, **env}, stdout=sink, stderr=subprocess.DEVNULL, check=True)
+            with open(result.name) as f:
+                results = json.load(f)
+            log_bytes = os.path.getsize(sink.name)
+
+        print(f"== logging {mode} ({log_bytes:,} bytes of logs)")
+        for route, stats in results.items():
+            report(route, stats)
+            if mode == 'off':
+                baseline[route] = stats['mean']
+            else:
+                print(f"{'':<32} delta vs off: {stats['mean'] - baseline[route]:+.3f}ms")
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Partition pruning for the week/month stats queries on PostgreSQL.
+
+Seeds a scratch database with a long pomodoro/task history, runs the stats
+queries before and after `partitioning.migrate_to_partitioned`, and reports
+latency plus which relations each plan actually scanned.
+
+Point it at a throwaway database - tables are dropped and recreated:
+
+    python benchmarks/bench_partitioning.py --database-url postgresql://localhost/pomovity_bench \\
+        --months 24 --sessions-per-day 20
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import ROOT  # noqa: E402
+
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+import partitioning  # noqa: E402
+
+QUERIES = {
+    'sessions this week': (
+        "SELECT count(*), coalesce(sum(duration), 0) FROM pomodoro_session "
+        "WHERE user_id = :user_id AND type = 'work' AND completed_at >= :week_start AND completed_at < :tomorrow"
+    ),
+    'sessions this month': (
+        "SELECT count(*), coalesce(sum(duration), 0) FROM pomodoro_session "
+        "WHERE user_id = :user_id AND type = 'work' AND completed_at >= :month_start AND completed_at < :tomorrow"
+    ),
+    'tasks this week': (
+        "SELECT count(*), count(*) FILTER (WHERE completed) FROM task "
+        "WHERE user_id = :user_id AND due_date >= :week_start AND due_date <= :today"
+    ),
+}
+
+
+def seed(engine, months, sessions_per_day, users):
+    with engine.begin() as conn:
+        for table in ('pomodoro_session_unpartitioned', 'task_unpartitioned', 'pomodoro_session', 'task', '"user"'):
+            conn.execute(text(f'DROP TABLE IF EXISTS {table} CASCADE'))
+    os.environ['DATABASE_URL'] = str(engine.url.render_as_string(hide_password=False))
+    os.environ.setdefault('DATABASE_SSLMODE', 'prefer')
+    import index
+    with index.app.app_context():
+        index.db.create_all()
+
+    today = date.today()
+    start = today - timedelta(days=months * 30)
+    rng = random.Random(7)
+    with engine.begin() as conn:
+        conn.execute(text('INSERT INTO "user" (username, email, password) SELECT \'u\' || g, \'u\' || g || \'@x\', \'x\' '
+                          'FROM generate_series(1, :n) g'), {'n': users})
+        day = start
+        task_rows, session_rows = [], []
+        while day <= today:
+            for user_id in range(1, users + 1):
+                task_rows.append({'title': 't', 'priority': rng.randint(1, 5), 'completed': rng.random() < 0.6,
+                                  'due_date': day, 'created_at': datetime.combine(day, datetime.min.time()),
+                                  'user_id': user_id})
+                for _ in range(sessions_per_day // users or 1):
+                    session_rows.append({'user_id': user_id, 'duration': 25, 'type': 'work',
+                                         'completed_at': datetime.combine(day, datetime.min.time())
+                                         + timedelta(minutes=rng.randint(0, 1439))})
+            day += timedelta(days=1)
+        conn.execute(text('INSERT INTO task (title, priority, completed, due_date, created_at, user_id, is_recurring) '
+                          'VALUES (:title, :priority, :completed, :due_date, :created_at, :user_id, false)'), task_rows)
+        conn.execute(text('INSERT INTO pomodoro_session (user_id, duration, type, completed_at) '
+                          'VALUES (:user_id, :duration, :type, :completed_at)'), session_rows)
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_pomodoro_session_user_id_completed_at '
+                          'ON pomodoro_session (user_id, completed_at)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_task_user_id_due_date ON task (user_id, due_date)'))
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level='AUTOCOMMIT').execute(text('ANALYZE'))
+    return len(task_rows), len(session_rows)
+
+
+def scanned_relations(plan):
+    found = set()
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if 'Relation Name' in node:
+            found.add(node['Relation Name'])
+        stack.extend(node.get('Plans', []))
+    return sorted(found)
+
+
+def run_queries(engine, iterations):
+    today = date.today()
+    params = {
+        'user_id': 1,
+        'today': today,
+        'tomorrow': datetime.combine(today + timedelta(days=1), datetime.min.time()),
+        'week_start': datetime.combine(today - timedelta(days=today.weekday()), datetime.min.time()),
+        'month_start': datetime.combine(today.replace(day=1), datetime.min.time()),
+    }
+    with engine.connect() as conn:
+        for label, sql in QUERIES.items():
+            plan = conn.execute(text('EXPLAIN (FORMAT JSON) ' + sql), params).scalar()
+            plan = plan if isinstance(plan, list) else json.loads(plan)
+            relations = scanned_relations(plan[0]['Plan'])
+            started = time.perf_counter()
+            for _ in range(iterations):
+                conn.execute(text(sql), params).all()
+            elapsed = (time.perf_counter() - started) / iterations * 1000
+            print(f"  {label:<22} {elapsed:8.3f}ms  scans {len(relations)} relation(s): {', '.join(relations)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Partition pruning benchmark (PostgreSQL only)')
+    parser.add_argument('--database-url', required=True, help='Scratch PostgreSQL database')
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--sessions-per-day', type=int, default=20)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    if not partitioning.is_postgres(engine):
+        print('This benchmark needs PostgreSQL; SQLite deployments are not partitioned.')
+        return 1
+
+    tasks, sessions = seed(engine, args.months, args.sessions_per_day, args.users)
+    print(f"Seeded {tasks:,} tasks and {sessions:,} pomodoro sessions over {args.months} months")
+
+    print("== unpartitioned")
+    run_queries(engine, args.iterations)
+
+    for table in ('pomodoro_session', 'task'):
+        partitioning.migrate_to_partitioned(engine, table, months_ahead=3, drop_old=True)
+    print("== partitioned by month")
+    run_queries(engine, args.iterations)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,83 @@
+"""
+Day planner latency with thousands of open tasks.
+
+Seeds --tasks open tasks for the benchmark user, due today or up to a month
+overdue, then times POST /api/schedule/plan three ways: a cold plan (cache
+dropped: load the tasks, rank them, fill the slots), a repeated request served
+from the cached plan, and a toggle followed by a replan - which updates the
+cached plan in place instead of starting over. The planner alone, without
+HTTP and database, is timed as well.
+
+    python benchmarks/bench_planner.py --tasks 5000
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import auth_headers, load_app, measure, report  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Day planner benchmark')
+    parser.add_argument('--kind', choices=['api', 'backend'], default='backend')
+    parser.add_argument('--database-url')
+    parser.add_argument('--tasks', type=int, default=5000)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    module = load_app(args.kind, args.database_url)
+    client = module.app.test_client()
+    headers = auth_headers(client)
+    rng = random.Random(42)
+    today = date.today()
+    with module.app.app_context():
+        user_id = module.User.query.filter_by(username='bench').first().id
+        module.db.session.execute(module.Task.__table__.insert(), [{
+            'title': f'task {i}', 'description': '', 'priority': rng.randint(1, 5),
+            'due_date': today - timedelta(days=rng.randint(0, 30)), 'completed': False,
+            'user_id': user_id, 'is_recurring': False,
+        } for i in range(args.tasks)])
+        module.db.session.commit()
+        ids = [row[0] for row in module.db.session.execute(
+            module.Task.__table__.select().with_only_columns(module.Task.id)
+            .where(module.Task.user_id == user_id))]
+    body = {
+        'estimates': {str(task_id): rng.randint(1, 4) for task_id in rng.sample(ids, len(ids) // 4)},
+        'windows': [{'start': '08:00', 'end': '12:00'}, {'start': '13:00', 'end': '18:00'}],
+    }
+
+    def plan():
+        response = client.post('/api/schedule/plan', json=body, headers=headers)
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()
+
+    def cold():
+        module.plan_cache.invalidate(user_id)
+        plan()
+
+    first = plan()
+    print(f"{args.tasks:,} open tasks -> {first['summary']['scheduled_pomodoros']} pomodoros in "
+          f"{first['summary']['work_slots']} slots, {first['summary']['unscheduled_tasks']:,} tasks left over")
+    report('plan (cold)', measure(cold, args.iterations))
+    report('plan (cached)', measure(plan, args.iterations))
+
+    def toggle_and_replan():
+        task_id = next(slot['task_id'] for slot in plan()['slots'] if slot.get('task_id'))
+        client.post(f'/api/tasks/{task_id}/toggle', headers=headers)
+        result = plan()
+        assert result['cached']
+        client.post(f'/api/tasks/{task_id}/toggle', headers=headers)
+    report('toggle + replan (x2 toggles)', measure(toggle_and_replan, args.iterations))
+
+    day, windows, rules = module.planner.parse_plan_request(body, today)
+    with module.app.app_context():
+        tasks = module.planner.load_open_tasks(module.db.session, module.Task.__table__, user_id, day)
+    report('planner only (no db/http)', measure(
+        lambda: module.planner.DayPlan(day, windows, rules).load(tasks).render(), args.iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Rate limiting: per-request overhead, and how well it protects other users.
+
+Runs in three child processes: without the limiter, with the in-process
+memory backend and with RATE_LIMIT_BACKEND=database. Each one times
+GET /api/profile (a cheap endpoint, so the limiter's share shows), then runs
+the runaway-client scenario. One user loops on GET /api/analytics from
+--runaway-threads threads (each waiting --round-trip-ms between requests) for
+--seconds while another user's GET /api/tasks latency is measured, with the
+per-user read limit set to --reads-limit. It reports the victim's latency and
+the runaway's 200/429 counts.
+
+    python benchmarks/bench_rate_limit.py --seconds 5 --runaway-threads 4
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import auth_headers, load_app, measure, report  # noqa: E402
+
+MODES = ('off', 'memory', 'database')
+
+
+def run(mode, seconds, runaway_threads, iterations, reads_limit, round_trip):
+    """Runs in a child process, because the limiter is configured at import time"""
+    if mode != 'off':
+        os.environ.update(RATE_LIMIT_ENABLED='1', RATE_LIMIT_BACKEND=mode)
+    module = load_app('backend')
+    client = module.app.test_client()
+    runaway = auth_headers(client, 'bench')
+    victim = auth_headers(client, 'victim')
+    rng = random.Random(42)
+    with module.app.app_context():
+        user_id = module.User.query.filter_by(username='bench').first().id
+        module.db.session.execute(module.Task.__table__.insert(), [{
+            'title': f'task {i}', 'description': '', 'priority': 3, 'due_date': date.today(),
+            'completed': i % 2 == 0, 'user_id': user_id, 'is_recurring': False,
+        } for i in range(500)])
+        module.db.session.execute(module.PomodoroSession.__table__.insert(), [{
+            'user_id': user_id, 'duration': 25, 'type': 'work',
+            'completed_at': datetime.utcnow() - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+        } for _ in range(5000)])
+        module.db.session.commit()
+
+    print(f"--- {mode}")
+    report('GET /api/profile', measure(lambda: client.get('/api/profile', headers=victim), iterations))
+    if module.rate_limiter is not None:
+        # Start the scenario with full buckets and its own read limit
+        module.rate_limiter.limits['reads', 'user'] = module.rate_limit.parse_limit(reads_limit)
+        if mode == 'database':
+            with module.app.app_context(), module.db.engine.begin() as conn:
+                conn.execute(module.rate_limiter.backend.table.delete())
+        else:
+            module.rate_limiter.backend = module.rate_limit.MemoryBackend()
+
+    stop = threading.Event()
+    codes = Counter()
+
+    def hammer():
+        own = module.app.test_client()
+        while not stop.is_set():
+            codes[own.get('/api/analytics', headers=runaway).status_code] += 1
+            time.sleep(round_trip)  # a real client waits for the network between requests
+
+    pool = [threading.Thread(target=hammer) for _ in range(runaway_threads)]
+    for thread in pool:
+        thread.start()
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        assert client.get('/api/tasks', headers=victim).status_code == 200
+        samples.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.25)  # a well-behaved client, inside --reads-limit
+    stop.set()
+    for thread in pool:
+        thread.join()
+    samples.sort()
+    print(f"victim GET /api/tasks under load   p50={samples[len(samples) // 2]:.2f}ms "
+          f"p99={samples[int(len(samples) * 0.99) - 1]:.2f}ms (n={len(samples)})")
+    print(f"runaway GET /api/analytics        {dict(codes)} in {seconds}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rate limiting benchmark')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--runaway-threads', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--reads-limit', default='5/1:10', help='per-user read limit during the scenario')
+    parser.add_argument('--round-trip-ms', type=float, default=5, help='network delay between runaway requests')
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.seconds, args.runaway_threads, args.iterations, args.reads_limit,
+            args.round_trip_ms / 1000)
+        return
+    for mode in MODES:
+        subprocess.run([sys.executable, __file__, '--mode', mode, '--seconds', str(args.seconds),
+                        '--runaway-threads', str(args.runaway_threads), '--iterations', str(args.iterations),
+                        '--reads-limit', args.reads_limit, '--round-trip-ms', str(args.round_trip_ms)], check=True)
+
+
+if __name__ == '__main__':
+    main()
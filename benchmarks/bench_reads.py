@@ -0,0 +1,124 @@
+"""
+Hot reads: per-request CPU time and allocations of the task lists, loaded as
+ORM objects (how the endpoints used to read them) and through the Core fast
+path of task_reads.py (how they read them now).
+
+For each list it reports, per call:
+    cpu     process CPU time (time.process_time), so waiting on the database is not counted
+    peak    the most memory allocated at once while serializing the list (tracemalloc)
+    gc      generation-0 collections per 100 calls: how many container objects were allocated
+
+The endpoint rows are the whole request (routing, JWT, recurring generation,
+JSON encoding) after the change.
+
+    python benchmarks/bench_reads.py --tasks 500
+"""
+import argparse
+import datetime
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import auth_headers, load_app  # noqa: E402
+
+
+def profile(fn, iterations):
+    """(CPU ms per call, peak KiB of one call, gen-0 collections per 100 calls)"""
+    for _ in range(10):
+        fn()
+    collections = gc.get_stats()[0]['collections']
+    started = time.process_time()
+    for _ in range(iterations):
+        fn()
+    cpu = (time.process_time() - started) * 1000 / iterations
+    collections = (gc.get_stats()[0]['collections'] - collections) * 100 / iterations
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu, peak / 1024, collections
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ORM vs Core task reads')
+    parser.add_argument('--kind', choices=['api', 'backend'], default='backend')
+    parser.add_argument('--database-url')
+    parser.add_argument('--tasks', type=int, default=500, help="Tasks due today (and templates)")
+    parser.add_argument('--iterations', type=int, default=100)
+    args = parser.parse_args()
+
+    module = load_app(args.kind, args.database_url)
+    client = module.app.test_client()
+    headers = auth_headers(client)
+    for i in range(args.tasks):
+        client.post('/api/tasks', json={'title': f'bench {i}', 'description': 'benchmark task',
+                                        'priority': i % 5 + 1}, headers=headers)
+        client.post('/api/tasks', json={'title': f'weekly {i}', 'is_recurring': True, 'recurrence_type': 'weekly',
+                                        'recurrence_days': str((datetime.date.today().weekday() + 1) % 7)},
+                    headers=headers)
+
+    db, Task, task_reads, dashboard = module.db, module.Task, module.task_reads, module.dashboard
+    task_table = Task.__table__
+    today = datetime.date.today()
+    with module.app.app_context():
+        user_id = Task.query.first().user_id
+
+    def orm_today():
+        return [task.to_dict() for task in Task.query.filter(
+            Task.user_id == user_id,
+            Task.due_date == today,
+            Task.deleted_at.is_(None),
+            db.or_(Task.is_recurring == False, Task.is_recurring == None)  # noqa: E711,E712
+        ).order_by(Task.priority.desc(), Task.created_at.asc()).all()]
+
+    def orm_templates():
+        return [task.to_dict() for task in Task.query.filter_by(
+            user_id=user_id, is_recurring=True, deleted_at=None
+        ).filter(Task.recurring_parent_id.is_(None)).order_by(Task.created_at.desc()).all()]
+
+    def orm_window():
+        start, _ = dashboard.analytics_window(today)
+        return Task.query.filter(Task.user_id == user_id, Task.due_date >= start, Task.due_date <= today,
+                                 Task.deleted_at.is_(None)).order_by(Task.priority.desc(),
+                                                                      Task.created_at.asc()).all()
+
+    def core_today():
+        return [task_reads.task_dict(row) for row in task_reads.today_tasks(db.session, task_table, user_id, today)]
+
+    def core_templates():
+        return [task_reads.task_dict(row) for row in task_reads.recurring_templates(db.session, task_table, user_id)]
+
+    def core_window():
+        return dashboard.load_tasks(db.session, task_table, user_id, today)
+
+    def fresh(fn):
+        # A new session per call, like a request; ORM objects do not outlive it
+        def call():
+            result = fn()
+            db.session.remove()
+            return result
+        return call
+
+    # The templates recur tomorrow, so today's list holds exactly the plain tasks
+    assert len(client.get('/api/tasks', headers=headers).get_json()['tasks']) == args.tasks
+    print(f'{args.tasks} tasks due today, {args.tasks} recurring templates ({args.kind})')
+    with module.app.app_context():
+        assert fresh(orm_today)() == fresh(core_today)()
+        assert fresh(orm_templates)() == fresh(core_templates)()
+        for label, orm, core in (("today's tasks", orm_today, core_today),
+                                 ('recurring templates', orm_templates, core_templates),
+                                 ('analytics window', orm_window, core_window)):
+            for path, fn in (('ORM', orm), ('Core', core)):
+                cpu, peak, collections = profile(fresh(fn), args.iterations)
+                print(f'{label + ", " + path:<32} cpu={cpu:.2f}ms peak={peak:.0f}KiB gc={collections:.1f}/100')
+
+    for path in ('/api/tasks', '/api/recurring-tasks', '/api/analytics', '/api/dashboard'):
+        cpu, peak, collections = profile(lambda: client.get(path, headers=headers), args.iterations)
+        print(f'GET {path:<28} cpu={cpu:.2f}ms peak={peak:.0f}KiB gc={collections:.1f}/100')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Recurring template edits and deletes against templates with years of history.
+
+For each --years value, creates daily templates with that many years of
+generated instances behind them (each with a pomodoro session) and times
+PUT /api/recurring-tasks/<id> (propagated to the open instances due today or
+later) and DELETE /api/recurring-tasks/<id> (a soft delete; the background
+purge detaches the instances later). Both are a fixed number of set-based
+statements that only touch the template and its open instances, so neither
+should depend on the history length.
+
+    python benchmarks/bench_recurring.py --years 0 1 5 10
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import auth_headers, load_app, measure, report  # noqa: E402
+
+
+def seed_template(module, client, headers, user_id, years):
+    response = client.post('/api/tasks', json={
+        'title': 'standup', 'is_recurring': True, 'recurrence_type': 'daily'
+    }, headers=headers)
+    template_id = response.get_json()['task']['id']
+    today = date.today()
+    if not years:
+        client.get('/api/tasks', headers=headers)  # today's open instance
+        return template_id
+    with module.app.app_context():
+        tasks = module.Task.__table__
+        ids = module.db.session.execute(tasks.insert().returning(tasks.c.id, sort_by_parameter_order=True), [{
+            'title': 'standup', 'description': '', 'priority': 1, 'due_date': today - timedelta(days=day),
+            'completed': True, 'user_id': user_id, 'is_recurring': False, 'recurring_parent_id': template_id,
+        } for day in range(1, years * 365 + 1)]).scalars().all()
+        module.db.session.execute(module.PomodoroSession.__table__.insert(), [{
+            'user_id': user_id, 'task_id': task_id, 'duration': 25, 'type': 'work',
+            'completed_at': datetime.utcnow(),
+        } for task_id in ids])
+        module.db.session.commit()
+    client.get('/api/tasks', headers=headers)  # today's open instance
+    return template_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recurring template edit/delete benchmark')
+    parser.add_argument('--kind', choices=['api', 'backend'], default='backend')
+    parser.add_argument('--database-url')
+    parser.add_argument('--years', type=int, nargs='+', default=[0, 1, 5, 10])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--deletes', type=int, default=10)
+    args = parser.parse_args()
+
+    module = load_app(args.kind, args.database_url)
+    client = module.app.test_client()
+    headers = auth_headers(client)
+    with module.app.app_context():
+        user_id = module.User.query.filter_by(username='bench').first().id
+
+    for years in args.years:
+        template_id = seed_template(module, client, headers, user_id, years)
+        counter = iter(range(10 ** 9))
+
+        def edit():
+            response = client.put(f'/api/recurring-tasks/{template_id}',
+                                  json={'title': f'standup {next(counter)}'}, headers=headers)
+            assert response.status_code == 200 and response.get_json()['instances_updated'] == 1
+
+        report(f'edit, {years}y of instances', measure(edit, args.iterations))
+
+        samples = []
+        for _ in range(args.deletes):
+            started = time.perf_counter()
+            response = client.delete(f'/api/recurring-tasks/{template_id}', headers=headers)
+            samples.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.get_json()
+            template_id = seed_template(module, client, headers, user_id, years)
+        samples.sort()
+        print(f"{f'delete, {years}y of instances':<32} p50={samples[len(samples) // 2]:.3f}ms "
+              f"max={samples[-1]:.3f}ms (n={len(samples)})")
+
+
+if __name__ == '__main__':
+    main()
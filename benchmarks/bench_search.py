@@ -0,0 +1,140 @@
+"""
+Full-text search latency on a large task table.
+
+Seeds --tasks tasks spread over --users users. Titles and descriptions draw
+from a Zipf-distributed vocabulary (a few everyday words are very common, most
+are rare, like real task text). Then times GET /api/tasks/search for common,
+medium and rare terms, prefix, filtered, due-date-sorted and deep-page
+queries, next to the `LIKE '%term%'` scan it replaces.
+
+    python benchmarks/bench_search.py --tasks 1000000
+    python benchmarks/bench_search.py --tasks 200000 --database-url postgresql://localhost/scratch
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import auth_headers, load_app, measure, report  # noqa: E402
+
+COMMON_WORDS = ('report review email call plan write draft budget meeting invoice design deploy fix test '
+                'refactor groceries dentist gym read book travel taxes clean laundry garden code docs slides '
+                'interview hire onboard release migrate backup audit security payroll quarterly weekly').split()
+SYLLABLES = 'ka lo mi ne ru sa te vo zi pa do fe gu hi jo be ti ra'.split()
+
+
+def vocabulary(size, rng):
+    words = list(COMMON_WORDS)
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def seed_tasks(module, bench_user_id, tasks, users, words, batch_size=50000):
+    rng = random.Random(42)
+    today = date.today()
+    # Zipf: the word at rank r appears with weight 1/r
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    with module.app.app_context():
+        db = module.db
+        db.session.execute(module.User.__table__.insert(), [
+            {'username': f'search{i}', 'email': f'search{i}@example.com', 'password': 'x'} for i in range(users - 1)
+        ])
+        user_ids = [bench_user_id] + list(db.session.execute(
+            text("SELECT id FROM \"user\" WHERE username LIKE 'search%'")).scalars())
+        db.session.commit()
+
+        created = 0
+        while created < tasks:
+            rows = []
+            for _ in range(min(batch_size, tasks - created)):
+                due = today - timedelta(days=rng.randint(0, 3 * 365))
+                rows.append({
+                    'title': ' '.join(rng.choices(words, cum_weights=weights, k=rng.randint(2, 5))),
+                    'description': ' '.join(rng.choices(words, cum_weights=weights, k=rng.randint(0, 12))),
+                    'priority': rng.randint(1, 5), 'completed': rng.random() < 0.6,
+                    'due_date': due, 'created_at': datetime.combine(due, datetime.min.time()),
+                    'user_id': rng.choice(user_ids), 'is_recurring': False,
+                })
+            db.session.execute(module.Task.__table__.insert(), rows)
+            db.session.commit()
+            created += len(rows)
+            print(f"  {created:,} tasks", end='\r', flush=True)
+        print()
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text('ANALYZE task'))
+        else:
+            db.session.execute(text('ANALYZE'))
+        db.session.commit()
+        return db.session.execute(
+            text('SELECT COUNT(*) FROM task WHERE user_id = :u'), {'u': bench_user_id}).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full-text search benchmark')
+    parser.add_argument('--kind', choices=['api', 'backend'], default='backend')
+    parser.add_argument('--database-url')
+    parser.add_argument('--tasks', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=100)
+    args = parser.parse_args()
+
+    module = load_app(args.kind, args.database_url)
+    client = module.app.test_client()
+    headers = auth_headers(client)
+    with module.app.app_context():
+        user_id = module.User.query.filter_by(username='bench').first().id
+
+    started = time.perf_counter()
+    words = vocabulary(args.vocabulary, random.Random(7))
+    own = seed_tasks(module, user_id, args.tasks, args.users, words)
+    print(f"Seeded {args.tasks:,} tasks ({own:,} for the benchmark user) in {time.perf_counter() - started:.1f}s")
+
+    def get(url):
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()
+
+    common, medium, rare = words[0], words[300], words[5000]
+    deep_cursor = None
+    for _ in range(5):
+        deep_cursor = get(f'/api/tasks/search?q={common}&limit=20'
+                          + (f'&cursor={deep_cursor}' if deep_cursor else ''))['next_cursor']
+
+    cases = [
+        (f'search common "{common}"', f'/api/tasks/search?q={common}'),
+        (f'search medium "{medium}"', f'/api/tasks/search?q={medium}'),
+        (f'search rare "{rare}"', f'/api/tasks/search?q={rare}'),
+        ('search two words', f'/api/tasks/search?q={common}%20{medium}'),
+        (f'search prefix "{medium[:3]}"', f'/api/tasks/search?q={medium[:3]}'),
+        ('search + filters', f'/api/tasks/search?q={common}&priority=4,5&completed=false'),
+        ('search sort=recent', f'/api/tasks/search?q={common}&sort=recent'),
+        ('search page 6 (cursor)', f'/api/tasks/search?q={common}&limit=20&cursor={deep_cursor}'),
+    ]
+    for label, url in cases:
+        report(label, measure(lambda: get(url), args.iterations))
+
+    # What a LIKE-based search costs: it cannot use an index, so it scans the
+    # user's tasks until it has a page of matches (all of them for rare terms)
+    with module.app.app_context():
+        session = module.db.session
+        like = text("SELECT id FROM task WHERE user_id = :u AND (title LIKE :p OR description LIKE :p) "
+                    "ORDER BY due_date DESC LIMIT 20")
+        for label, term in (('common', common), ('medium', medium), ('rare', rare)):
+            report(f'LIKE {label} "%{term}%"', measure(
+                lambda: session.execute(like, {'u': user_id, 'p': f'%{term}%'}).all(), max(args.iterations // 5, 5)
+            ))
+
+if __name__ == '__main__':
+    main()
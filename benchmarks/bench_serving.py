@@ -0,0 +1,138 @@
+"""
+Serving throughput: the Flask development server against gunicorn with 1..N
+worker processes (backend/gunicorn.conf.py).
+
+Each server runs as its own process on a scratch SQLite database and is
+driven over HTTP by --clients client processes, each sending GET /api/tasks
+on a keep-alive connection for --seconds. Reports requests per second and
+latency; gunicorn should scale with the worker count up to the number of
+cores, the development server stays at one core.
+
+    python benchmarks/bench_serving.py --workers 1 2 4 --clients 16 --seconds 10
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import ROOT  # noqa: E402
+
+BACKEND = os.path.join(ROOT, 'backend')
+
+
+def request(conn, method, path, body=None, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = 'Bearer ' + token
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def wait_until_up(port, process, seconds=30):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('server exited during startup')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            if request(conn, 'GET', '/api/health')[0] == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def seed(port, tasks):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    request(conn, 'POST', '/api/register', {'username': 'bench', 'email': 'bench@example.com', 'password': 'benchmark'})
+    token = json.loads(request(conn, 'POST', '/api/login', {'username': 'bench', 'password': 'benchmark'})[1])['access_token']
+    for i in range(tasks):
+        request(conn, 'POST', '/api/tasks', {'title': f'bench {i}', 'priority': i % 5 + 1}, token)
+    return token
+
+
+def client(port, token, seconds, results):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            status, _ = request(conn, 'GET', '/api/tasks', token=token)
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            status = None
+        if status == 200:
+            latencies.append((time.perf_counter() - started) * 1000)
+        else:
+            errors += 1
+    results.put((latencies, errors))
+
+
+def percentile(samples, q):
+    return samples[min(int(len(samples) * q), len(samples) - 1)] if samples else 0.0
+
+
+def run(label, command, port, env, args):
+    process = subprocess.Popen(command, cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port, process)
+        token = seed(port, args.tasks)
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client, args=(port, token, args.seconds, results))
+                   for _ in range(args.clients)]
+        for c in clients:
+            c.start()
+        latencies, errors = [], 0
+        for _ in clients:
+            client_latencies, client_errors = results.get()
+            latencies += client_latencies
+            errors += client_errors
+        for c in clients:
+            c.join()
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+    latencies.sort()
+    print(f'{label:<24} {len(latencies) / args.seconds:8.1f} req/s  p50={percentile(latencies, 0.5):.1f}ms '
+          f'p95={percentile(latencies, 0.95):.1f}ms p99={percentile(latencies, 0.99):.1f}ms errors={errors}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Development server vs gunicorn throughput')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4, help='Threads per gunicorn worker')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent client processes')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--tasks', type=int, default=20, help="Tasks in the user's list")
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+    print(f'{os.cpu_count()} CPUs, {args.clients} clients, GET /api/tasks')
+
+    def env(**extra):
+        scratch = tempfile.mkdtemp(prefix='pomovity-bench-')
+        return dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(scratch, 'bench.db'), PORT=str(args.port),
+                    GUNICORN_PIDFILE=os.path.join(scratch, 'gunicorn.pid'), **extra)
+
+    # What `python app.py` runs, minus the debugger and the reloader's watcher process
+    dev = [sys.executable, '-c', 'from app import app, db\n'
+                                 'with app.app_context(): db.create_all()\n'
+                                 f'app.run(port={args.port}, threaded=True)']
+    run('development server', dev, args.port, env(), args)
+    for workers in args.workers:
+        run(f'gunicorn, {workers} worker{"s" if workers > 1 else ""}',
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], args.port,
+            env(WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(args.threads)), args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Write throughput with user shards (backend, SHARD_COUNT).
+
+Runs POST /api/tasks from --processes writer processes (like gunicorn
+workers), each cycling through its own --users, against file SQLite
+databases in WAL mode (as gunicorn.conf.py sets them up), so every commit
+pays for its fsync. It runs once without shards (one file) and once per
+--shard-counts. Reports writes per second and latency.
+
+With one file every commit waits for the single write lock; with N shards
+only users on the same shard wait for each other. How far throughput
+scales depends on the cores and on how many commits the disk syncs in
+parallel: the processes need a core each.
+
+    python benchmarks/bench_shards.py --processes 8 --seconds 10 --shard-counts 2,4,8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import auth_headers, load_app  # noqa: E402
+
+
+def _load(scratch, shards):
+    if shards:
+        os.environ.update(SHARD_COUNT=str(shards), SHARD_DIR=os.path.join(scratch, 'shards'))
+    os.environ.setdefault('JOB_WORKERS', '0')
+    return load_app('backend', 'sqlite:///' + os.path.join(scratch, 'bench.db'))
+
+
+def setup(scratch, shards):
+    """Create the databases once, before the writers import the app"""
+    module = _load(scratch, shards)
+    with module.app.app_context():
+        for engine in module.db.engines.values():
+            with engine.connect() as conn:
+                conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+
+
+def writer(scratch, shards, index, users, start_at, seconds):
+    """One writer process: log in its users, then create tasks from `start_at` for `seconds`"""
+    module = _load(scratch, shards)
+    client = module.app.test_client()
+    headers = [auth_headers(client, f'bench-{index}-{i}') for i in range(users)]
+    time.sleep(max(start_at - time.time(), 0))
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = client.post('/api/tasks', json={'title': 'bench task', 'priority': 3},
+                               headers=headers[len(latencies) % users])
+        latencies.append((time.perf_counter() - started) * 1000)
+        errors += response.status_code != 201
+    print(json.dumps({'latencies': latencies, 'errors': errors}))
+
+
+def run(shards, processes, users, seconds):
+    scratch = tempfile.mkdtemp(prefix='pomovity-bench-')
+    base = [sys.executable, __file__, '--scratch', scratch, '--shards', str(shards)]
+    subprocess.run(base + ['--role', 'setup'], check=True)
+    start_at = time.time() + 5 + processes  # after every writer has imported the app and logged in
+    pool = [subprocess.Popen(base + ['--role', 'writer', '--index', str(i), '--users', str(users),
+                                     '--start-at', str(start_at), '--seconds', str(seconds)],
+                             stdout=subprocess.PIPE, text=True)
+            for i in range(processes)]
+    results = [json.loads(proc.communicate()[0].strip().splitlines()[-1]) for proc in pool]
+    latencies = sorted(ms for result in results for ms in result['latencies'])
+    errors = sum(result['errors'] for result in results)
+    label = f'{shards} shards' if shards else 'one file'
+    print(f"{label:<10} {len(latencies) / seconds:8.0f} writes/s  p50={latencies[len(latencies) // 2]:.2f}ms "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1]:.2f}ms  errors={errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write throughput per shard count')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--users', type=int, default=4, help='Users per writer process')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--shard-counts', default='2,4,8')
+    parser.add_argument('--role', choices=['setup', 'writer'], help=argparse.SUPPRESS)
+    parser.add_argument('--scratch', help=argparse.SUPPRESS)
+    parser.add_argument('--shards', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--index', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == 'setup':
+        setup(args.scratch, args.shards)
+        return
+    if args.role == 'writer':
+        writer(args.scratch, args.shards, args.index, args.users, args.start_at, args.seconds)
+        return
+    print(f'{args.processes} writer processes, {args.users} users each, {os.cpu_count()} CPUs')
+    for shards in [0] + [int(count) for count in args.shard_counts.split(',')]:
+        run(shards, args.processes, args.users, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Delta sync payloads: a full refetch of the history against GET /api/sync
+after a few edits.
+
+Seeds --days of tasks and pomodoro sessions, then compares the bytes and
+latency of a full snapshot (what a client without a cursor downloads) with a
+delta carrying one toggle, one edit and one delete.
+
+    python benchmarks/bench_sync.py --days 180 --tasks-per-day 8
+"""
+import argparse
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import auth_headers, load_app, measure, report  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delta sync benchmark')
+    parser.add_argument('--kind', choices=['api', 'backend'], default='backend')
+    parser.add_argument('--database-url')
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--tasks-per-day', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=100)
+    args = parser.parse_args()
+
+    module = load_app(args.kind, args.database_url)
+    client = module.app.test_client()
+    headers = auth_headers(client)
+    today = datetime.date.today()
+    ids = []
+    for days_ago in range(args.days):
+        due = (today - datetime.timedelta(days=days_ago)).isoformat()
+        for i in range(args.tasks_per_day):
+            task = client.post('/api/tasks', json={'title': f'bench {days_ago}/{i}', 'priority': i % 5 + 1,
+                                                    'due_date': due}, headers=headers).get_json()['task']
+            ids.append(task['id'])
+            client.post('/api/pomodoros', json={'task_id': task['id'], 'duration': 25}, headers=headers)
+
+    full = client.get('/api/sync?limit=5000', headers=headers)
+    cursor = full.get_json()['cursor']
+    client.post(f'/api/tasks/{ids[0]}/toggle', headers=headers)
+    client.put(f'/api/tasks/{ids[1]}', json={'title': 'renamed'}, headers=headers)
+    client.delete(f'/api/tasks/{ids[2]}', headers=headers)
+    delta = client.get(f'/api/sync?cursor={cursor}', headers=headers)
+
+    print(f'{len(ids)} tasks with a session each: full snapshot {len(full.data) / 1024:.1f} KiB, '
+          f'delta after 3 edits {len(delta.data) / 1024:.2f} KiB')
+    report('full snapshot', measure(lambda: client.get('/api/sync?limit=5000', headers=headers), args.iterations))
+    report('delta', measure(lambda: client.get(f'/api/sync?cursor={cursor}', headers=headers), args.iterations))
+
+
+if __name__ == '__main__':
+    main()
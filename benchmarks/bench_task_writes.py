@@ -0,0 +1,64 @@
+"""
+Task toggle and partial-update latency, and database round trips per request.
+
+Times POST /api/tasks/<id>/toggle and PUT /api/tasks/<id> with a one-field
+change and counts the statements and commits each one sends. --latency-ms
+adds that much delay to every round trip, like a database across the
+network (Vercel to a hosted PostgreSQL), which is where the round trips show.
+
+    python benchmarks/bench_task_writes.py --latency-ms 0 2
+"""
+import argparse
+import os
+import sys
+import time
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import auth_headers, load_app, measure, report  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Task write path benchmark')
+    parser.add_argument('--kind', choices=['api', 'backend'], default='backend')
+    parser.add_argument('--database-url')
+    parser.add_argument('--latency-ms', type=float, nargs='+', default=[0, 2])
+    parser.add_argument('--iterations', type=int, default=300)
+    args = parser.parse_args()
+
+    module = load_app(args.kind, args.database_url)
+    client = module.app.test_client()
+    headers = auth_headers(client)
+    task_id = client.post('/api/tasks', json={'title': 'bench'}, headers=headers).get_json()['task']['id']
+    client.get('/api/tasks', headers=headers)
+
+    delay = 0
+    round_trips = []
+
+    def round_trip(*_):
+        round_trips.append(1)
+        if delay:
+            time.sleep(delay)
+
+    with module.app.app_context():
+        event.listen(module.db.engine, 'before_cursor_execute', round_trip)
+        event.listen(module.db.engine, 'commit', round_trip)
+
+    counter = iter(range(10 ** 9))
+    requests = {
+        'toggle': lambda: client.post(f'/api/tasks/{task_id}/toggle', headers=headers),
+        'update title': lambda: client.put(f'/api/tasks/{task_id}', json={'title': f'bench {next(counter)}'},
+                                           headers=headers),
+    }
+    for latency in args.latency_ms:
+        delay = latency / 1000
+        for label, request in requests.items():
+            round_trips.clear()
+            assert request().status_code == 200
+            trips = len(round_trips)
+            report(f'{label}, {latency:g}ms/trip ({trips} trips)', measure(request, args.iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Pomodoro ingestion throughput: direct commits vs. write-behind batching.
+
+Runs POST /api/pomodoros from --threads concurrent clients against a file
+SQLite database (so every commit pays for its fsync). It runs three times in
+separate processes: without the buffer, with WRITE_BEHIND_DURABILITY=journal
+and with =flush. Reports sessions per second and request latency, then
+checks that every session reached the table.
+
+    python benchmarks/bench_write_behind.py --sessions 5000 --threads 8
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import auth_headers, load_app  # noqa: E402
+
+MODES = ('direct', 'journal', 'flush')
+
+
+def run(mode, sessions, threads):
+    """Runs in a child process, because the buffer is configured at import time"""
+    scratch = tempfile.mkdtemp(prefix='pomovity-bench-')
+    if mode != 'direct':
+        os.environ.update(POMODORO_WRITE_BEHIND='1', WRITE_BEHIND_DURABILITY=mode, WRITE_BEHIND_JOURNAL_DIR=scratch)
+    module = load_app('backend', 'sqlite:///' + os.path.join(scratch, 'bench.db'))
+    headers = auth_headers(module.app.test_client())
+    with module.app.app_context():
+        user_id = module.User.query.filter_by(username='bench').first().id
+        task = module.Task(title='focus', priority=1, user_id=user_id, due_date=date.today())
+        module.db.session.add(task)
+        module.db.session.commit()
+        task_id = task.id
+
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(count):
+        client = module.app.test_client()
+        samples = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.post('/api/pomodoros', json={'task_id': task_id, 'duration': 25}, headers=headers)
+            samples.append((time.perf_counter() - started) * 1000)
+            assert response.status_code in (201, 202), response.get_json()
+        with lock:
+            latencies.extend(samples)
+
+    pool = [threading.Thread(target=worker, args=(sessions // threads,)) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if module.pomodoro_buffer is not None:
+        module.pomodoro_buffer.close()
+
+    with module.app.app_context():
+        written = module.PomodoroSession.query.count()
+        counter = module.db.session.get(module.Task, task_id).work_pomodoro_count
+    latencies.sort()
+    print(f"{mode:<8} {len(latencies) / elapsed:8.0f} sessions/s  "
+          f"p50={latencies[len(latencies) // 2]:.2f}ms p99={latencies[int(len(latencies) * 0.99) - 1]:.2f}ms  "
+          f"written={written} counter={counter}")
+    assert written == counter == len(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write-behind ingestion benchmark')
+    parser.add_argument('--sessions', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.sessions, args.threads)
+        return
+    for mode in MODES:
+        subprocess.run([sys.executable, __file__, '--mode', mode, '--sessions', str(args.sessions),
+                        '--threads', str(args.threads)], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks import the real apps (api/index.py or backend/app.py) against a
+throwaway database selected through DATABASE_URL, drive them with Flask's
+test client and report latency percentiles.
+"""
+import importlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(kind='api', database_url=None):
+    """Import the api or backend app module against a scratch database"""
+    if database_url is None:
+        scratch = tempfile.mkdtemp(prefix='pomovity-bench-')
+        database_url = 'sqlite:///' + os.path.join(scratch, 'bench.db')
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, os.path.join(ROOT, 'api' if kind == 'api' else 'backend'))
+    module = importlib.import_module('index' if kind == 'api' else 'app')
+    with module.app.app_context():
+        module.db.create_all()
+    return module
+
+
+def auth_headers(client, username='bench'):
+    """Register (if needed) and log in a user, returning the Authorization header"""
+    client.post('/api/register', json={
+        'username': username, 'email': f'{username}@example.com', 'password': 'benchmark'
+    })
+    response = client.post('/api/login', json={'username': username, 'password': 'benchmark'})
+    return {'Authorization': 'Bearer ' + response.get_json()['access_token']}
+
+
+def measure(fn, iterations=500, warmup=20):
+    """Call fn repeatedly and return latency statistics in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'n': iterations,
+        'mean': statistics.fmean(samples),
+        'p50': samples[len(samples) // 2],
+        'p95': samples[int(len(samples) * 0.95) - 1],
+        'p99': samples[int(len(samples) * 0.99) - 1],
+    }
+
+
+def report(label, stats):
+    print(f"{label:<32} mean={stats['mean']:.3f}ms p50={stats['p50']:.3f}ms "
+          f"p95={stats['p95']:.3f}ms p99={stats['p99']:.3f}ms (n={stats['n']})")
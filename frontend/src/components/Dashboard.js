@@ -18,7 +18,7 @@ import {
 } from '@mui/material';
 import { Logout, Add, BarChart, ExpandMore, ExpandLess, Timer, Repeat, CheckCircle, CheckBox, Person } from '@mui/icons-material';
 import { useAuth } from '../context/AuthContext';
-import { getTasks, getAnalytics, getPomodoroStats, getRecurringTasks } from '../services/api';
+import { getTasks, getAnalytics, getPomodoroStats, getRecurringTasks, getDashboard } from '../services/api';
 import TaskList from './TaskList';
 import TaskDialog from './TaskDialog';
 import PomodoroTimer from './PomodoroTimer';
@@ -112,10 +112,24 @@ function Dashboard() {
     }
   };
 
+  const fetchDashboard = async () => {
+    try {
+      setLoading(true);
+      const response = await getDashboard();
+      setTasks(response.tasks);
+      setAnalyticsData(response.analytics);
+      setPomodoroStats(response.pomodoro_stats);
+      setRecurringTasks(response.recurring_tasks);
+      setError('');
+    } catch (err) {
+      setError('Failed to load tasks. Please try again.');
+    } finally {
+      setLoading(false);
+    }
+  };
+
   useEffect(() => {
-    fetchTasks();
-    fetchAnalytics();
-    fetchPomodoroStats();
+    fetchDashboard();
   }, []);
 
   useEffect(() => {
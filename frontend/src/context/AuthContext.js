@@ -1,5 +1,5 @@
 import React, { createContext, useState, useContext, useEffect } from 'react';
-import { hasGuestData, getGuestData, clearGuestData } from '../services/localStorage';
+import { hasGuestData, getGuestData, clearGuestData, clearSyncCache } from '../services/localStorage';
 import { createTask as createTaskAPI, createPomodoro as createPomodoroAPI } from '../services/api';
 
 const AuthContext = createContext();
@@ -104,6 +104,7 @@ export const AuthProvider = ({ children }) => {
   };
 
   const login = async (newToken, userData) => {
+    clearSyncCache();
     setToken(newToken);
     setUser(userData);
     setIsGuest(false);
@@ -118,6 +119,7 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    clearSyncCache();
     setToken(null);
     setUser(GUEST_USER);
     setIsGuest(true);
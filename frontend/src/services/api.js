@@ -128,6 +128,38 @@ export const getAnalytics = async () => {
   return response.data;
 };
 
+// Everything the dashboard shows on load, in one request. The browser
+// revalidates it with its ETag, so an unchanged dashboard costs a 304.
+export const getDashboard = async () => {
+  if (isGuestMode()) {
+    const [{ tasks }, analytics, pomodoro_stats] = await Promise.all([
+      getTasks(),
+      getAnalytics(),
+      getPomodoroStats(),
+    ]);
+    return { tasks, analytics, pomodoro_stats, recurring_tasks: [] };
+  }
+  const response = await api.get('/dashboard');
+  return response.data;
+};
+
+// Bring the local cache up to date with only what changed since its cursor
+// (tombstones remove deleted tasks and templates). Returns the cache.
+export const syncChanges = async () => {
+  if (isGuestMode()) {
+    return null;
+  }
+  let cache = localStorageService.getSyncCache();
+  let hasMore = true;
+  while (hasMore) {
+    const params = cache.cursor ? { cursor: cache.cursor } : {};
+    const response = await api.get('/sync', { params });
+    cache = localStorageService.applySyncChanges(response.data);
+    hasMore = response.data.has_more;
+  }
+  return cache;
+};
+
 export const createPomodoro = async (pomodoroData) => {
   if (isGuestMode()) {
     const pomodoro = localStorageService.createPomodoro(pomodoroData);
@@ -166,5 +198,23 @@ export const deleteRecurringTask = async (taskId) => {
   return response.data;
 };
 
+// Tasks due from `from` to `to` (YYYY-MM-DD). Recurring occurrences that were
+// never acted on come back with `virtual: true` and no id; change or skip them
+// through the occurrence calls below, which write their row.
+export const getCalendar = async (from, to) => {
+  const response = await api.get('/calendar', { params: { from, to } });
+  return response.data;
+};
+
+export const updateOccurrence = async (recurringTaskId, date, changes) => {
+  const response = await api.put(`/recurring-tasks/${recurringTaskId}/occurrences/${date}`, changes);
+  return response.data;
+};
+
+export const skipOccurrence = async (recurringTaskId, date) => {
+  const response = await api.delete(`/recurring-tasks/${recurringTaskId}/occurrences/${date}`);
+  return response.data;
+};
+
 export default api;
 
@@ -3,6 +3,7 @@
 const TASKS_KEY = 'pomovity_guest_tasks';
 const POMODOROS_KEY = 'pomovity_guest_pomodoros';
 const TASK_ID_COUNTER = 'pomovity_task_id_counter';
+const SYNC_KEY = 'pomovity_sync_cache';
 
 // Task Management
 export const saveTasks = (tasks) => {
@@ -192,6 +193,61 @@ export const clearGuestData = () => {
   }
 };
 
+// Synced cache for signed-in users, kept current by GET /api/sync
+const emptySyncCache = () => ({
+  cursor: null,
+  tasks: {},
+  recurring_tasks: {},
+  pomodoro_sessions: {},
+});
+
+export const getSyncCache = () => {
+  try {
+    const cache = localStorage.getItem(SYNC_KEY);
+    return cache ? JSON.parse(cache) : emptySyncCache();
+  } catch (error) {
+    console.error('Error reading sync cache from localStorage:', error);
+    return emptySyncCache();
+  }
+};
+
+// Merge one page of changes: upsert by id, drop tombstones (and the sessions
+// of deleted tasks), remember the new cursor
+export const applySyncChanges = (changes) => {
+  const cache = changes.reset ? emptySyncCache() : getSyncCache();
+  ['tasks', 'recurring_tasks', 'pomodoro_sessions'].forEach((collection) => {
+    changes[collection].forEach((item) => {
+      cache[collection][item.id] = item;
+    });
+  });
+  ['tasks', 'recurring_tasks'].forEach((collection) => {
+    changes.deleted[collection].forEach((id) => {
+      delete cache[collection][id];
+    });
+  });
+  const deletedTasks = new Set(changes.deleted.tasks);
+  Object.values(cache.pomodoro_sessions).forEach((session) => {
+    if (deletedTasks.has(session.task_id)) {
+      delete cache.pomodoro_sessions[session.id];
+    }
+  });
+  cache.cursor = changes.cursor;
+  try {
+    localStorage.setItem(SYNC_KEY, JSON.stringify(cache));
+  } catch (error) {
+    console.error('Error saving sync cache to localStorage:', error);
+  }
+  return cache;
+};
+
+export const clearSyncCache = () => {
+  try {
+    localStorage.removeItem(SYNC_KEY);
+  } catch (error) {
+    console.error('Error clearing sync cache:', error);
+  }
+};
+
 const localStorageService = {
   saveTasks,
   getTasks,
@@ -205,6 +261,9 @@ const localStorageService = {
   hasGuestData,
   getGuestData,
   clearGuestData,
+  getSyncCache,
+  applySyncChanges,
+  clearSyncCache,
 };
 
 export default localStorageService;